@@ -1,4 +1,11 @@
 import argparse
+import json
+import mmap
+import os
+import subprocess
+import sys
+import time
+from multiprocessing.pool import ThreadPool
 
 
 """
@@ -6,36 +13,224 @@ import argparse
 
 Chunk a build.log by file
 
-python gamepad/chunk.py <path/to/odd-order-build.log> <path/to/chunked>
+1. Copy each section into its own dump file
+    python gamepad/chunk.py <path/to/odd-order-build.log> <path/to/chunked>
+2. Only record where each section lives (no copying)
+    python gamepad/chunk.py <path/to/odd-order-build.log> --manifest
+3. Follow a build.log that is still being written (e.g., by build_oddorder.sh)
+    python gamepad/chunk.py <path/to/odd-order-build.log> --follow [--recon N]
+
+A section starts after a "COQC <file.v>" line and ends at the next COQC
+line (or the end of the log). The manifest is written to <build.log>.manifest
+and lists (v_file, byte_start, byte_end) for every section. The dump readers
+accept the address <build.log>#<file.v> and read that byte range in place.
+
+In follow mode, a section is emitted as soon as the next COQC line appears
+(or the log has been idle for --idle seconds). Emitting a section updates the
+manifest, copies the section if an output location is given, and with
+--recon N hands the section to a pool of N tactr_prep.py workers, so that
+reconstruction overlaps with the tcoq build.
 """
 
 
+BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def scan_sections(log):
+    """
+    Returns the sections of log as [(v_file, byte_start, byte_end)].
+    """
+    sections = []
+    with open(log, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return sections
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buf[:4] == b"COQC":
+            pos = 0
+        else:
+            pos = buf.find(b"\nCOQC")
+            pos = -1 if pos == -1 else pos + 1
+        while pos != -1:
+            # Header line
+            end_hdr = buf.find(b"\n", pos)
+            end_hdr = size if end_hdr == -1 else end_hdr + 1
+            toks = buf[pos:end_hdr].decode('utf-8').split(" ")
+            v_file = toks[1].strip()
+
+            # Body runs until the next header
+            nxt = buf.find(b"\nCOQC", end_hdr - 1)
+            nxt = -1 if nxt == -1 else nxt + 1
+            end = size if nxt == -1 else nxt
+            sections += [(v_file, end_hdr, end)]
+            pos = nxt
+        buf.close()
+    return sections
+
+
+def write_manifest(log, sections):
+    st = os.stat(log)
+    js = {"log": os.path.basename(log),
+          "size": st.st_size,
+          "sections": [[v_file, start, end] for v_file, start, end in sections]}
+    # Write a temporary file and rename it into place, so that readers
+    # (e.g. workers launched by --follow) never see a partial manifest
+    manifest = "{}.manifest".format(log)
+    tmp = "{}.tmp".format(manifest)
+    with open(tmp, 'w') as f:
+        json.dump(js, f, indent=1)
+    os.replace(tmp, manifest)
+
+
+def copy_range(f_in, out_file, start, end):
+    with open(out_file, 'wb') as f_out:
+        f_in.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f_in.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            f_out.write(block)
+            remaining -= len(block)
+
+
+def chunk_copy(log, out, sections):
+    with open(log, 'rb') as f:
+        for v_file, start, end in sections:
+            print("COQC", v_file)
+            copy_range(f, "{}/{}.dump".format(out, v_file), start, end)
+    print("EOF")
+
+
+class Follower(object):
+    """
+    Incrementally chunk a growing build.log.
+    """
+    def __init__(self, log, out=None, num_recon=0, recon_out=".", poll=1.0, idle=600.0):
+        # Internal state
+        self.log = log
+        self.out = out
+        self.poll = poll             # seconds between polls
+        self.idle = idle             # seconds without growth before finishing
+
+        self.scanned = 0             # start of first unscanned line
+        self.open = None             # (v_file, byte_start) of open section
+        self.sections = []           # closed sections
+
+        # Reconstruction workers
+        self.recon_out = recon_out
+        self.pool = ThreadPool(num_recon) if num_recon > 0 else None
+        self.jobs = []
+
+    def _scan(self, f, size):
+        # Only scan complete lines
+        f.seek(self.scanned)
+        buf = f.read(size - self.scanned)
+        buf = buf[:buf.rfind(b"\n") + 1]
+
+        if buf.startswith(b"COQC"):
+            pos = 0
+        else:
+            pos = buf.find(b"\nCOQC")
+            pos = -1 if pos == -1 else pos + 1
+        while pos != -1:
+            end_hdr = buf.find(b"\n", pos) + 1
+            if self.open:
+                self._emit(self.scanned + pos)
+            v_file = buf[pos:end_hdr].decode('utf-8').split(" ")[1].strip()
+            self.open = (v_file, self.scanned + end_hdr)
+            pos = buf.find(b"\nCOQC", end_hdr - 1)
+            pos = -1 if pos == -1 else pos + 1
+        self.scanned += len(buf)
+
+    def _emit(self, byte_end):
+        v_file, byte_start = self.open
+        self.open = None
+        self.sections += [(v_file, byte_start, byte_end)]
+        write_manifest(self.log, self.sections)
+        print("COQC", v_file, byte_start, byte_end)
+        sys.stdout.flush()
+
+        if self.out:
+            with open(self.log, 'rb') as f:
+                copy_range(f, "{}/{}.dump".format(self.out, v_file), byte_start, byte_end)
+        if self.pool:
+            self.jobs += [self.pool.apply_async(self._recon, (v_file,))]
+
+    def _recon(self, v_file):
+        tactr_prep = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  "gamepad", "tactr_prep.py")
+        prefix = os.path.join(self.recon_out, v_file)
+        cmd = [sys.executable, tactr_prep, "file", v_file, "-b", self.log,
+               "-log", "{}.tactr.log".format(prefix),
+               "-pkl", "{}.tactr.pickle".format(prefix)]
+        with open("{}.recon.out".format(prefix), 'w') as h_out:
+            ret = subprocess.call(cmd, stdout=h_out, stderr=subprocess.STDOUT)
+        print("RECON", v_file, "OK" if ret == 0 else "FAILED({})".format(ret))
+        sys.stdout.flush()
+        return ret
+
+    def follow(self):
+        last_size = 0
+        last_growth = time.time()
+        with open(self.log, 'rb') as f:
+            while True:
+                size = os.fstat(f.fileno()).st_size
+                if size < last_size:
+                    raise NameError("{} was truncated while following".format(self.log))
+                elif size > last_size:
+                    self._scan(f, size)
+                    last_size = size
+                    last_growth = time.time()
+                elif time.time() - last_growth > self.idle:
+                    break
+                time.sleep(self.poll)
+
+            # Close the last section
+            size = os.fstat(f.fileno()).st_size
+            if self.open:
+                self._emit(size)
+        print("EOF")
+
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+            failed = [job for job in self.jobs if job.get() != 0]
+            print("RECON DONE: {} sections, {} failed".format(len(self.jobs), len(failed)))
+
+
 if __name__ == "__main__":
     # Set up command line
     argparser = argparse.ArgumentParser()
     argparser.add_argument("log", help="Enter the log you want to chunk")
-    argparser.add_argument("out", help="Location of output")
+    argparser.add_argument("out", nargs="?", default=None, help="Location of output")
+    argparser.add_argument("-m", "--manifest", action="store_true",
+                           help="Only write <log>.manifest with the byte range of each file")
+    argparser.add_argument("--follow", action="store_true",
+                           help="Follow a build.log that is still being written")
+    argparser.add_argument("--idle", default=600.0, type=float,
+                           help="Stop following after the log is idle for this many seconds")
+    argparser.add_argument("--poll", default=1.0, type=float,
+                           help="Seconds between checking the log for growth")
+    argparser.add_argument("--recon", default=0, type=int,
+                           help="Number of tactr_prep.py workers to reconstruct emitted sections")
+    argparser.add_argument("--recon_out", default=".", type=str,
+                           help="Location of reconstruction pickles and logs")
     args = argparser.parse_args()
 
-    with open(args.log, 'r') as f:
-        out = None
-        while True:
-            line = f.readline()
-            if line == "":
-                print("EOF")
-                break
-            elif line.startswith("COQC"):
-                # close open file if open
-                if out:
-                    out.close()
-
-                # open file for writing
-                toks = line.split(" ")
-                v_file = toks[1].strip()
-                print("COQC", v_file)
-                out = open("{}/{}.dump".format(args.out, v_file), 'w')
-            elif out:
-                # write if file open for writing
-                out.write(line)
-            else:
-                pass
+    if args.follow:
+        follower = Follower(args.log, out=args.out, num_recon=args.recon,
+                            recon_out=args.recon_out, poll=args.poll, idle=args.idle)
+        follower.follow()
+        sys.exit(0)
+
+    sections = scan_sections(args.log)
+    if args.manifest:
+        write_manifest(args.log, sections)
+        for v_file, start, end in sections:
+            print("COQC", v_file, start, end)
+        print("EOF")
+    elif args.out:
+        chunk_copy(args.log, args.out, sections)
+    else:
+        argparser.error("Expected an output location or --manifest")
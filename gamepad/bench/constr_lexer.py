@@ -0,0 +1,255 @@
+# Copyright 2018 The GamePad Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import argparse
+import random
+import re
+import time
+
+from coq.constr import *
+from coq.constr_lexer import ConstrLexer
+
+
+"""
+[Note]
+
+Micro-benchmark for lexing constr_share entries.
+
+Compares the previous lexer of DecodeConstr (re.findall + strip/int per
+token, copied below as LegacyConstrLexer) against ConstrLexer on a
+synthetic table with the mix of kinds found in a dump.
+
+Run (from the gamepad directory):
+    python -m bench.constr_lexer [-n 200000] [-r 3]
+"""
+
+
+# -------------------------------------------------
+# Previous lexer (copy of DecodeConstr._parse_rawast)
+
+class LegacyConstrLexer(object):
+    def __init__(self):
+        self.names = {}
+
+    def _santize_keys(self, c_idxs):
+        c_idxs = c_idxs[1:-1]
+        return [int(idx.strip()) for idx in c_idxs.split()]
+
+    def _split_entry(self, entry):
+        toks = re.findall(r'\[[^}]*?\]|\S+', entry)
+        return toks
+
+    def lex(self, entry):
+        toks = self._split_entry(entry)
+        kind = toks[0].strip()
+        if kind == "R":
+            return ("R", int(toks[1].strip())), []
+        elif kind == "V":
+            return ("V", toks[1].strip()), []
+        elif kind == "M":
+            return ("M", int(toks[1].strip())), []
+        elif kind == "E":
+            exk = int(toks[1].strip())
+            cs_idxs = self._santize_keys(toks[2].strip())
+            return ("E", exk, cs_idxs), cs_idxs
+        elif kind == "S":
+            return ("S", toks[1].strip()), []
+        elif kind == "CA":
+            c_idx = int(toks[1].strip())
+            ck = toks[2].strip()
+            ty_idx = int(toks[3].strip())
+            return ("CA", c_idx, ck, ty_idx), [c_idx, ty_idx]
+        elif kind == "P":
+            name = self._parse_rawname(toks[1].strip())
+            ty1_idx = int(toks[2].strip())
+            ty2_idx = int(toks[3].strip())
+            return ("P", name, ty1_idx, ty2_idx), [ty1_idx, ty2_idx]
+        elif kind == "L":
+            name = self._parse_rawname(toks[1].strip())
+            ty_idx = int(toks[2].strip())
+            c_idx = int(toks[3].strip())
+            return ("L", name, ty_idx, c_idx), [ty_idx, c_idx]
+        elif kind == "LI":
+            name = self._parse_rawname(toks[1].strip())
+            c1_idx = int(toks[2].strip())
+            ty_idx = int(toks[3].strip())
+            c2_idx = int(toks[4].strip())
+            return ("LI", name, c1_idx, ty_idx, c2_idx), [c1_idx, ty_idx, c2_idx]
+        elif kind == "A":
+            c_idx = int(toks[1].strip())
+            cs_idxs = self._santize_keys(toks[2].strip())
+            return ("A", c_idx, cs_idxs), [c_idx] + cs_idxs
+        elif kind == "C":
+            const = self._parse_rawname(toks[1].strip())
+            ui = self._parse_rawuniverse_instance(toks[2].strip())
+            return ("C", const, ui), []
+        elif kind == "I":
+            mutind = self._parse_rawname(toks[1].strip())
+            pos = int(toks[2].strip())
+            ui = self._parse_rawuniverse_instance(toks[3].strip())
+            return ("I", mutind, pos, ui), []
+        elif kind == "CO":
+            mutind = self._parse_rawname(toks[1].strip())
+            pos = int(toks[2].strip())
+            conid = int(toks[3].strip())
+            ui = self._parse_rawuniverse_instance(toks[4].strip())
+            return ("CO", mutind, pos, conid, ui), []
+        elif kind == "CS":
+            idx = entry.find(']]')
+            hd = entry[2:idx]
+            tl = entry[idx+2:]
+            toks = self._split_entry(tl)
+            case_info = self._parse_rawcase_info(hd.strip())
+            c1_idx = int(toks[0].strip())
+            c2_idx = int(toks[1].strip())
+            cs_idxs = self._santize_keys(toks[2].strip())
+            return ("CS", case_info, c1_idx, c2_idx, cs_idxs), [c1_idx, c2_idx] + cs_idxs
+        elif kind == "F":
+            iarr = self._parse_rawiarr(toks[1].strip())
+            idx = int(toks[2].strip())
+            names = self._parse_rawnames(toks[3].strip())
+            ty_idxs = self._santize_keys(toks[4].strip())
+            cs_idxs = self._santize_keys(toks[5].strip())
+            return ("F", iarr, idx, names, ty_idxs, cs_idxs), ty_idxs + cs_idxs
+        elif kind == "CF":
+            idx = int(toks[2].strip())
+            names = self._parse_rawnames(toks[3].strip())
+            ty_idxs = self._santize_keys(toks[4].strip())
+            cs_idxs = self._santize_keys(toks[5].strip())
+            return ("CF", idx, names, ty_idxs, cs_idxs), ty_idxs + cs_idxs
+        elif kind == "PJ":
+            proj = self._parse_rawname(toks[1].strip())
+            c_idx = int(toks[2].strip())
+            return ("PJ", proj, c_idx), [c_idx]
+        else:
+            raise NameError("Kind {} not supported.".format(kind))
+
+    def _parse_rawname(self, name):
+        name = name.strip()
+        if name in self.names:
+            return self.names[name]
+        else:
+            name_p = Name(name)
+            self.names[name] = name_p
+            return name_p
+
+    def _parse_rawnames(self, names):
+        names = names[1:-1]
+        return [self._parse_rawname(name) for name in names.split()]
+
+    def _parse_rawuniverse_instance(self, ui):
+        ui = ui[1:-1]
+        return UniverseInstance([u.strip() for u in ui.split()])
+
+    def _parse_rawiarr(self, iarr):
+        iarr = iarr[1:-1]
+        return [int(i.strip()) for i in iarr.split()]
+
+    def _parse_rawcase_info(self, ci):
+        ci = ci[1:-1]
+        toks = self._split_entry(ci)
+        mutind = self._parse_rawname(toks[0])
+        pos = int(toks[1])
+        npar = int(toks[2].strip())
+        cstr_ndecls = self._parse_rawiarr(toks[3].strip())
+        cstr_nargs = self._parse_rawiarr(toks[4].strip())
+        return CaseInfo(Inductive(mutind, pos), npar, cstr_ndecls, cstr_nargs)
+
+
+# -------------------------------------------------
+# Synthetic table
+
+NAMES = ["Coq.Init.Datatypes.nat", "Coq.Init.Logic.eq", "mathcomp.ssreflect.ssrnat.addn",
+         "mathcomp.ssreflect.seq.size", "x", "y", "H", "n", "_"]
+
+
+def mk_entry(rnd, key):
+    def idx():
+        return rnd.randint(1, max(1, key - 1))
+
+    def idxs(n):
+        return " ".join(str(idx()) for _ in range(n))
+
+    name = rnd.choice(NAMES)
+    kind = rnd.choice(["R", "V", "S", "C", "I", "CO", "P", "L", "LI", "A", "A", "A",
+                       "CA", "E", "CS", "F", "CF", "PJ", "M"])
+    if kind in ("R", "M"):
+        return "{} {}".format(kind, rnd.randint(1, 9))
+    elif kind == "V":
+        return "V {}".format(name)
+    elif kind == "S":
+        return "S Prop"
+    elif kind == "C":
+        return "C {} [Set]".format(name)
+    elif kind == "I":
+        return "I {} 0 []".format(name)
+    elif kind == "CO":
+        return "CO {} 0 {} []".format(name, rnd.randint(1, 3))
+    elif kind in ("P", "L"):
+        return "{} {} {} {}".format(kind, name, idx(), idx())
+    elif kind == "LI":
+        return "LI {} {} {} {}".format(name, idx(), idx(), idx())
+    elif kind == "A":
+        return "A {} [{}]".format(idx(), idxs(rnd.randint(1, 5)))
+    elif kind == "CA":
+        return "CA {} VMcast {}".format(idx(), idx())
+    elif kind == "E":
+        return "E {} [{}]".format(rnd.randint(1, 9), idxs(2))
+    elif kind == "CS":
+        return "CS [{} 0 0 [0 2] [0 12]] {} {} [{} {}]".format(name, idx(), idx(), idx(), idx())
+    elif kind == "F":
+        return "F [0] 0 [f] [{}] [{}]".format(idx(), idx())
+    elif kind == "CF":
+        return "CF 0 0 [g] [{}] [{}]".format(idx(), idx())
+    else:
+        return "PJ {} {}".format(name, idx())
+
+
+def mk_table(n, seed=0):
+    rnd = random.Random(seed)
+    return [mk_entry(rnd, key) for key in range(1, n + 1)]
+
+
+# -------------------------------------------------
+# Benchmark
+
+def bench(lexer_cls, entries, reps):
+    best = None
+    for _ in range(reps):
+        lexer = lexer_cls()
+        start = time.time()
+        for entry in entries:
+            lexer.lex(entry)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    # Set up command line
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("-n", "--num_entries", default=200000, type=int,
+                           help="Number of entries in the synthetic table")
+    argparser.add_argument("-r", "--reps", default=3, type=int,
+                           help="Number of repetitions (best time is reported)")
+    args = argparser.parse_args()
+
+    entries = mk_table(args.num_entries)
+    t_old = bench(LegacyConstrLexer, entries, args.reps)
+    t_new = bench(ConstrLexer, entries, args.reps)
+    print("entries: {}".format(len(entries)))
+    print("legacy:  {:.3f}s ({:.0f} entries/s)".format(t_old, len(entries) / t_old))
+    print("lexer:   {:.3f}s ({:.0f} entries/s)".format(t_new, len(entries) / t_new))
+    print("speedup: {:.2f}x".format(t_old / t_new))
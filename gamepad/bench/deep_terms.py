@@ -0,0 +1,324 @@
+# Copyright 2018 The GamePad Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import argparse
+import time
+
+from coq.constr import *
+from coq.constr_util import AlphaConstr, ChkConstr, PreOrder, SizeConstr, TokenConstr
+from coq.glob_constr_parser import GlobConstrDecoder
+from coq.tactics_util import FvsTactic
+from lib.myenv import MyEnv
+from lib.mysexpr import sexpr_symbol
+from lib.mytramp import trampoline
+
+
+"""
+[Note]
+
+Stress test for the traversals of coq/ on synthetic terms that are very
+deep (100k levels by default), far beyond sys.getrecursionlimit().
+
+1. kernel     nested ProdExps with shared leaves, checked with ChkConstr,
+              SizeConstr (exact and shared), TokenConstr, PreOrder and
+              AlphaConstr
+2. mid-level  nested GLambda/GApp entries, decoded with GlobConstrDecoder
+3. tactics    a Then chain of atomic tactics, and a nested glob_constr,
+              for FvsTactic
+4. trampoline exceptions raised at the bottom of a deep recursion, caught
+              (or not) by a caller
+5. alpha      AlphaConstr on small terms, against the recursive version
+              (terms with binders fail in both, see stress_alpha)
+
+Each traversal is checked against the expected result and timed.
+
+Run (from the gamepad directory):
+    python -m bench.deep_terms [-d 100000]
+"""
+
+
+def timed(name, f, expect):
+    start = time.time()
+    res = f()
+    elapsed = time.time() - start
+    if res != expect:
+        raise NameError("{}: expected {}, got {}".format(name, expect, res))
+    print("{:<24} {:.2f}s".format(name, elapsed))
+
+
+# -------------------------------------------------
+# Kernel terms
+
+def mk_kern(depth):
+    """
+    depth nested ProdExps; level i is Prod(Cast(v, v), below) where v is a
+    VarExp (even levels) or a ConstExp (odd levels), shared by all levels.
+    """
+    decoded = {}
+
+    def mkcon(c):
+        c.tag = len(decoded)
+        decoded[c.tag] = c
+        return c
+
+    c = mkcon(VarExp("y"))
+    leaves = [mkcon(VarExp("x")), mkcon(ConstExp(Name("c"), UniverseInstance([])))]
+    for i in range(depth):
+        v = leaves[i % 2]
+        cast = mkcon(CastExp(v, "DEFAULT", v))
+        c = mkcon(ProdExp(Name("x"), cast, c))
+    return decoded, c
+
+
+def stress_kern(depth):
+    decoded, root = mk_kern(depth)
+    timed("ChkConstr", lambda: ChkConstr(decoded).chk_decoded(), None)
+    # Prod + Cast + 2 occurrences of v per level
+    timed("SizeConstr", lambda: SizeConstr(decoded).size(root), 4 * depth + 1)
+    # With f_shared, each v counts twice (then 0), as do the other nodes once
+    timed("SizeConstr (shared)",
+          lambda: SizeConstr(decoded, f_shared=True).size(root), 2 * depth + 5)
+    timed("TokenConstr", lambda: len(TokenConstr(decoded).tokenize()[1]), 1)
+    timed("PreOrder", lambda: len(PreOrder().traverse(root)), 4 * depth + 1)
+    # NOTE: only checks that it completes, see stress_alpha for the results
+    timed("AlphaConstr",
+          lambda: isinstance(AlphaConstr(decoded).alpha(MyEnv({}, []), root), Exp), True)
+
+
+# -------------------------------------------------
+# Mid-level terms
+
+def mk_mid(depth):
+    """depth nested entries, alternating GLambda and GApp (GVar at the bottom)"""
+    sym = sexpr_symbol
+    mid_share = {0: (sym("V"), sym("x"))}
+    for key in range(1, depth + 1):
+        if key % 2 == 0:
+            mid_share[key] = (sym("L"), sym("x"), sym("Explicit"), 0, key - 1)
+        else:
+            mid_share[key] = (sym("A"), key - 1, (0, 0), ())
+    return mid_share
+
+
+def stress_mid(depth):
+    mid_share = mk_mid(depth)
+    timed("GlobConstrDecoder",
+          lambda: len(GlobConstrDecoder(mid_share).decoded), depth + 1)
+    timed("GlobConstrDecoder (lazy)",
+          lambda: type(GlobConstrDecoder(mid_share, f_lazy=True).decoded[depth]).__name__,
+          "GLambda" if depth % 2 == 0 else "GApp")
+
+
+# -------------------------------------------------
+# Tactics
+
+def mk_glob_constr(depth):
+    """A nested glob_constr: fun x_i => (x_i y_i) ... (as an s-expression)"""
+    sym = sexpr_symbol
+    gc = (sym("V"), sym("z"))
+    for i in range(depth):
+        x = sym("x{}".format(i % 3))
+        if i % 2 == 0:
+            gc = (sym("A"), gc, ((sym("V"), sym("y{}".format(i % 4))),), ())
+        else:
+            gc = (sym("L"), x, sym("Explicit"), (sym("V"), x), gc)
+    return gc
+
+
+def mk_tac(depth):
+    """Then(..., Then(exact y_i, ...)) with depth atomic tactics"""
+    sym = sexpr_symbol
+    tac = None
+    for i in range(depth):
+        atom = (sym("Atom"), (sym("Case"), False, (None, ((sym("V"), sym("y{}".format(i % 4))),
+                                                            (sym("N"),)))))
+        tac = atom if tac is None else (sym("Then"), atom, tac)
+    return tac
+
+
+def stress_tac(depth):
+    gc = mk_glob_constr(depth)
+    fvs = {"z"} | {"y{}".format(i % 4) for i in range(0, depth, 2)}
+    timed("FvsTactic (glob_constr)", lambda: FvsTactic().fvs_glob_constr(gc), fvs)
+    tac = mk_tac(depth)
+    fvs = {"y{}".format(i % 4) for i in range(depth)}
+    timed("FvsTactic (tactic)", lambda: FvsTactic().fvs_tac(tac), fvs)
+
+
+# -------------------------------------------------
+# Trampoline
+
+def _countdown(n):
+    """Recursion of depth n that raises ValueError at the bottom"""
+    if n == 0:
+        raise ValueError(n)
+    res = yield _countdown(n - 1)
+    return res + 1
+
+
+def _handle(n):
+    try:
+        yield _countdown(n)
+    except ValueError:
+        return 1
+
+
+def _outer(n):
+    res = yield _handle(n)
+    return res + 1
+
+
+def _uncaught(n):
+    try:
+        trampoline(_countdown(n))
+    except ValueError:
+        return "ValueError"
+
+
+def stress_tramp(depth):
+    # The handled exception must not be thrown again into _outer
+    timed("trampoline (caught)", lambda: trampoline(_outer(depth)), 2)
+    timed("trampoline (uncaught)", lambda: _uncaught(depth), "ValueError")
+
+
+# -------------------------------------------------
+# Alpha-conversion against the recursive implementation
+
+class AlphaConstrRec(AlphaConstr):
+    """AlphaConstr before the trampoline (recursive), for the kinds of mk_alpha"""
+    def alpha(self, env, c):
+        if c.tag in self.alpha_ast:
+            return c
+
+        if isinstance(c, RelExp):
+            return self._alpha_cons(c)
+        elif isinstance(c, VarExp):
+            return self._alpha_cons(VarExp(self._alpha_var(env, c.x)))
+        elif isinstance(c, MetaExp):
+            return self._alpha_cons(c)
+        elif isinstance(c, EvarExp):
+            cs_p = self.alphas(env, c.cs)
+            return self._alpha_cons(EvarExp(c.exk, cs_p))
+        elif isinstance(c, SortExp):
+            return self._alpha_cons(c)
+        elif isinstance(c, CastExp):
+            c_p = self.alpha(env, c.c)
+            ty_p = self.alpha(env, c.ty)
+            return self._alpha_cons(CastExp(c_p, c.ck, ty_p))
+        elif isinstance(c, ProdExp):
+            ty1_p = self.alpha(env, c.ty1)
+            ty2_p = self.alpha(env, c.ty2)
+            return self._alpha_cons(ProdExp(self._alpha_var(env, c.name), ty1_p, ty2_p))
+        elif isinstance(c, LambdaExp):
+            name_p = self._fresh(c.name)
+            ty_p = self.alpha(env, c.ty)
+            c_p = self.alpha(env.insert(c.name, name_p), c.c)
+            return self._alpha_cons(LambdaExp(name_p, ty_p, c_p))
+        elif isinstance(c, LetInExp):
+            c1_p = self.alpha(env, c.c1)
+            ty_p = self.alpha(env, c.ty)
+            name_p = self._fresh(c.name)
+            c2_p = self.alpha(env.insert(c.name, name_p), c.c2)
+            return self._alpha_cons(LetInExp(name_p, c1_p, ty_p, c2_p))
+        elif isinstance(c, AppExp):
+            c_p = self.alpha(env, c.c)
+            cs_p = self.alphas(env, c.cs)
+            return self._alpha_cons(AppExp(c_p, cs_p))
+        elif isinstance(c, (ConstExp, IndExp, ConstructExp)):
+            return self._alpha_cons(c)
+        else:
+            raise NameError("Kind {} not supported".format(c))
+
+    def alphas(self, env, cs):
+        return [self.alpha(env, c) for c in cs]
+
+
+def mk_alpha(f_binders):
+    """
+    A small term with every kind AlphaConstrRec handles, either without
+    binders (Rel, Var, Meta, Evar, Sort, Cast, Prod, App, Const) or with
+    nested Lambda and LetIn binders.
+    """
+    decoded = {}
+
+    def mkcon(c):
+        c.tag = len(decoded)
+        decoded[c.tag] = c
+        return c
+
+    x = mkcon(VarExp("x"))
+    const = mkcon(ConstExp(Name("c"), UniverseInstance([])))
+    rel = mkcon(RelExp(1))
+    if f_binders:
+        body = mkcon(AppExp(const, [rel, x]))
+        let = mkcon(LetInExp(Name("y"), x, const, body))
+        return decoded, mkcon(LambdaExp(Name("x"), const, let))
+    evar = mkcon(EvarExp(0, [x, mkcon(MetaExp(0))]))
+    cast = mkcon(CastExp(evar, "DEFAULT", mkcon(SortExp("Prop"))))
+    app = mkcon(AppExp(const, [rel, cast, x]))
+    return decoded, mkcon(ProdExp(Name("x"), cast, app))
+
+
+def outcome(f):
+    """String of the result of f, or of the exception it raises"""
+    try:
+        return str(f())
+    except Exception as e:
+        return "{}: {}".format(type(e).__name__, e)
+
+
+def alpha_all(cls, decoded):
+    """
+    Alpha-convert every entry with a fresh cls. Nodes built by AlphaConstr
+    have no tag, so _alpha_cons maps them all to the first one built (this
+    predates the trampoline); the memo table is compared as well.
+    """
+    res = []
+    for key, c in decoded.items():
+        alpha = cls(decoded)
+        res.append(outcome(lambda: alpha.alpha(MyEnv({}, []), c)))
+        res.append(sorted((str(tag), str(c_p)) for tag, c_p in alpha.alpha_ast.items()))
+    return res
+
+
+def stress_alpha():
+    # Same results as the recursive implementation
+    decoded, _ = mk_alpha(False)
+    timed("AlphaConstr (recursive)",
+          lambda: alpha_all(AlphaConstr, decoded), alpha_all(AlphaConstrRec, decoded))
+
+    # NOTE: Lambda and LetIn call MyEnv.insert, which does not exist. This
+    # predates the trampoline, so check that both versions fail the same way.
+    decoded, root = mk_alpha(True)
+    expect = outcome(lambda: AlphaConstrRec(decoded).alpha(MyEnv({}, []), root))
+    if "insert" not in expect:
+        raise NameError("AlphaConstrRec on binders: expected MyEnv.insert error, got {}".format(expect))
+    timed("AlphaConstr (binders)",
+          lambda: outcome(lambda: AlphaConstr(decoded).alpha(MyEnv({}, []), root)), expect)
+    print("  binders fail in both versions (pre-existing): {}".format(expect))
+
+
+if __name__ == "__main__":
+    # Set up command line
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("-d", "--depth", type=int, default=100000,
+                           help="Depth of the synthetic terms")
+    args = argparser.parse_args()
+
+    stress_kern(args.depth)
+    stress_mid(args.depth)
+    stress_tac(args.depth)
+    stress_tramp(args.depth)
+    stress_alpha()
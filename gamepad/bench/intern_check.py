@@ -0,0 +1,79 @@
+# Copyright 2018 The GamePad Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import argparse
+import pickle
+import sys
+
+from coq.constr_intern import InternedTable
+from coq.constr_util import ChkConstr, ChkMode
+from recon.recon import Recon
+
+
+"""
+[Note]
+
+Check the decoders of a dump reconstructed with interning (tactr_prep.py -i),
+before and after a pickle round trip:
+1. every table is an InternedTable that passes ChkConstr in full mode
+   (chk_keys and chk_ast on every entry)
+2. every entry has the same digest as the entry decoded without interning
+3. structurally equal entries are the same object across all lemmas
+
+Run (from the gamepad directory):
+    python -m bench.intern_check <file.dump> [-j 4]
+"""
+
+
+def check(tactrs, expect):
+    nodes = {}    # Dict[digest, Exp], over the whole corpus
+    for tactr in tactrs:
+        decoded = tactr.decoder.decoded
+        if not isinstance(decoded, InternedTable):
+            raise NameError("Table of {} is not interned".format(tactr.name))
+        chk = ChkConstr(decoded)
+        chk.chk_mode(ChkMode.FULL)
+        for c in decoded.values():
+            chk.chk_ast(c)
+
+        digests = expect[tactr.name]
+        for key, c in decoded.items():
+            if c.digest != digests[key]:
+                raise NameError("Entry {} of {} changed when interned".format(key, tactr.name))
+            if nodes.setdefault(c.digest, c) is not c:
+                raise NameError("Entry {} of {} is not shared".format(key, tactr.name))
+    return len(nodes)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("file", help="Dump file to reconstruct")
+    argparser.add_argument("-j", "--jobs", default=1, type=int,
+                           help="Number of processes to reconstruct with.")
+    args = argparser.parse_args()
+
+    sys.setrecursionlimit(10000)
+    tactrs = Recon(f_token=False).recon_file(args.file, f_verbose=False)
+    expect = {tactr.name: {key: c.digest for key, c in tactr.decoder.materialize().items()}
+              for tactr in tactrs}
+
+    tactrs = Recon(f_token=False, f_intern=True).recon_file(args.file, f_verbose=False,
+                                                            num_workers=args.jobs)
+    num_nodes = check(tactrs, expect)
+    print("interned  {} lemmas ok ({} unique nodes)".format(len(tactrs), num_nodes))
+
+    tactrs = pickle.loads(pickle.dumps(tactrs))
+    check(tactrs, expect)
+    print("pickled   {} lemmas ok".format(len(tactrs)))
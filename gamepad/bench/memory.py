@@ -0,0 +1,126 @@
+# Copyright 2018 The GamePad Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import argparse
+import gc
+import io
+import os
+import pickle
+import resource
+import sys
+import time
+
+from coq.constr_arena import ConstrArena
+from recon.recon import Recon
+
+
+"""
+[Note]
+
+Memory footprint of tactic trees.
+
+Reconstructs the tactic trees of some dump files (or loads a tactr.pickle)
+and reports the resident set size they take, the number of kernel and
+mid-level AST nodes, and the size of their pickle. With -a, also reports
+the size of the kernel tables stored as ConstrArenas (.npz).
+
+Run (from the gamepad directory):
+    python -m bench.memory <file.dump> ... [-i] [-a] [-o tactr.pickle]
+    python -m bench.memory -p tactr.pickle [-a]
+"""
+
+
+def rss_mb():
+    # Current RSS from /proc (Linux), otherwise peak RSS
+    try:
+        with open("/proc/self/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def count_nodes(tactrs):
+    num_kern = 0
+    num_mid = 0
+    for tactr in tactrs:
+        num_kern += len(tactr.decoder.materialize())
+        num_mid += len(tactr.mid_decoder.materialize())
+    return num_kern, num_mid
+
+
+def arena_size(tactrs):
+    num_bytes = 0
+    for tactr in tactrs:
+        f = io.BytesIO()
+        ConstrArena.from_decoder(tactr.decoder).save(f)
+        num_bytes += len(f.getvalue())
+    return num_bytes
+
+
+def recon_files(files, f_intern=False):
+    recon = Recon(f_token=True, f_intern=f_intern)
+    for file in files:
+        recon.recon_file(file, f_verbose=False)
+    return recon.tactrs
+
+
+if __name__ == "__main__":
+    # Set up command line
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("files", nargs="*", help="Dump files to reconstruct")
+    argparser.add_argument("-p", "--pickle", type=str,
+                           help="Load tactic trees from a pickle instead")
+    argparser.add_argument("-i", "--intern", action="store_true",
+                           help="Share kernel expressions across lemmas (see Recon)")
+    argparser.add_argument("-a", "--arena", action="store_true",
+                           help="Report the size of the kernel tables as ConstrArenas")
+    argparser.add_argument("-o", "--out", type=str,
+                           help="Save the reconstructed tactic trees to a pickle")
+    args = argparser.parse_args()
+    sys.setrecursionlimit(10000)
+
+    gc.collect()
+    rss_before = rss_mb()
+    start = time.time()
+    if args.pickle:
+        with open(args.pickle, 'rb') as f:
+            tactrs = pickle.load(f)
+    elif args.files:
+        tactrs = recon_files(args.files, args.intern)
+    else:
+        argparser.error("Expected dump files or --pickle")
+    elapsed = time.time() - start
+    num_kern, num_mid = count_nodes(tactrs)
+    gc.collect()
+    rss_after = rss_mb()
+
+    s_tactrs = pickle.dumps(tactrs)
+    if args.out:
+        with open(args.out, 'wb') as f:
+            f.write(s_tactrs)
+
+    print("tactrs:      {}".format(len(tactrs)))
+    print("kern nodes:  {}".format(num_kern))
+    print("mid nodes:   {}".format(num_mid))
+    print("time:        {:.2f}s".format(elapsed))
+    print("rss:         {:.1f} MB ({:.1f} MB before)".format(rss_after - rss_before, rss_before))
+    print("pickle:      {:.2f} MB".format(len(s_tactrs) / 1e6))
+    if args.arena:
+        print("arena npz:   {:.2f} MB".format(arena_size(tactrs) / 1e6))
+    if args.pickle:
+        print("pickle file: {:.2f} MB".format(os.path.getsize(args.pickle) / 1e6))
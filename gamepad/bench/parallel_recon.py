@@ -0,0 +1,67 @@
+# Copyright 2018 The GamePad Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import argparse
+import json
+import sys
+
+from recon.recon import Recon
+
+
+"""
+[Note]
+
+Check that reconstructing a dump with worker processes (tactr_prep.py -j N)
+gives the same tactic trees as the serial run: the per-lemma statistics
+logged by tactr_prep.py, connectivity, and the flattened views.
+
+Run (from the gamepad directory):
+    python -m bench.parallel_recon <file.dump> [-j 4]
+"""
+
+
+def summarize(tactr):
+    """Everything tactr_prep.py logs for a lemma, plus the tree shape"""
+    flatview = [(depth, str(node), edge.eid) for depth, node, _, _, _, _, edge in tactr.flatview]
+    info = {"stats": tactr.stats(),
+            "root": str(tactr.root),
+            "flatview": flatview,
+            "success": tactr.check_success(f_debug=True)}
+    return json.dumps(info, sort_keys=True, default=str)
+
+
+def recon(file, num_workers):
+    rc = Recon(f_token=True)
+    tactrs = rc.recon_file(file, f_verbose=False, num_workers=num_workers)
+    return [(tactr.name, summarize(tactr)) for tactr in tactrs]
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("file", help="Dump file to reconstruct")
+    argparser.add_argument("-j", "--jobs", default=4, type=int,
+                           help="Number of processes for the parallel run.")
+    args = argparser.parse_args()
+
+    sys.setrecursionlimit(10000)
+    serial = recon(args.file, 1)
+    parallel = recon(args.file, args.jobs)
+    if [name for name, _ in serial] != [name for name, _ in parallel]:
+        raise NameError("Lemmas differ between the serial and the parallel run")
+    diffs = [name for (name, s1), (_, s2) in zip(serial, parallel) if s1 != s2]
+    if diffs:
+        raise NameError("{} / {} lemmas differ with -j {}: {}".format(
+                        len(diffs), len(serial), args.jobs, ", ".join(diffs)))
+    print("{} lemmas identical with -j {}".format(len(serial), args.jobs))
@@ -0,0 +1,133 @@
+# Copyright 2018 The GamePad Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import argparse
+import random
+import time
+
+import lib.sexpdata as sexpdata
+from lib.mysexpr import sexpr_loads
+from recon.tokens import *
+
+
+"""
+[Note]
+
+Micro-benchmark for reading tcoq s-expressions.
+
+Compares sexpdata.loads (with the ' -> !@# escape that the parser used to
+apply) against sexpr_loads, on the mid-level tables of a dump file if one
+is given, otherwise on synthetic mid-level terms.
+
+Run (from the gamepad directory):
+    python -m bench.sexpr [-f <file.dump>] [-n 50000] [-r 3]
+"""
+
+
+# -------------------------------------------------
+# Inputs
+
+IDENTS = ["x", "x'", "H", "H'", "n", "Coq.Init.Logic.eq", "mathcomp.ssreflect.ssrnat.addn"]
+
+
+def mk_sexpr(rnd, depth):
+    if depth == 0 or rnd.random() < 0.3:
+        kind = rnd.choice(["V", "R", "S", "H"])
+        if kind == "V":
+            return "(V {})".format(rnd.choice(IDENTS))
+        elif kind == "R":
+            return "(! (CR {}))".format(rnd.choice(IDENTS))
+        elif kind == "S":
+            return "(S (P))"
+        else:
+            return "(H {} {} {})".format(rnd.randint(1, 9), rnd.choice(["true", "false"]), "()")
+    kind = rnd.choice(["A", "L", "P"])
+    if kind == "A":
+        args = " ".join(mk_sexpr(rnd, depth - 1) for _ in range(rnd.randint(1, 3)))
+        return "(A {} ({}) ())".format(mk_sexpr(rnd, depth - 1), args)
+    else:
+        return "({} {} Explicit {} {})".format(kind, rnd.choice(IDENTS), mk_sexpr(rnd, depth - 1),
+                                               mk_sexpr(rnd, depth - 1))
+
+
+def mk_table(n, seed=0):
+    rnd = random.Random(seed)
+    return [mk_sexpr(rnd, 4) for _ in range(n)]
+
+
+def read_table(filename, n):
+    """
+    Returns (up to n) entries of the mid-level tables in a dump file.
+    """
+    entries = []
+    f_mid = False
+    with open(filename, 'r') as f:
+        for line in f:
+            if line.startswith(TOK_BEG_INC):
+                f_mid = True
+            elif line.startswith(TOK_CONSTRS) or line.startswith(TOK_END_INC):
+                f_mid = False
+            elif f_mid:
+                idx = line.find(":")
+                entries += [line[idx + 1:].strip()]
+                if len(entries) >= n:
+                    break
+    return entries
+
+
+# -------------------------------------------------
+# Benchmark
+
+def loads_sexpdata(s):
+    return sexpdata.loads(s.replace('\'', '!@#'), true="true", false="false")
+
+
+def loads_reader(s):
+    return sexpr_loads(s, true="true", false="false")
+
+
+def bench(loads, entries, reps):
+    best = None
+    for _ in range(reps):
+        start = time.time()
+        for entry in entries:
+            loads(entry)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    # Set up command line
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("-f", "--file", type=str,
+                           help="Dump file to take mid-level terms from")
+    argparser.add_argument("-n", "--num_entries", default=50000, type=int,
+                           help="Number of s-expressions")
+    argparser.add_argument("-r", "--reps", default=3, type=int,
+                           help="Number of repetitions (best time is reported)")
+    args = argparser.parse_args()
+
+    if args.file:
+        entries = read_table(args.file, args.num_entries)
+    else:
+        entries = mk_table(args.num_entries)
+    num_bytes = sum(len(entry) for entry in entries)
+    t_old = bench(loads_sexpdata, entries, args.reps)
+    t_new = bench(loads_reader, entries, args.reps)
+    print("sexprs:    {} ({} bytes)".format(len(entries), num_bytes))
+    print("sexpdata:  {:.3f}s ({:.1f} MB/s)".format(t_old, num_bytes / t_old / 1e6))
+    print("reader:    {:.3f}s ({:.1f} MB/s)".format(t_new, num_bytes / t_new / 1e6))
+    print("speedup:   {:.2f}x".format(t_old / t_new))
@@ -0,0 +1,141 @@
+# Copyright 2018 The GamePad Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import argparse
+import os
+import tempfile
+
+from recon.tacst_parser import TacStParser
+from recon.tokens import TOK_BEG_PF, TOK_END_PF
+
+
+"""
+[Note]
+
+Check TacStParser.tail_partial_lemma on a dump that is still being
+written, by splitting one lemma of a dump at every byte offset.
+
+1. split     for each offset k, tail a file holding the first k bytes, then
+             append the rest and tail again
+2. stream    append the lemma one byte at a time, tailing after each byte
+3. next      stream the lemma followed by the next one in the dump
+
+All must finish without errors and give the same lemma (declarations,
+tables, and decoded expressions) as parsing the complete lemma. In 3, the
+tail must switch to a fresh lemma at the second header, and both lemmas
+must match the ones parsed from the complete text.
+Offsets before the end of the bg(pf) line are skipped, since no lemma
+has started yet.
+
+Run (from the gamepad directory):
+    python -m bench.tail_dump <file.dump> [-l 0]
+"""
+
+
+def lemma_text(file, idx):
+    """Text of the idx-th lemma of a dump (from bg(pf) to en(pf))"""
+    with open(file) as f:
+        lines = f.readlines()
+    starts = [i for i, line in enumerate(lines) if line.startswith(TOK_BEG_PF)]
+    start = starts[idx]
+    end = start
+    while not lines[end].startswith(TOK_END_PF):
+        end += 1
+    return "".join(lines[start:end + 1])
+
+
+def summarize(lemma):
+    lemma.materialize()
+    return (lemma.name,
+            [str(decl) for decl in lemma.decls],
+            sorted(lemma.decoder.constr_share.items()),
+            sorted(lemma.mid_decoder.mid_share.items()),
+            sorted(lemma.decoder.decoded),
+            sorted(lemma.mid_decoder.decoded),
+            sorted(lemma.ctx_prtyps.items()),
+            sorted(lemma.ctx_prgls.items()))
+
+
+def write(path, text, mode="w"):
+    with open(path, mode) as f:
+        f.write(text)
+
+
+def check(path, text):
+    write(path, text)
+    expect = summarize(TacStParser(path).parse_lemma())
+    data = text.encode('utf-8')
+    first = data.index(b'\n') + 1
+
+    # 1. Split at every offset
+    for k in range(first, len(data) + 1):
+        write(path, data[:k].decode('utf-8', errors='strict'))
+        parser = TacStParser(path)
+        parser.tail_partial_lemma()
+        write(path, data[k:].decode('utf-8'), mode="a")
+        res = summarize(parser.tail_partial_lemma())
+        if res != expect:
+            raise NameError("Split at byte {} gives a different lemma".format(k))
+    print("split   {} offsets ok".format(len(data) + 1 - first))
+
+    # 2. Stream one byte at a time
+    write(path, data[:first].decode('utf-8'))
+    parser = TacStParser(path)
+    parser.tail_partial_lemma()
+    for k in range(first, len(data)):
+        write(path, data[k:k + 1].decode('utf-8'), mode="a")
+        lemma = parser.tail_partial_lemma()
+    if summarize(lemma) != expect:
+        raise NameError("Streaming gives a different lemma")
+    print("stream  {} bytes ok".format(len(data)))
+
+
+def check_next(path, text, text_p):
+    write(path, text + text_p)
+    parser = TacStParser(path)
+    expect = [summarize(parser.parse_lemma()), summarize(parser.parse_lemma())]
+    data = (text + text_p).encode('utf-8')
+    first = data.index(b'\n') + 1
+
+    # 3. Stream two lemmas, keeping each lemma the tail returns
+    write(path, data[:first].decode('utf-8'))
+    parser = TacStParser(path)
+    lemmas = [parser.tail_partial_lemma()]
+    for k in range(first, len(data)):
+        write(path, data[k:k + 1].decode('utf-8'), mode="a")
+        lemma = parser.tail_partial_lemma()
+        if lemma is not lemmas[-1]:
+            lemmas += [lemma]
+    if [summarize(lemma) for lemma in lemmas] != expect:
+        raise NameError("Streaming two lemmas gives different lemmas")
+    print("next    {} bytes ok".format(len(data)))
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("file", help="Dump file to take the lemma from")
+    argparser.add_argument("-l", "--lemma", default=0, type=int,
+                           help="Index of the lemma in the dump.")
+    args = argparser.parse_args()
+
+    text = lemma_text(args.file, args.lemma)
+    text_p = lemma_text(args.file, args.lemma + 1)
+    fd, path = tempfile.mkstemp(suffix=".dump")
+    os.close(fd)
+    try:
+        check(path, text)
+        check_next(path, text, text_p)
+    finally:
+        os.remove(path)
@@ -15,7 +15,9 @@
 
 from enum import Enum
 
+from lib.mydigest import StructDigest
 from lib.myhist import MyHist
+from lib.myutil import SlotState
 
 
 """
@@ -25,67 +27,187 @@ Python representation of Coq's Kernel AST
 
 Notes:
 1. Check hashes (but we aren't using them currently)
-2. Currently, not using hierarchical names
+2. Name, UniverseInstance, and Inductive are interned process-wide, so
+   constructing an equal value returns the existing object. Hashes are
+   computed once and equality first checks identity. Interned objects
+   pickle by value and are re-interned when loaded.
+3. Hierarchical names are off by default. When on (set_hierch_names),
+   a dotted name A.B.c is stored as Name("c", hierch=Name("B", Name("A"))),
+   so names in the same module share their prefix (a prefix trie with
+   parent pointers). Names compare, hash, and digest by their dotted path,
+   so the flat and hierarchical forms of a name are equal. Names pickle
+   as the dotted path and are rebuilt in the mode current when loaded.
 """
 
 
 # -------------------------------------------------
 # Helper-classes
 
-class Name(object):
-    def __init__(self, base, hierch=None):
-        assert isinstance(base, str)
-        assert not hierch or isinstance(hierch, Name)
-        self.base = base
-        self.hierch = hierch
+# Dict[str, Name], flat names
+_NAMES = {}
+# Dict[(str, Name), Name], names with a prefix
+_HIERCH_NAMES = {}
+_F_HIERCH = False
+
+
+def set_hierch_names(f_hierch):
+    """Store dotted names in a shared prefix trie (affects new names only)."""
+    global _F_HIERCH
+    _F_HIERCH = f_hierch
+
+
+class Name(SlotState):
+    __slots__ = ("base", "hierch", "_hash")
+
+    def __new__(cls, base=None, hierch=None):
+        if base is None:
+            # Unpickling an old (non-interned) pickle
+            return super().__new__(cls)
+        if hierch is None:
+            try:
+                return _NAMES[base]
+            except KeyError:
+                pass
+            assert isinstance(base, str)
+            if _F_HIERCH and "." in base:
+                prefix, base_p = base.rsplit(".", 1)
+                name = Name(base_p, Name(prefix))
+            else:
+                name = cls._mk(base, None)
+            _NAMES[base] = name
+            return name
+        key = (base, hierch)
+        try:
+            return _HIERCH_NAMES[key]
+        except KeyError:
+            assert isinstance(base, str)
+            assert isinstance(hierch, Name)
+            name = cls._mk(base, hierch)
+            _HIERCH_NAMES[key] = name
+            return name
+
+    @classmethod
+    def _mk(cls, base, hierch):
+        name = super().__new__(cls)
+        name.base = base
+        name.hierch = hierch     # Enclosing prefix (hierarchical names only)
+        name._hash = hash(str(name))
+        return name
+
+    def __reduce__(self):
+        # Pickle the dotted path so that loading follows the current mode
+        return (Name, (str(self),))
 
     def __eq__(self, other):
-        return isinstance(other, Name) and self.base == other.base and self.hierch == other.hierch
+        if self is other:
+            return True
+        if not isinstance(other, Name):
+            return False
+        if self.hierch is None and other.hierch is None:
+            return self.base == other.base
+        # Flat and hierarchical forms of the same path are equal
+        return str(self) == str(other)
 
     def __hash__(self):
-        return 3 * hash(self.base) + hash(self.hierch)
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash(str(self))
+            return self._hash
+
+    def _digest_values(self):
+        # Digest as the flat form so that both modes agree
+        return (str(self), None)
 
     def __str__(self):
         if self.hierch:
-            return "{}.{}".format(self.base, str(self.hierch))
+            return "{}.{}".format(str(self.hierch), self.base)
         else:
             return self.base
 
 
-class UniverseInstance(object):
-    def __init__(self, univs):
-        for univ in univs:
-            assert isinstance(univ, str)
-        self.univs = univs
+# Dict[tuple of str, UniverseInstance]
+_UNIVERSE_INSTANCES = {}
+
+
+class UniverseInstance(SlotState):
+    __slots__ = ("univs", "_hash")
+
+    def __new__(cls, univs=None):
+        if univs is None:
+            return super().__new__(cls)
+        key = tuple(univs)
+        try:
+            return _UNIVERSE_INSTANCES[key]
+        except KeyError:
+            for univ in univs:
+                assert isinstance(univ, str)
+            ui = super().__new__(cls)
+            ui.univs = univs
+            ui._hash = hash("".join(univs))
+            _UNIVERSE_INSTANCES[key] = ui
+            return ui
+
+    def __reduce__(self):
+        return (UniverseInstance, (self.univs,))
 
     def __eq__(self, other):
-        return isinstance(other, UniverseInstance) and all([u1 == u2 for u1, u2 in zip(self.univs, other.univs)])
+        return self is other or (isinstance(other, UniverseInstance) and all([u1 == u2 for u1, u2 in zip(self.univs, other.univs)]))
 
     def __hash__(self):
-        return hash("".join(self.univs))
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash("".join(self.univs))
+            return self._hash
 
     def __str__(self):
         return ",".join([univ for univ in self.univs])
 
 
-class Inductive(object):
-    def __init__(self, mutind, pos):
-        assert isinstance(mutind, Name)
-        assert isinstance(pos, int)
-        self.mutind = mutind      # Name of the inductive type
-        self.pos = pos            # Position of the inductive type
+# Dict[(Name, int), Inductive]
+_INDUCTIVES = {}
+
+
+class Inductive(SlotState):
+    __slots__ = ("mutind", "pos", "_hash")
+
+    def __new__(cls, mutind=None, pos=None):
+        if mutind is None:
+            return super().__new__(cls)
+        key = (mutind, pos)
+        try:
+            return _INDUCTIVES[key]
+        except KeyError:
+            assert isinstance(mutind, Name)
+            assert isinstance(pos, int)
+            ind = super().__new__(cls)
+            ind.mutind = mutind      # Name of the inductive type
+            ind.pos = pos            # Position of the inductive type
+            ind._hash = hash(mutind) + hash(pos)
+            _INDUCTIVES[key] = ind
+            return ind
+
+    def __reduce__(self):
+        return (Inductive, (self.mutind, self.pos))
 
     def __eq__(self, other):
-        return isinstance(other, Inductive) and self.mutind == other.mutind and self.pos == other.pos
+        return self is other or (isinstance(other, Inductive) and self.mutind == other.mutind and self.pos == other.pos)
 
     def __hash__(self):
-        return hash(self.mutind) + hash(self.pos)
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash(self.mutind) + hash(self.pos)
+            return self._hash
 
     def __str__(self):
         return "{}.{}".format(str(self.mutind), self.pos)
 
 
-class CaseInfo(object):
+class CaseInfo(SlotState):
+    __slots__ = ("ind", "npar", "cstr_ndecls", "cstr_nargs")
+
     def __init__(self, ind, npar, cstr_ndecls, cstr_nargs):
         assert isinstance(ind, Inductive)
         assert isinstance(npar, int)
@@ -121,16 +243,12 @@ class CaseInfo(object):
 # -------------------------------------------------
 # Expressions
 
-class Exp(object):
+class Exp(StructDigest):
+    __slots__ = ("tag",)
+
     def __init__(self):
         self.tag = None
 
-    def __eq__(self, other):
-        raise NotImplementedError
-
-    def __hash__(self):
-        raise NotImplementedError
-
     def _tag(self, c):
         c.tag = self.tag
         return c
@@ -159,17 +277,13 @@ class RelExp(Exp):
         fun x => x             =  fun 1
         fun x => fun => y y x  =  fun fun 1 2
     """
+    __slots__ = ("idx",)
+
     def __init__(self, idx):
         assert isinstance(idx, int) and idx >= 1
         super().__init__()
         self.idx = idx
 
-    def __eq__(self, other):
-        return isinstance(other, RelExp) and self.idx == other.idx
-
-    def __hash__(self):
-        return self.idx
-
     def __str__(self):
         return "R({})".format(self.idx)
 
@@ -192,17 +306,13 @@ class VarExp(Exp):
     Coq:
         x
     """
+    __slots__ = ("x",)
+
     def __init__(self, x):
         assert isinstance(x, str)
         super().__init__()
         self.x = x
 
-    def __eq__(self, other):
-        return isinstance(other, VarExp) and self.x == other.x
-
-    def __hash__(self):
-        return hash(self.x)
-
     def __str__(self):
         return "V({})".format(self.x)
 
@@ -225,17 +335,13 @@ class MetaExp(Exp):
     Coq:
         should not occur
     """
+    __slots__ = ("mv",)
+
     def __init__(self, mv):
         assert isinstance(mv, int)
         super().__init__()
         self.mv = mv
 
-    def __eq__(self, other):
-        return isinstance(other, MetaExp) and self.mv == other.mv
-
-    def __hash__(self):
-        return self.mv
-
     def __str__(self):
         return "M({})".format(self.mv)
 
@@ -258,6 +364,8 @@ class EvarExp(Exp):
     Coq:
         ?x1
     """
+    __slots__ = ("exk", "cs")
+
     def __init__(self, exk, cs):
         assert isinstance(exk, int)
         for c_p in cs:
@@ -266,13 +374,6 @@ class EvarExp(Exp):
         self.exk = exk
         self.cs = cs
 
-    def __eq__(self, other):
-        return (isinstance(other, EvarExp) and self.exk == other.exk and
-                all([c1 == c2 for c1, c2 in zip(self.cs, other.cs)]))
-
-    def __hash__(self):
-        return sum([hash(c) for c in self.cs])
-
     def __str__(self):
         return "E({}, {})".format(self.exk, ",".join([str(c) for c in self.cs]))
 
@@ -298,17 +399,13 @@ class SortExp(Exp):
         Prop
         Type (level is not shown)
     """
+    __slots__ = ("sort",)
+
     def __init__(self, sort):
         assert isinstance(sort, str)
         super().__init__()
         self.sort = sort
 
-    def __eq__(self, other):
-        return isinstance(other, SortExp) and self.sort == other.sort
-
-    def __hash__(self):
-        return hash(self.sort)
-
     def __str__(self):
         return "S({})".format(self.sort)
 
@@ -331,6 +428,8 @@ class CastExp(Exp):
     Coq:
         ??
     """
+    __slots__ = ("c", "ck", "ty")
+
     def __init__(self, c, ck, ty):
         assert isinstance(c, Exp)
         # TODO(deh): cast kind?
@@ -340,12 +439,6 @@ class CastExp(Exp):
         self.ck = ck
         self.ty = ty
 
-    def __eq__(self, other):
-        return isinstance(other, CastExp) and self.c == other.c and self.ck == other.ck and self.ty == other.ty
-
-    def __hash__(self):
-        return hash(self.c) + hash(self.ty)
-
     def __str__(self):
         return "CA({}, {}, {})".format(str(self.c), self.ck, str(self.ty))
 
@@ -368,6 +461,9 @@ class ProdExp(Exp):
     Coq:
         \forall x: c1. c2
     """
+    __slots__ = ("name", "ty1", "ty2")
+    _binders = ("name",)
+
     def __init__(self, name, ty1, ty2):
         assert isinstance(name, Name)
         assert isinstance(ty1, Exp)
@@ -377,13 +473,6 @@ class ProdExp(Exp):
         self.ty1 = ty1
         self.ty2 = ty2
 
-    def __eq__(self, other):
-        return (isinstance(other, ProdExp) and self.name == other.name and
-                self.ty1 == other.ty1 and self.ty2 == other.ty2)
-
-    def __hash__(self):
-        return hash(self.ty1) + hash(self.ty2)
-
     def __str__(self):
         return "P({}, {}, {})".format(self.name, str(self.ty1), str(self.ty2))
 
@@ -406,6 +495,9 @@ class LambdaExp(Exp):
     Coq:
         fun (name : ty) => c
     """
+    __slots__ = ("name", "ty", "c")
+    _binders = ("name",)
+
     def __init__(self, name, ty, c):
         assert isinstance(name, Name)
         assert isinstance(ty, Exp)
@@ -415,13 +507,6 @@ class LambdaExp(Exp):
         self.ty = ty
         self.c = c
 
-    def __eq__(self, other):
-        return (isinstance(other, LambdaExp) and self.name == other.name and
-                self.ty == other.ty and self.c == other.c)
-
-    def __hash__(self):
-        return hash(self.ty) + hash(self.c)
-
     def __str__(self):
         return "L({}, {}, {})".format(self.name, str(self.ty), str(self.c))
 
@@ -444,6 +529,9 @@ class LetInExp(Exp):
     Coq:
         let x = c1 in c2
     """
+    __slots__ = ("name", "c1", "ty", "c2")
+    _binders = ("name",)
+
     def __init__(self, name, c1, ty, c2):
         assert isinstance(name, Name)
         assert isinstance(c1, Exp)
@@ -455,13 +543,6 @@ class LetInExp(Exp):
         self.ty = ty
         self.c2 = c2
 
-    def __eq__(self, other):
-        return (isinstance(other, LetInExp) and self.name == other.name and
-                self.c1 == other.c1 and self.ty == other.ty and self.c2 == other.c2)
-
-    def __hash__(self):
-        return hash(self.c1) + hash(self.ty) + hash(self.c2)
-
     def __str__(self):
         return "LI({}, {}, {}, {})".format(self.name, str(self.c1), str(self.ty), str(self.c2))
 
@@ -484,6 +565,8 @@ class AppExp(Exp):
     Coq:
         S (S (S O))     (equal to the number 3)
     """
+    __slots__ = ("c", "cs")
+
     def __init__(self, c, cs):
         assert isinstance(c, Exp)
         for c_p in cs:
@@ -492,13 +575,6 @@ class AppExp(Exp):
         self.c = c
         self.cs = cs
 
-    def __eq__(self, other):
-        return (isinstance(other, AppExp) and self.c == other .c and
-                all([c1 == c2 for c1, c2 in zip(self.cs, other.cs)]))
-
-    def __hash__(self):
-        return hash(self.c) + sum([hash(c) for c in self.cs])
-
     def __str__(self):
         return "A({}, {})".format(str(self.c), ",".join([str(c) for c in self.cs]))
 
@@ -522,6 +598,8 @@ class ConstExp(Exp):
     Coq:
         Coq.logic.eq_refl
     """
+    __slots__ = ("const", "ui")
+
     def __init__(self, const, ui):
         assert isinstance(const, Name)  # TODO(deh): Name.Constant?
         assert isinstance(ui, UniverseInstance)
@@ -529,12 +607,6 @@ class ConstExp(Exp):
         self.const = const
         self.ui = ui
 
-    def __eq__(self, other):
-        return isinstance(other, ConstExp) and self.const == other.const and self.ui == other.ui
-
-    def __hash__(self):
-        return hash(self.const)
-
     def __str__(self):
         return "C({}, {})".format(self.const, self.ui)
 
@@ -557,6 +629,8 @@ class IndExp(Exp):
     Coq:
         Inductive nat : Set := O | S : nat -> nat.
     """
+    __slots__ = ("ind", "ui")
+
     def __init__(self, ind, ui):
         assert isinstance(ind, Inductive)
         assert isinstance(ui, UniverseInstance)
@@ -564,12 +638,6 @@ class IndExp(Exp):
         self.ind = ind   # Name of the inductive type
         self.ui = ui
 
-    def __eq__(self, other):
-        return isinstance(other, IndExp) and self.ind == other.ind and self.ui == other.ui
-
-    def __hash__(self):
-        return hash(self.ind)
-
     def __str__(self):
         return "I({}, {})".format(self.ind, self.ui)
 
@@ -593,6 +661,8 @@ class ConstructExp(Exp):
         Inductive nat : Set := O | S : nat -> nat.
         O or S are constructors
     """
+    __slots__ = ("ind", "conid", "ui")
+
     def __init__(self, ind, conid, ui):
         assert isinstance(conid, int)
         assert isinstance(ui, UniverseInstance)
@@ -601,13 +671,6 @@ class ConstructExp(Exp):
         self.conid = conid     # Constructor number (1-indexing)
         self.ui = ui
 
-    def __eq__(self, other):
-        return (isinstance(other, ConstructExp) and self.ind == other.ind and
-                self.conid == other.conid and self.ui == other.ui)
-
-    def __hash__(self):
-        return hash(self.ind) + self.conid
-
     def __str__(self):
         return "CO({}, {}, {})".format(self.ind, self.conid, self.ui)
 
@@ -633,6 +696,8 @@ class CaseExp(Exp):
         | ...
         | patn => cn
     """
+    __slots__ = ("ci", "ret", "match", "cases")
+
     def __init__(self, ci, ret, match, cases):
         assert isinstance(ci, CaseInfo)
         assert isinstance(ret, Exp)
@@ -649,13 +714,6 @@ class CaseExp(Exp):
         self.match = match    # what you match on
         self.cases = cases    # cases
 
-    def __eq__(self, other):
-        return (isinstance(other, CaseExp) and self.ci == other.ci and self.ret == other.ret and
-                self.match == other.match and all([c1 == c2 for c1, c2 in zip(self.cases, other.cases)]))
-
-    def __hash__(self):
-        return hash(self.ret) + hash(self.match) + sum([hash(c) for c in self.cases])
-
     def __str__(self):
         s_cases = ",".join([str(c) for c in self.cases])
         return "CS({}, {}, {}, {})".format(self.ci, str(self.ret), str(self.match), s_cases)
@@ -689,6 +747,9 @@ class FixExp(Exp):
 
         Fix [even, odd] [nat -> bool, nat -> bool] [c1, c2]
     """
+    __slots__ = ("iarr", "idx", "names", "tys", "cs")
+    _binders = ("names",)
+
     def __init__(self, iarr, idx, names, tys, cs):
         for i in iarr:
             assert isinstance(i, int)
@@ -721,16 +782,6 @@ class FixExp(Exp):
         self.tys = tys
         self.cs = cs
 
-    def __eq__(self, other):
-        return (isinstance(other, FixExp) and self.idx == other.idx and
-                all([i1 == i2 for i1, i2 in zip(self.iarr, other.iarr)]) and
-                all([name1 == name2 for name1, name2 in zip(self.names, other.names)]) and
-                all([ty1 == ty2 for ty1, ty2 in zip(self.tys, other.tys)]) and
-                all([c1 == c2 for c1, c2 in zip(self.cs, other.cs)]))
-
-    def __hash__(self):
-        return sum([hash(c) for c in self.cs]) + sum([hash(ty) for ty in self.tys])
-
     def __str__(self):
         s1 = ",".join([name for name in self.names])
         s2 = ",".join([str(ty) for ty in self.tys])
@@ -760,6 +811,9 @@ class CoFixExp(Exp):
     Coq:
         Same as Fix but must be productive.
     """
+    __slots__ = ("idx", "names", "tys", "cs")
+    _binders = ("names",)
+
     def __init__(self, idx, names, tys, cs):
         assert isinstance(idx, int)
         for name in names:
@@ -774,15 +828,6 @@ class CoFixExp(Exp):
         self.tys = tys
         self.cs = cs
 
-    def __eq__(self, other):
-        return (isinstance(other, CoFixExp) and self.idx == other.idx and
-                all([name1 == name2 for name1, name2 in zip(self.names, other.names)]) and
-                all([ty1 == ty2 for ty1, ty2 in zip(self.tys, other.tys)]) and
-                all([c1 == c2 for c1, c2 in zip(self.cs, other.cs)]))
-
-    def __hash__(self):
-        return sum([hash(c) for c in self.cs]) + sum([hash(ty) for ty in self.tys])
-
     def __str__(self):
         s1 = ",".join([name for name in self.names])
         s2 = ",".join([str(ty) for ty in self.tys])
@@ -811,6 +856,8 @@ class ProjExp(Exp):
     Coq:
         x.proj
     """
+    __slots__ = ("proj", "c")
+
     def __init__(self, proj, c):
         assert isinstance(proj, Name)  # TODO(deh): Name.Projection?
         assert isinstance(c, Exp)
@@ -818,12 +865,6 @@ class ProjExp(Exp):
         self.proj = proj
         self.c = c
 
-    def __eq__(self, other):
-        return isinstance(other, ProjExp) and self.proj == other.proj and self.c == other.c
-
-    def __hash__(self):
-        return hash(self.proj) + hash(self.c)
-
     def __str__(self):
         return "PJ({}, {})".format(self.proj, str(self.c))
 
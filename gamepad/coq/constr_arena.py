@@ -0,0 +1,351 @@
+# Copyright 2018 The GamePad Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import numpy as np
+
+from coq.constr import *
+
+
+"""
+[Note]
+
+Array-backed (struct-of-arrays) store of a decoded constr_share table.
+
+Nodes are numbered 0 .. n-1 so that children come before their parents.
+For node i,
+1. kinds[i]                    index of its kind in COQEXP
+2. keys[i]                     its key in the constr_share table (its tag)
+3. childs[child_ptr[i]:child_ptr[i+1]]
+                               its children (node numbers), in field order
+4. data[data_ptr[i]:data_ptr[i+1]]
+                               its payload as ints (strings are ids into
+                               the string table)
+
+Payload per kind:
+R   idx                        S   sort            CA  ck
+V   x                          M   mv              E   exk
+P/L/LI  name                   A   -               PJ  proj
+C   const u1 ... un            I   mutind pos u1 ... un
+CO  mutind pos conid u1 ... un
+CS  mutind pos npar #ndecls ndecls... nargs...     (children: ret match cases)
+F   idx #tys #iarr iarr... names...                (children: tys cs)
+CF  idx #tys names...                              (children: tys cs)
+
+Exp objects (views) are created on demand and memoized, so sharing between
+views is the same as in the decoded table. Names are stored by their string
+(the decoder only creates flat names).
+
+An arena is saved to and loaded from .npz (no pickle).
+"""
+
+
+# Kind of node -> index in COQEXP (and back)
+_KIND_IDX = {kind: i for i, kind in enumerate(COQEXP)}
+(_REL, _VAR, _META, _EVAR, _SORT, _CAST, _PROD, _LAMBDA, _LETIN, _APP,
+ _CONST, _IND, _CONSTRUCT, _CASE, _FIX, _COFIX, _PROJ) = range(len(COQEXP))
+
+
+# -------------------------------------------------
+# Building arenas
+
+class _ArenaBuilder(object):
+    def __init__(self):
+        self.kinds = []
+        self.keys = []
+        self.child_ptr = [0]
+        self.childs = []
+        self.data_ptr = [0]
+        self.data = []
+        self.strs = []
+        self.str_ids = {}     # Dict[str, int]
+        self.node_ids = {}    # Dict[id(Exp), (Exp, int)]
+
+    def sid(self, s):
+        s = str(s)
+        try:
+            return self.str_ids[s]
+        except KeyError:
+            self.str_ids[s] = len(self.strs)
+            self.strs.append(s)
+            return self.str_ids[s]
+
+    def add(self, c):
+        """Add c and the nodes below it (children first, without recursion)"""
+        node_ids = self.node_ids
+        stk = [(c, None)]
+        while stk:
+            c_p, encoded = stk.pop()
+            if id(c_p) in node_ids:
+                continue
+            if encoded is None:
+                encoded = self._encode(c_p)
+                stk.append((c_p, encoded))
+                for c_c in encoded[1]:
+                    if id(c_c) not in node_ids:
+                        stk.append((c_c, None))
+            else:
+                self._add_node(c_p, *encoded)
+        return node_ids[id(c)][1]
+
+    def _add_node(self, c, payload, children):
+        self.node_ids[id(c)] = (c, len(self.kinds))
+        self.kinds.append(_KIND_IDX[type(c).__name__])
+        self.keys.append(-1 if c.tag is None else c.tag)
+        self.childs += [self.node_ids[id(c_c)][1] for c_c in children]
+        self.child_ptr.append(len(self.childs))
+        self.data += payload
+        self.data_ptr.append(len(self.data))
+
+    def _encode(self, c):
+        """Returns payload and children of c"""
+        ty = type(c)
+        if ty is RelExp:
+            return [c.idx], []
+        elif ty is VarExp:
+            return [self.sid(c.x)], []
+        elif ty is MetaExp:
+            return [c.mv], []
+        elif ty is EvarExp:
+            return [c.exk], c.cs
+        elif ty is SortExp:
+            return [self.sid(c.sort)], []
+        elif ty is CastExp:
+            return [self.sid(c.ck)], [c.c, c.ty]
+        elif ty is ProdExp:
+            return [self.sid(c.name)], [c.ty1, c.ty2]
+        elif ty is LambdaExp:
+            return [self.sid(c.name)], [c.ty, c.c]
+        elif ty is LetInExp:
+            return [self.sid(c.name)], [c.c1, c.ty, c.c2]
+        elif ty is AppExp:
+            return [], [c.c] + c.cs
+        elif ty is ConstExp:
+            return [self.sid(c.const)] + self._univs(c.ui), []
+        elif ty is IndExp:
+            return [self.sid(c.ind.mutind), c.ind.pos] + self._univs(c.ui), []
+        elif ty is ConstructExp:
+            return [self.sid(c.ind.mutind), c.ind.pos, c.conid] + self._univs(c.ui), []
+        elif ty is CaseExp:
+            ci = c.ci
+            payload = [self.sid(ci.ind.mutind), ci.ind.pos, ci.npar, len(ci.cstr_ndecls)]
+            payload += list(ci.cstr_ndecls) + list(ci.cstr_nargs)
+            return payload, [c.ret, c.match] + c.cases
+        elif ty is FixExp:
+            payload = [c.idx, len(c.tys), len(c.iarr)] + list(c.iarr)
+            payload += [self.sid(name) for name in c.names]
+            return payload, c.tys + c.cs
+        elif ty is CoFixExp:
+            payload = [c.idx, len(c.tys)] + [self.sid(name) for name in c.names]
+            return payload, c.tys + c.cs
+        elif ty is ProjExp:
+            return [self.sid(c.proj)], [c.c]
+        else:
+            raise NameError("Kind {} not supported".format(c))
+
+    def _univs(self, ui):
+        return [self.sid(univ) for univ in ui.univs]
+
+    def build(self):
+        str_bytes = [s.encode('utf-8') for s in self.strs]
+        str_ptr = np.zeros(len(str_bytes) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in str_bytes], out=str_ptr[1:])
+        str_data = np.frombuffer(b"".join(str_bytes), dtype=np.uint8)
+        return ConstrArena(kinds=np.array(self.kinds, dtype=np.int8),
+                           keys=np.array(self.keys, dtype=np.int64),
+                           child_ptr=np.array(self.child_ptr, dtype=np.int64),
+                           childs=np.array(self.childs, dtype=np.int32),
+                           data_ptr=np.array(self.data_ptr, dtype=np.int64),
+                           data=np.array(self.data, dtype=np.int64),
+                           str_ptr=str_ptr,
+                           str_data=str_data)
+
+
+# -------------------------------------------------
+# Arenas
+
+class ConstrArena(object):
+    # Arrays that make up an arena (and its .npz file)
+    FIELDS = ("kinds", "keys", "child_ptr", "childs", "data_ptr", "data",
+              "str_ptr", "str_data")
+
+    def __init__(self, kinds, keys, child_ptr, childs, data_ptr, data,
+                 str_ptr, str_data):
+        self.kinds = kinds           # np.int8[n], index into COQEXP
+        self.keys = keys             # np.int64[n], key of node (-1 if none)
+        self.child_ptr = child_ptr   # np.int64[n + 1]
+        self.childs = childs         # np.int32[#edges]
+        self.data_ptr = data_ptr     # np.int64[n + 1]
+        self.data = data             # np.int64[#payload]
+        self.str_ptr = str_ptr       # np.int64[#strs + 1]
+        self.str_data = str_data     # np.uint8[#bytes], utf-8 strings
+
+        # Internal (built on demand)
+        self._idxs = None            # Dict[key, int]
+        self._lists = None           # Python lists of the arrays
+        self._strs = None            # List[str]
+        self._names = {}             # Dict[int, Name]
+        self._views = {}             # Dict[int, Exp]
+
+    def __len__(self):
+        return len(self.kinds)
+
+    # -------------------------------------------------
+    # Construction
+
+    @staticmethod
+    def from_exps(cs):
+        builder = _ArenaBuilder()
+        for c in cs:
+            builder.add(c)
+        return builder.build()
+
+    @staticmethod
+    def from_decoder(decoder):
+        """Arena of all the entries of a (DecodeConstr) decoder"""
+        return ConstrArena.from_exps(decoder.materialize().values())
+
+    def save(self, filename):
+        np.savez_compressed(filename, **{field: getattr(self, field) for field in self.FIELDS})
+
+    @staticmethod
+    def load(filename):
+        with np.load(filename, allow_pickle=False) as npz:
+            return ConstrArena(**{field: npz[field] for field in ConstrArena.FIELDS})
+
+    # -------------------------------------------------
+    # Structure
+
+    def index(self, key):
+        """Node number of the entry key"""
+        if self._idxs is None:
+            self._idxs = {key: idx for idx, key in enumerate(self.keys.tolist())}
+        return self._idxs[key]
+
+    def num_children(self):
+        return np.diff(self.child_ptr)
+
+    def children(self, idx):
+        return self.childs[self.child_ptr[idx]:self.child_ptr[idx + 1]]
+
+    def payload(self, idx):
+        return self.data[self.data_ptr[idx]:self.data_ptr[idx + 1]]
+
+    def strs(self):
+        if self._strs is None:
+            raw = self.str_data.tobytes()
+            ptr = self.str_ptr.tolist()
+            self._strs = [raw[ptr[i]:ptr[i + 1]].decode('utf-8') for i in range(len(ptr) - 1)]
+        return self._strs
+
+    # -------------------------------------------------
+    # Views
+
+    def __getitem__(self, key):
+        return self.view(self.index(key))
+
+    def to_dict(self):
+        """Dict[key, Exp], like the decoded table of a decoder"""
+        return {key: self.view(idx) for idx, key in enumerate(self.keys.tolist())}
+
+    def view(self, idx):
+        """Exp of node idx (created on demand, children first)"""
+        views = self._views
+        if idx in views:
+            return views[idx]
+        if self._lists is None:
+            self._lists = (self.kinds.tolist(), self.keys.tolist(),
+                           self.child_ptr.tolist(), self.childs.tolist(),
+                           self.data_ptr.tolist(), self.data.tolist())
+        _, _, child_ptr, childs, _, _ = self._lists
+
+        stk = [idx]
+        while stk:
+            idx_p = stk[-1]
+            if idx_p in views:
+                stk.pop()
+                continue
+            missing = [idx_c for idx_c in childs[child_ptr[idx_p]:child_ptr[idx_p + 1]]
+                       if idx_c not in views]
+            if missing:
+                stk += missing
+            else:
+                stk.pop()
+                views[idx_p] = self._mkview(idx_p)
+        return views[idx]
+
+    def _name(self, sid):
+        try:
+            return self._names[sid]
+        except KeyError:
+            name = Name(self.strs()[sid])
+            self._names[sid] = name
+            return name
+
+    def _mkview(self, idx):
+        kinds, keys, child_ptr, childs, data_ptr, data = self._lists
+        strs = self.strs()
+        kind = kinds[idx]
+        d = data[data_ptr[idx]:data_ptr[idx + 1]]
+        cs = [self._views[idx_c] for idx_c in childs[child_ptr[idx]:child_ptr[idx + 1]]]
+
+        if kind == _REL:
+            c = RelExp(d[0])
+        elif kind == _VAR:
+            c = VarExp(strs[d[0]])
+        elif kind == _META:
+            c = MetaExp(d[0])
+        elif kind == _EVAR:
+            c = EvarExp(d[0], cs)
+        elif kind == _SORT:
+            c = SortExp(strs[d[0]])
+        elif kind == _CAST:
+            c = CastExp(cs[0], strs[d[0]], cs[1])
+        elif kind == _PROD:
+            c = ProdExp(self._name(d[0]), cs[0], cs[1])
+        elif kind == _LAMBDA:
+            c = LambdaExp(self._name(d[0]), cs[0], cs[1])
+        elif kind == _LETIN:
+            c = LetInExp(self._name(d[0]), cs[0], cs[1], cs[2])
+        elif kind == _APP:
+            c = AppExp(cs[0], cs[1:])
+        elif kind == _CONST:
+            c = ConstExp(self._name(d[0]), self._ui(d[1:]))
+        elif kind == _IND:
+            c = IndExp(Inductive(self._name(d[0]), d[1]), self._ui(d[2:]))
+        elif kind == _CONSTRUCT:
+            c = ConstructExp(Inductive(self._name(d[0]), d[1]), d[2], self._ui(d[3:]))
+        elif kind == _CASE:
+            n = d[3]
+            ci = CaseInfo(Inductive(self._name(d[0]), d[1]), d[2], d[4:4 + n], d[4 + n:])
+            c = CaseExp(ci, cs[0], cs[1], cs[2:])
+        elif kind == _FIX:
+            ntys, niarr = d[1], d[2]
+            names = [self._name(sid) for sid in d[3 + niarr:]]
+            c = FixExp(d[3:3 + niarr], d[0], names, cs[:ntys], cs[ntys:])
+        elif kind == _COFIX:
+            ntys = d[1]
+            names = [self._name(sid) for sid in d[2:]]
+            c = CoFixExp(d[0], names, cs[:ntys], cs[ntys:])
+        elif kind == _PROJ:
+            c = ProjExp(self._name(d[0]), cs[0])
+        else:
+            raise NameError("Kind {} not supported".format(kind))
+        key = keys[idx]
+        c.tag = None if key == -1 else key
+        return c
+
+    def _ui(self, sids):
+        strs = self.strs()
+        return UniverseInstance([strs[sid] for sid in sids])
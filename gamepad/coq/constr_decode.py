@@ -13,12 +13,11 @@
 # limitations under the License.
 # ==============================================================================
 
-import networkx as nx
-import matplotlib.pyplot as plt
-import re
-
 from coq.constr import *
-from coq.constr_util import ChkConstr
+from coq.constr_intern import InternedTable
+from coq.constr_lexer import ConstrLexer
+from coq.constr_util import ChkConstr, ChkMode
+from lib.myutil import LazyDict
 
 
 """
@@ -36,232 +35,199 @@ decode(2) = ConstructExp(succ)
 decode(3) = AppExp(decode(2), [decode(1)])
 decode(4) = AppExp(decode(2), [decode(3)])
 Note that we share the ASTs.
+
+Entries are decoded in dependency order, found with an iterative depth-first
+search (so there is no recursion limit on the depth of the table).
+In lazy mode, an entry (and the entries it depends on) is lexed and decoded
+the first time it is looked up. Call materialize() to decode everything.
+Each node gets its structural digest (see lib/mydigest.py) when it is
+decoded, which is what nodes are hashed and compared by.
+
+Decoded entries are checked with ChkConstr according to chk_mode (off,
+sampled or full). In lazy mode, each batch of entries decoded by a lookup is
+checked as it is decoded, so each entry is checked once whether or
+not the table is materialized. The number of entries checked and the time
+spent are kept in num_chk and chk_time.
 """
 
 
 # -------------------------------------------------
 # Decoding low-level expressions
 
+# Colours for depth-first search
+_GREY = 1
+_BLACK = 2
+
+
 class DecodeConstr(object):
-    def __init__(self, constr_share):
+    def __init__(self, constr_share, f_lazy=False, chk_mode=ChkMode.FULL):
         # Internal state
         self.constr_share = constr_share   # Dict[int, string]
+        self.f_lazy = f_lazy               # Decode on demand?
+
+        # Validation
+        self.chk_mode = chk_mode           # How much to check (ChkMode)
+        self.num_chk = 0                   # Number of entries checked
+        self.chk_time = 0.0                # Time spent checking (seconds)
 
         # Shared representation
-        self.decoded = {}                  # Dict[int, Exp]
-        self._decode_constrs()
-        ChkConstr(self.decoded).chk_decoded()
+        if f_lazy:
+            self.decoded = LazyDict(self._decode_key)   # Dict[int, Exp]
+            self.deps = {}
+            self.rawasts = {}
+            self.names = {}
+            self._lexer = ConstrLexer(self.names)
+        else:
+            self.decoded = {}                           # Dict[int, Exp]
+            self._decode_constrs()
+            self._chk()
 
     def decode_exp_by_key(self, key):
         return self.decoded[key]
 
+    def materialize(self):
+        """
+        Decode every entry in the table (the eager behaviour).
+        """
+        # NOTE: check the table itself since older pickles lack f_lazy
+        if isinstance(self.decoded, LazyDict):
+            keys = self._post_order(self.constr_share.keys())
+            for key in keys:
+                self._decode_ast(key)
+            self._chk(keys)
+
+            # Clear state
+            self.f_lazy = False
+            self.decoded = dict(self.decoded)
+            self.deps = {}
+            self.rawasts = {}
+            self.names = {}
+            self._lexer = None
+        return self.decoded
+
+    def extend(self, constr_share):
+        """
+        Add entries appended to the table (e.g., by an incremental dump).
+        Only the new entries are decoded (on demand in lazy mode).
+        """
+        if isinstance(self.decoded, InternedTable):
+            raise NameError("Cannot extend an interned table")
+        self.constr_share.update(constr_share)
+        if isinstance(self.decoded, LazyDict):
+            return
+
+        # Initialize state
+        self.deps = {}
+        self.rawasts = {}
+        self.names = {}
+        self._lexer = ConstrLexer(self.names)
+
+        keys = self._post_order(constr_share.keys())
+        for key in keys:
+            self._decode_ast(key)
+        self._chk(keys)
+
+        # Clear state
+        self.deps = {}
+        self.rawasts = {}
+        self.names = {}
+        self._lexer = None
+
+    def _chk(self, keys=None):
+        # NOTE: pickles from before chk_mode are fully checked
+        chk_mode = getattr(self, "chk_mode", ChkMode.FULL)
+        num_chk, chk_time = ChkConstr(self.decoded).chk_mode(chk_mode, keys)
+        self.num_chk = getattr(self, "num_chk", 0) + num_chk
+        self.chk_time = getattr(self, "chk_time", 0.0) + chk_time
+
+    def _decode_key(self, key):
+        """Decode an entry and its undecoded dependencies on demand"""
+        if key not in self.constr_share:
+            raise KeyError(key)
+        keys = self._post_order([key])
+        for key_p in keys:
+            self._decode_ast(key_p)
+        self._chk(keys)
+        return self.decoded[key]
+
     def _decode_constrs(self, f_display=False):
         # Initialize state
-        self.edges = []
+        self.deps = {}
         self.rawasts = {}
         self.names = {}
+        self._lexer = ConstrLexer(self.names)
 
-        # Lex raw-ast and build dependency graph
-        g = nx.DiGraph()
+        # Lex raw-ast and build dependency lists
         for key, entry in self.constr_share.items():
-            g.add_node(key)
             self._parse_rawast(key, entry)
-        g.add_edges_from(self.edges)
         if f_display:
-            nx.drawing.nx_pylab.draw_kamada_kawai(g, with_labels=True)
-            plt.show()
-
-        # Use topological sort of dependencies to decode ast
-        cycles = list(nx.simple_cycles(g))
-        if len(cycles) > 0:
-            raise NameError("Cycles detected in shared representation", cycles)
-        keys = list(nx.algorithms.dag.topological_sort(g))
-        for key in keys:
+            self._display_deps()
+
+        # Decode in dependency order (a single linear pass over the table)
+        for key in self._post_order(self.constr_share.keys()):
             c = self._decode_ast(key)
             self._mkcon(key, c)
 
         # Clear state
-        self.edges = []
+        self.deps = {}
         self.rawasts = {}
         self.names = {}
+        self._lexer = None
+
+    def _deps_of(self, key):
+        if key not in self.rawasts:
+            self._parse_rawast(key, self.constr_share[key])
+        return self.deps.get(key, ())
+
+    def _post_order(self, roots):
+        """
+        Iterative depth-first search with three-colour cycle detection.
+        Returns the undecoded entries reachable from roots, dependencies first,
+        so that decoding them in order never recurses more than one level.
+        """
+        color = {}                 # missing = WHITE, GREY = on stack, BLACK = done
+        order = []
+        for root in roots:
+            if root in color or root in self.decoded:
+                continue
+            color[root] = _GREY
+            stk = [(root, iter(self._deps_of(root)))]
+            while stk:
+                key, it = stk[-1]
+                for idx in it:
+                    c = color.get(idx)
+                    if c is None:
+                        if idx in self.decoded:
+                            continue
+                        color[idx] = _GREY
+                        stk.append((idx, iter(self._deps_of(idx))))
+                        break
+                    elif c == _GREY:
+                        raise NameError("Cycles detected in shared representation", idx)
+                else:
+                    stk.pop()
+                    color[key] = _BLACK
+                    order.append(key)
+        return order
+
+    def _display_deps(self):
+        import networkx as nx
+        import matplotlib.pyplot as plt
+
+        g = nx.DiGraph()
+        g.add_nodes_from(self.constr_share.keys())
+        g.add_edges_from([(key, idx) for key, idxs in self.deps.items() for idx in idxs])
+        nx.drawing.nx_pylab.draw_kamada_kawai(g, with_labels=True)
+        plt.show()
 
     # -------------------------------------------------
     # First pass decoding
-    def _add_edges(self, idx, idxs):
-        self.edges += [(idx, idx_p) for idx_p in idxs]
-
-    def _santize_keys(self, c_idxs):
-        c_idxs = c_idxs[1:-1]
-        return [int(idx.strip()) for idx in c_idxs.split()]
-
-    def _split_entry(self, entry):
-        # NOTE(deh): dealing with nested []
-        toks = re.findall(r'\[[^}]*?\]|\S+', entry)
-        return toks
-
     def _parse_rawast(self, key, entry):
         """First pass decoding to build dependency graph"""
-        toks = self._split_entry(entry)
-        kind = toks[0].strip()
-        if kind == "R":
-            # R %d
-            idx = int(toks[1].strip())
-
-            self.rawasts[key] = ("R", idx)
-        elif kind == "V":
-            # V %s
-            x = toks[1].strip()
-
-            self.rawasts[key] = ("V", x)
-        elif kind == "M":
-            # M %d
-            idx = int(toks[1].strip())
-
-            self.rawasts[key] = ("M", idx)
-        elif kind == "E":
-            # E %d [%s]
-            exk = int(toks[1].strip())
-            cs_idxs = self._santize_keys(toks[2].strip())
-
-            self.rawasts[key] = ("E", exk, cs_idxs)
-            self._add_edges(key, cs_idxs)
-        elif kind == "S":
-            # S %s
-            sort = toks[1].strip()
-
-            self.rawasts[key] = ("S", sort)
-        elif kind == "CA":
-            # CA %d %s %d
-            c_idx = int(toks[1].strip())
-            ck = toks[2].strip()
-            ty_idx = int(toks[3].strip())
-
-            self.rawasts[key] = ("CA", c_idx, ck, ty_idx)
-            self._add_edges(key, [c_idx, ty_idx])
-        elif kind == "P":
-            # P %s %d %d
-            name = self._parse_rawname(toks[1].strip())
-            ty1_idx = int(toks[2].strip())
-            ty2_idx = int(toks[3].strip())
-
-            self.rawasts[key] = ("P", name, ty1_idx, ty2_idx)
-            self._add_edges(key, [ty1_idx, ty2_idx])
-        elif kind == "L":
-            # L %s %d %d
-            name = self._parse_rawname(toks[1].strip())
-            ty_idx = int(toks[2].strip())
-            c_idx = int(toks[3].strip())
-
-            self.rawasts[key] = ("L", name, ty_idx, c_idx)
-            self._add_edges(key, [ty_idx, c_idx])
-        elif kind == "LI":
-            # LI %s %d %d %d
-            name = self._parse_rawname(toks[1].strip())
-            c1_idx = int(toks[2].strip())
-            ty_idx = int(toks[3].strip())
-            c2_idx = int(toks[4].strip())
-
-            self.rawasts[key] = ("LI", name, c1_idx, ty_idx, c2_idx)
-            self._add_edges(key, [c1_idx, ty_idx, c2_idx])
-        elif kind == "A":
-            # A %d [%s]
-            c_idx = int(toks[1].strip())
-            cs_idxs = self._santize_keys(toks[2].strip())
-
-            self.rawasts[key] = ("A", c_idx, cs_idxs)
-            self._add_edges(key, [c_idx] + cs_idxs)
-        elif kind == "C":
-            # C %s [%s]
-            const = self._parse_rawname(toks[1].strip())
-            ui = self._parse_rawuniverse_instance(toks[2].strip())
-
-            self.rawasts[key] = ("C", const, ui)
-        elif kind == "I":
-            # I %s %d [%s]
-            mutind = self._parse_rawname(toks[1].strip())
-            pos = int(toks[2].strip())
-            ui = self._parse_rawuniverse_instance(toks[3].strip())
-
-            self.rawasts[key] = ("I", mutind, pos, ui)
-        elif kind == "CO":
-            # CO %s %d %d [%s]
-            mutind = self._parse_rawname(toks[1].strip())
-            pos = int(toks[2].strip())
-            conid = int(toks[3].strip())
-            ui = self._parse_rawuniverse_instance(toks[4].strip())
-
-            self.rawasts[key] = ("CO", mutind, pos, conid, ui)
-        elif kind == "CS":
-            # CS [%s] %d %d [%s]
-            idx = entry.find(']]')
-            hd = entry[2:idx]
-            tl = entry[idx+2:]
-            toks = self._split_entry(tl)
-            case_info = self._parse_rawcase_info(hd.strip())
-            c1_idx = int(toks[0].strip())
-            c2_idx = int(toks[1].strip())
-            cs_idxs = self._santize_keys(toks[2].strip())
-
-            self.rawasts[key] = ("CS", case_info, c1_idx, c2_idx, cs_idxs)
-            self._add_edges(key, [c1_idx, c2_idx] + cs_idxs)
-        elif kind == "F":
-            # F [%s] %d [%s] [%s] [%s]
-            iarr = self._parse_rawiarr(toks[1].strip())
-            idx = int(toks[2].strip())
-            names = self._parse_rawnames(toks[3].strip())
-            ty_idxs = self._santize_keys(toks[4].strip())
-            cs_idxs = self._santize_keys(toks[5].strip())
-
-            self.rawasts[key] = ("F", iarr, idx, names, ty_idxs, cs_idxs)
-            self._add_edges(key, ty_idxs + cs_idxs)
-        elif kind == "CF":
-            idx = int(toks[2].strip())
-            names = self._parse_rawnames(toks[3].strip())
-            ty_idxs = self._santize_keys(toks[4].strip())
-            cs_idxs = self._santize_keys(toks[5].strip())
-
-            self.rawasts[key] = ("CF", idx, names, ty_idxs, cs_idxs)
-            self._add_edges(key, ty_idxs + cs_idxs)
-        elif kind == "PJ":
-            proj = self._parse_rawname(toks[1].strip())
-            c_idx = int(toks[2].strip())
-
-            self.rawasts[key] = ("PJ", proj, c_idx)
-            self._add_edges(key, [c_idx])
-        else:
-            raise NameError("Kind {} not supported.".format(kind))
-
-    def _parse_rawname(self, name):
-        name = name.strip()
-        if name in self.names:
-            return self.names[name]
-        else:
-            # TODO(deh): Hierarchical parsing?
-            name_p = Name(name)
-            self.names[name] = name_p
-            return name_p
-
-    def _parse_rawnames(self, names):
-        names = names[1:-1]
-        return [self._parse_rawname(name) for name in names.split()]
-
-    def _parse_rawuniverse_instance(self, ui):
-        ui = ui[1:-1]
-        return UniverseInstance([u.strip() for u in ui.split()])
-
-    def _parse_rawiarr(self, iarr):
-        iarr = iarr[1:-1]
-        return [int(i.strip()) for i in iarr.split()]
-
-    def _parse_rawcase_info(self, ci):
-        ci = ci[1:-1]
-        toks = self._split_entry(ci)
-        mutind = self._parse_rawname(toks[0])
-        pos = int(toks[1])
-        npar = int(toks[2].strip())
-        cstr_ndecls = self._parse_rawiarr(toks[3].strip())
-        cstr_nargs = self._parse_rawiarr(toks[4].strip())
-        return CaseInfo(Inductive(mutind, pos), npar, cstr_ndecls, cstr_nargs)
+        rawast, deps = self._lexer.lex(entry)
+        self.rawasts[key] = rawast
+        if deps:
+            self.deps[key] = deps
 
     # -------------------------------------------------
     # Second pass of decoding
@@ -270,6 +236,8 @@ class DecodeConstr(object):
             return self.decoded[key]
         else:
             c.tag = key
+            # Children are decoded first, so this only hashes the fields of c
+            c.digest
             self.decoded[key] = c
             return c
 
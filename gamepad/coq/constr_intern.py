@@ -0,0 +1,208 @@
+# Copyright 2018 The GamePad Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from coq.constr import *
+from lib.gensym import GenSym
+
+
+"""
+[Note]
+
+Hash-consing of kernel expressions across lemmas (and files).
+
+Every lemma has its own constr_share table, so common subterms are decoded
+and stored once per lemma. An ExpInterner keeps one node per structurally
+distinct term for the whole corpus:
+1. A node is identified by its kind, its atomic fields (names, universe
+   instances, ...), and the ids of its (already interned) children.
+2. Each unique term gets a corpus-wide id, assigned in the order terms are
+   first seen, which is stored in its tag. Tags are what the AST utilities
+   memoize on, so they stay unique per term.
+3. The decoder of a lemma keeps its keys, i.e., decoder.decoded[key] is the
+   interned node (whose tag is the corpus-wide id, not key). The table is
+   then an InternedTable, which tells ChkConstr to look entries up by tag
+   through the keys of the table.
+
+Two interned terms are structurally equal iff they are the same object.
+Interning is done after decoding (and its per-lemma checks).
+"""
+
+
+# -------------------------------------------------
+# Structure of expressions
+
+def _children(c):
+    ty = type(c)
+    if ty is AppExp:
+        return [c.c] + c.cs
+    elif ty is ProdExp:
+        return [c.ty1, c.ty2]
+    elif ty is LambdaExp:
+        return [c.ty, c.c]
+    elif ty is LetInExp:
+        return [c.c1, c.ty, c.c2]
+    elif ty is CastExp:
+        return [c.c, c.ty]
+    elif ty is EvarExp:
+        return c.cs
+    elif ty is CaseExp:
+        return [c.ret, c.match] + c.cases
+    elif ty is FixExp or ty is CoFixExp:
+        return c.tys + c.cs
+    elif ty is ProjExp:
+        return [c.c]
+    else:
+        return []
+
+
+def _atoms(c):
+    ty = type(c)
+    if ty is RelExp:
+        return ("R", c.idx)
+    elif ty is VarExp:
+        return ("V", c.x)
+    elif ty is MetaExp:
+        return ("M", c.mv)
+    elif ty is EvarExp:
+        return ("E", c.exk)
+    elif ty is SortExp:
+        return ("S", c.sort)
+    elif ty is CastExp:
+        return ("CA", c.ck)
+    elif ty is ProdExp:
+        return ("P", c.name)
+    elif ty is LambdaExp:
+        return ("L", c.name)
+    elif ty is LetInExp:
+        return ("LI", c.name)
+    elif ty is AppExp:
+        return ("A",)
+    elif ty is ConstExp:
+        return ("C", c.const, tuple(c.ui.univs))
+    elif ty is IndExp:
+        return ("I", c.ind, tuple(c.ui.univs))
+    elif ty is ConstructExp:
+        return ("CO", c.ind, c.conid, tuple(c.ui.univs))
+    elif ty is CaseExp:
+        ci = c.ci
+        return ("CS", ci.ind, ci.npar, tuple(ci.cstr_ndecls), tuple(ci.cstr_nargs))
+    elif ty is FixExp:
+        return ("F", tuple(c.iarr), c.idx, tuple(c.names), len(c.tys))
+    elif ty is CoFixExp:
+        return ("CF", c.idx, tuple(c.names), len(c.tys))
+    elif ty is ProjExp:
+        return ("PJ", c.proj)
+    else:
+        raise NameError("Kind {} not supported".format(c))
+
+
+def _rebuild(c, cs):
+    """Copy of c with children cs"""
+    ty = type(c)
+    if ty is AppExp:
+        return AppExp(cs[0], cs[1:])
+    elif ty is ProdExp:
+        return ProdExp(c.name, cs[0], cs[1])
+    elif ty is LambdaExp:
+        return LambdaExp(c.name, cs[0], cs[1])
+    elif ty is LetInExp:
+        return LetInExp(c.name, cs[0], cs[1], cs[2])
+    elif ty is CastExp:
+        return CastExp(cs[0], c.ck, cs[1])
+    elif ty is EvarExp:
+        return EvarExp(c.exk, cs)
+    elif ty is CaseExp:
+        return CaseExp(c.ci, cs[0], cs[1], cs[2:])
+    elif ty is FixExp:
+        n = len(c.tys)
+        return FixExp(c.iarr, c.idx, c.names, cs[:n], cs[n:])
+    elif ty is CoFixExp:
+        n = len(c.tys)
+        return CoFixExp(c.idx, c.names, cs[:n], cs[n:])
+    elif ty is ProjExp:
+        return ProjExp(c.proj, cs[0])
+    else:
+        raise NameError("Kind {} not supported".format(c))
+
+
+# -------------------------------------------------
+# Interning
+
+class InternedTable(dict):
+    """Decoded table (Dict[int, Exp]) whose entries have been interned"""
+    pass
+
+
+class ExpInterner(object):
+    def __init__(self):
+        self.table = {}          # Dict[key, Exp], one node per unique term
+        self.gs_id = GenSym()    # Corpus-wide ids
+        self.num_seen = 0        # Number of nodes interned (with duplicates)
+
+    def __len__(self):
+        return len(self.table)
+
+    def intern_decoder(self, decoder):
+        """
+        Replace every entry of a decoded table by its interned node.
+        """
+        decoded = decoder.materialize()
+        memo = {}
+        interned = InternedTable()
+        for key, c in decoded.items():
+            interned[key] = self.intern(c, memo)
+        decoder.decoded = interned
+        return interned
+
+    def intern(self, c, memo=None):
+        """
+        Returns the interned node of c. memo maps id(node) to (node, interned)
+        for nodes seen in the same table (holding node keeps its id valid).
+        """
+        if memo is None:
+            memo = {}
+        if id(c) in memo:
+            return memo[id(c)][1]
+
+        # Iterative post-order traversal
+        stk = [(c, False)]
+        while stk:
+            c_p, f_done = stk.pop()
+            if id(c_p) in memo:
+                continue
+            children = _children(c_p)
+            if f_done:
+                memo[id(c_p)] = (c_p, self._intern_node(c_p, children, memo))
+            else:
+                stk.append((c_p, True))
+                for c_c in children:
+                    if id(c_c) not in memo:
+                        stk.append((c_c, False))
+        return memo[id(c)][1]
+
+    def _intern_node(self, c, children, memo):
+        self.num_seen += 1
+        cs = [memo[id(c_c)][1] for c_c in children]
+        key = _atoms(c) + tuple(c_c.tag for c_c in cs)
+        try:
+            return self.table[key]
+        except KeyError:
+            if all(c_c is c_p for c_c, c_p in zip(children, cs)):
+                c_i = c
+            else:
+                c_i = _rebuild(c, cs)
+            c_i.tag = self.gs_id.gensym()
+            self.table[key] = c_i
+            return c_i
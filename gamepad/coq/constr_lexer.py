@@ -0,0 +1,211 @@
+# Copyright 2018 The GamePad Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import re
+
+from coq.constr import CaseInfo, Inductive, Name, UniverseInstance
+
+
+"""
+[Note]
+
+Lexer for the entries of the constr_share table in a .dump file.
+
+Each kind of entry has a fixed shape, for example
+    A 3 [1 2]
+    CS [Coq.Init.Datatypes.nat 0 0 [0 1] [0 1]] 5 3 [3 6]
+    F [0] 0 [f] [2] [4]
+so every entry is matched with a single pre-compiled pattern (one pass over
+the string) and converted straight into a raw ast, which is a tuple
+    (kind, field1, ..., fieldn)
+where indices into the table are ints (tuples of ints for lists) and names
+are interned Name objects. The lexer also returns the table indices that the
+entry refers to, which are the edges of the dependency graph.
+
+The CS case info is matched structurally, so (unlike the previous lexer,
+which dropped the last character of cstr_nargs) all fields are kept.
+"""
+
+
+# -------------------------------------------------
+# Patterns
+
+_TOK = r"\s+(\S+)"                     # Single token
+_ARR = r"\s*\[([^\]]*)\]"              # Bracketed list, contents only
+_ANY = r"\s+(?:\[[^\]]*\]|\S+)"        # Token or list, ignored
+
+_PATTERNS = {
+    "R": "R" + _TOK,
+    "V": "V" + _TOK,
+    "M": "M" + _TOK,
+    "E": "E" + _TOK + _ARR,
+    "S": "S" + _TOK,
+    "CA": "CA" + _TOK + _TOK + _TOK,
+    "P": "P" + _TOK + _TOK + _TOK,
+    "L": "L" + _TOK + _TOK + _TOK,
+    "LI": "LI" + _TOK + _TOK + _TOK + _TOK,
+    "A": "A" + _TOK + _ARR,
+    "C": "C" + _TOK + _ARR,
+    "I": "I" + _TOK + _TOK + _ARR,
+    "CO": "CO" + _TOK + _TOK + _TOK + _ARR,
+    "CS": "CS" + r"\s*\[\s*(\S+)\s+(\S+)\s+(\S+)" + _ARR + _ARR + r"\s*\]" +
+          _TOK + _TOK + _ARR,
+    "F": "F" + _ARR + _TOK + _ARR + _ARR + _ARR,
+    "CF": "CF" + _ANY + _TOK + _ARR + _ARR + _ARR,
+    "PJ": "PJ" + _TOK + _TOK,
+}
+
+_COMPILED = {kind: re.compile(pattern + r"\s*$").match
+             for kind, pattern in _PATTERNS.items()}
+
+
+def _ints(s):
+    return tuple(map(int, s.split()))
+
+
+# -------------------------------------------------
+# Lexer
+
+class ConstrLexer(object):
+    def __init__(self, names=None):
+        # Interned names, shared across entries
+        self.names = {} if names is None else names   # Dict[str, Name]
+
+        # Dict[str, (match, lex)] by kind
+        lexers = {
+            "R": self._lex_r, "V": self._lex_v, "M": self._lex_m,
+            "E": self._lex_e, "S": self._lex_s, "CA": self._lex_ca,
+            "P": self._lex_p, "L": self._lex_l, "LI": self._lex_li,
+            "A": self._lex_a, "C": self._lex_c, "I": self._lex_i,
+            "CO": self._lex_co, "CS": self._lex_cs, "F": self._lex_f,
+            "CF": self._lex_cf, "PJ": self._lex_pj
+        }
+        self._lexers = {kind: (_COMPILED[kind], lex) for kind, lex in lexers.items()}
+
+    def lex(self, entry):
+        """
+        Returns (rawast, deps) of an entry, where deps are the indices the
+        entry refers to.
+        """
+        entry = entry.lstrip()
+        kind = entry.split(" ", 1)[0]
+        try:
+            match, lex = self._lexers[kind]
+        except KeyError:
+            raise NameError("Kind {} not supported.".format(kind))
+        m = match(entry)
+        if m is None:
+            raise NameError("Malformed entry {}".format(entry))
+        return lex(*m.groups())
+
+    def name(self, name):
+        try:
+            return self.names[name]
+        except KeyError:
+            name_p = Name(name)       # Interned process-wide
+            self.names[name] = name_p
+            return name_p
+
+    # -------------------------------------------------
+    # Per kind
+
+    def _lex_r(self, idx):
+        # R %d
+        return ("R", int(idx)), ()
+
+    def _lex_v(self, x):
+        # V %s
+        return ("V", x), ()
+
+    def _lex_m(self, idx):
+        # M %d
+        return ("M", int(idx)), ()
+
+    def _lex_e(self, exk, cs_idxs):
+        # E %d [%s]
+        cs_idxs = _ints(cs_idxs)
+        return ("E", int(exk), cs_idxs), cs_idxs
+
+    def _lex_s(self, sort):
+        # S %s
+        return ("S", sort), ()
+
+    def _lex_ca(self, c_idx, ck, ty_idx):
+        # CA %d %s %d
+        c_idx, ty_idx = int(c_idx), int(ty_idx)
+        return ("CA", c_idx, ck, ty_idx), (c_idx, ty_idx)
+
+    def _lex_p(self, name, ty1_idx, ty2_idx):
+        # P %s %d %d
+        ty1_idx, ty2_idx = int(ty1_idx), int(ty2_idx)
+        return ("P", self.name(name), ty1_idx, ty2_idx), (ty1_idx, ty2_idx)
+
+    def _lex_l(self, name, ty_idx, c_idx):
+        # L %s %d %d
+        ty_idx, c_idx = int(ty_idx), int(c_idx)
+        return ("L", self.name(name), ty_idx, c_idx), (ty_idx, c_idx)
+
+    def _lex_li(self, name, c1_idx, ty_idx, c2_idx):
+        # LI %s %d %d %d
+        deps = (int(c1_idx), int(ty_idx), int(c2_idx))
+        return ("LI", self.name(name)) + deps, deps
+
+    def _lex_a(self, c_idx, cs_idxs):
+        # A %d [%s]
+        c_idx = int(c_idx)
+        cs_idxs = _ints(cs_idxs)
+        return ("A", c_idx, cs_idxs), (c_idx,) + cs_idxs
+
+    def _lex_c(self, const, ui):
+        # C %s [%s]
+        return ("C", self.name(const), UniverseInstance(ui.split())), ()
+
+    def _lex_i(self, mutind, pos, ui):
+        # I %s %d [%s]
+        return ("I", self.name(mutind), int(pos), UniverseInstance(ui.split())), ()
+
+    def _lex_co(self, mutind, pos, conid, ui):
+        # CO %s %d %d [%s]
+        return ("CO", self.name(mutind), int(pos), int(conid),
+                UniverseInstance(ui.split())), ()
+
+    def _lex_cs(self, mutind, pos, npar, cstr_ndecls, cstr_nargs,
+                c1_idx, c2_idx, cs_idxs):
+        # CS [%s %d %d [%s] [%s]] %d %d [%s]
+        ind = Inductive(self.name(mutind), int(pos))
+        case_info = CaseInfo(ind, int(npar), list(_ints(cstr_ndecls)),
+                             list(_ints(cstr_nargs)))
+        c1_idx, c2_idx = int(c1_idx), int(c2_idx)
+        cs_idxs = _ints(cs_idxs)
+        return ("CS", case_info, c1_idx, c2_idx, cs_idxs), (c1_idx, c2_idx) + cs_idxs
+
+    def _lex_f(self, iarr, idx, names, ty_idxs, cs_idxs):
+        # F [%s] %d [%s] [%s] [%s]
+        names = [self.name(name) for name in names.split()]
+        ty_idxs = _ints(ty_idxs)
+        cs_idxs = _ints(cs_idxs)
+        return ("F", list(_ints(iarr)), int(idx), names, ty_idxs, cs_idxs), ty_idxs + cs_idxs
+
+    def _lex_cf(self, idx, names, ty_idxs, cs_idxs):
+        # CF %d %d [%s] [%s] [%s]
+        names = [self.name(name) for name in names.split()]
+        ty_idxs = _ints(ty_idxs)
+        cs_idxs = _ints(cs_idxs)
+        return ("CF", int(idx), names, ty_idxs, cs_idxs), ty_idxs + cs_idxs
+
+    def _lex_pj(self, proj, c_idx):
+        # PJ %s %d
+        c_idx = int(c_idx)
+        return ("PJ", self.name(proj), c_idx), (c_idx,)
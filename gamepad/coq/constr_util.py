@@ -13,38 +13,147 @@
 # limitations under the License.
 # ==============================================================================
 
-import networkx as nx
-import plotly
-from plotly.graph_objs import *
+import random
+import time
+from enum import Enum
 
 from coq.constr import *
+from coq.constr_arena import ConstrArena
+from coq.constr_intern import InternedTable
 from lib.gensym import GenSym
+from lib.mybulk import BulkDag, BulkTable
+from lib.mytramp import trampoline
 
 
 """
 [Note]
 
 Utility functions on Coq expressions.
-1. Check that Coq expressions are well-formed.
-2. Compute size of Coq expressions.
+1. Check that Coq expressions are well-formed (validation level: ChkMode).
+2. Compute size of Coq expressions (BulkConstr: of a whole table at once).
 3. Get tokens seen in a Coq expression.
 4. Visualize a Coq expression.
 5. Alpha-convert
+
+Traversals (except visualization) keep an explicit stack, so deep terms
+do not hit sys.getrecursionlimit().
 """
 
 
+# -------------------------------------------------
+# Children of a Coq expression (for the explicit-stack traversals)
+
+# Dict[type, function from an Exp to its children]
+_SUBTERMS = {
+    RelExp: lambda c: (),
+    VarExp: lambda c: (),
+    MetaExp: lambda c: (),
+    EvarExp: lambda c: c.cs,
+    SortExp: lambda c: (),
+    CastExp: lambda c: (c.c, c.ty),
+    ProdExp: lambda c: (c.ty1, c.ty2),
+    LambdaExp: lambda c: (c.ty, c.c),
+    LetInExp: lambda c: (c.c1, c.ty, c.c2),
+    AppExp: lambda c: [c.c] + c.cs,
+    ConstExp: lambda c: (),
+    IndExp: lambda c: (),
+    ConstructExp: lambda c: (),
+    CaseExp: lambda c: [c.ret, c.match] + c.cases,
+    FixExp: lambda c: c.tys + c.cs,
+    CoFixExp: lambda c: c.tys + c.cs,
+    ProjExp: lambda c: (c.c,),
+}
+
+
+def subterms(c):
+    """Children of c (left to right)"""
+    try:
+        return _SUBTERMS[type(c)](c)
+    except KeyError:
+        raise NameError("Kind {} not supported".format(c))
+
+
 # -------------------------------------------------
 # Check the decoded representation
 
+class ChkMode(Enum):
+    """How much of a decoded table is checked"""
+    OFF = "off"           # no checks
+    SAMPLED = "sampled"   # a random sample of the entries (CHK_SAMPLE_RATE)
+    FULL = "full"         # every entry
+
+    def __str__(self):
+        return self.value
+
+
+# Fraction of the entries checked in sampled mode
+CHK_SAMPLE_RATE = 0.05
+
+
 class ChkConstr(object):
     """Checks that the low-level format has been parsed properly.
     """
     def __init__(self, decoded):
         self.decoded = decoded   # Dict[int, Exp]
 
+        # Entries of an interned table are tagged with corpus-wide ids
+        if isinstance(decoded, InternedTable):
+            self.keys = {c.tag: key for key, c in decoded.items()}
+        else:
+            self.keys = None
+
+    def _entry(self, tag):
+        """Entry of the table tagged with tag"""
+        if self.keys is None:
+            return self.decoded[tag]
+        try:
+            return self.decoded[self.keys[tag]]
+        except KeyError:
+            raise NameError("Tag {} is not an entry of the table".format(tag))
+
     def chk_decoded(self):
-        for k, c in self.decoded.items():
-            self.chk_ast(c)
+        self.chk_keys(self.decoded.keys())
+
+    def chk_mode(self, mode, keys=None):
+        """
+        Check the entries keys (default: all) according to mode.
+        Returns the number of entries checked and the time spent.
+        """
+        start = time.time()
+        if keys is None:
+            keys = self.decoded.keys()
+        if mode is ChkMode.OFF:
+            keys = []
+        elif mode is ChkMode.SAMPLED:
+            keys = list(keys)
+            num_keys = min(len(keys), int(len(keys) * CHK_SAMPLE_RATE) + 1)
+            keys = random.Random(0).sample(keys, num_keys)
+        self.chk_keys(keys)
+        return len(keys), time.time() - start
+
+    def chk_keys(self, keys):
+        """
+        Single pass over the entries keys, with the checks of chk_ast: the tag
+        of an entry and of its children are consistent with the table, and an
+        entry does not mention itself. The children are checked as entries.
+        """
+        decoded = self.decoded
+        entry = self._entry
+        for key in keys:
+            c = decoded[key]
+            tag = c.tag
+            c_e = entry(tag)
+            if c_e.tag != tag:
+                raise NameError("Tags {} and {} do not match {} {}".
+                                format(tag, c_e.tag, type(tag), type(c_e.tag)))
+            for c_p in subterms(c):
+                tag_p = c_p.tag
+                if tag_p == tag:
+                    raise NameError("Recursive mention of {} in {}".format(tag, c_p))
+                c_e = entry(tag_p)
+                if c_e.tag != tag_p:
+                    raise NameError("Tags {} and {} do not match {} {}".
+                                    format(tag_p, c_e.tag, type(tag_p), type(c_e.tag)))
 
     def chk_ast(self, c):
         return self._chk_ast(True, c)
@@ -58,7 +167,7 @@ class ChkConstr(object):
             self._occurs_ast(tag, c)
 
     def _chk_ast(self, f_chk, c):
-        c_p = self.decoded[c.tag]
+        c_p = self._entry(c.tag)
         if c_p.tag != c.tag:
             raise NameError("Tags {} and {} do not match {} {}".
                             format(c.tag, c_p.tag, type(c.tag), type(c_p.tag)))
@@ -150,6 +259,10 @@ class ChkConstr(object):
 
 class SizeConstr(object):
     """Computes the size of a constr.
+
+    NOTE: with f_shared, sizes depend on the order of the calls (a size is
+    returned once, then 0). BulkConstr.root_sizes computes shared sizes
+    independently of the order.
     """
     def __init__(self, decoded, f_shared=False, f_cnttyp=False):
         self.decoded = decoded
@@ -165,66 +278,56 @@ class SizeConstr(object):
     def decode_size(self, key):
         return self.size(self.decoded[key])
 
-    def size(self, c):
-        key = c.tag
+    def _lookup(self, key):
         if key in self.size_ast:
             sz = self.size_ast[key]
             if self.f_shared:
                 self.size_ast[key] = 0
             return sz
+        return None
 
-        if isinstance(c, RelExp):
-            return self._sizecon(key, 1)
-        elif isinstance(c, VarExp):
-            return self._sizecon(key, 1)
-        elif isinstance(c, MetaExp):
-            return self._sizecon(key, 1)
-        elif isinstance(c, EvarExp):
-            sz = 1 + self.sizes(c.cs)
-            return self._sizecon(key, sz)
-        elif isinstance(c, SortExp):
-            return self._sizecon(key, 1)
-        elif isinstance(c, CastExp):
-            sz = 1 + self.size(c.c) + self.size(c.ty)
-            return self._sizecon(key, sz)
-        elif isinstance(c, ProdExp):
-            sz = 1 + self.size(c.ty1) + self.size(c.ty2)
-            return self._sizecon(key, sz)
-        elif isinstance(c, LambdaExp):
-            sz = 1 + self.size(c.ty) + self.size(c.c)
-            return self._sizecon(key, sz)
-        elif isinstance(c, LetInExp):
-            sz = 1 + self.size(c.c1) + self.size(c.ty) + self.size(c.c2)
-            return self._sizecon(key, sz)
-        elif isinstance(c, AppExp):
-            sz = 1 + self.size(c.c) + self.sizes(c.cs)
-            return self._sizecon(key, sz)
-        elif isinstance(c, ConstExp):
-            return self._sizecon(key, 1)
-        elif isinstance(c, IndExp):
-            return self._sizecon(key, 1)
-        elif isinstance(c, ConstructExp):
-            return self._sizecon(key, 1)
-        elif isinstance(c, CaseExp):
-            sz = (1 + self.size(c.ret) + self.size(c.match) +
-                  self.sizes(c.cases))
-            return self._sizecon(key, sz)
-        elif isinstance(c, FixExp):
-            sz = 1 + self.sizes(c.tys) + self.sizes(c.cs)
-            return self._sizecon(key, sz)
-        elif isinstance(c, CoFixExp):
-            sz = 1 + self.sizes(c.tys) + self.sizes(c.cs)
-            return self._sizecon(key, sz)
-        elif isinstance(c, ProjExp):
-            sz = 1 + self.size(c.c)
-            return self._sizecon(key, sz)
-        else:
-            raise NameError("Kind {} not supported".format(c))
+    def size(self, c):
+        sz = self._lookup(c.tag)
+        if sz is not None:
+            return sz
+
+        # Explicit stack of [node, its remaining children, size so far].
+        # Children are looked up one at a time (left to right), since with
+        # f_shared a lookup changes the size of later occurrences.
+        stk = [[c, iter(subterms(c)), 1]]
+        while True:
+            frame = stk[-1]
+            for c_p in frame[1]:
+                sz = self._lookup(c_p.tag)
+                if sz is None:
+                    stk.append([c_p, iter(subterms(c_p)), 1])
+                    break
+                frame[2] += sz
+            else:
+                stk.pop()
+                sz = self._sizecon(frame[0].tag, frame[2])
+                if not stk:
+                    return sz
+                stk[-1][2] += sz
 
     def sizes(self, cs):
         return sum([self.size(c) for c in cs])
 
 
+class BulkConstr(BulkTable):
+    """Computes sizes and histograms of a whole decoded table at once.
+
+    Sizes and histograms match SizeConstr (f_shared=False) and HistConstr.
+    shared_size(key) is the number of distinct subterms of key, and
+    root_sizes(keys) the tree and DAG sizes of a set of terms.
+    """
+    def build_dag(self, decoded):
+        arena = ConstrArena.from_exps(decoded.values())
+        dag = BulkDag(arena.kinds, arena.child_ptr, arena.childs, len(COQEXP))
+        rows = {key: arena.index(c.tag) for key, c in decoded.items()}
+        return dag, rows
+
+
 # -------------------------------------------------
 # Computing histogram of Coq Constr
 
@@ -353,75 +456,37 @@ class TokenConstr(object):
     def _seen(self, c):
         self.seen.add(c.tag)
 
-    def token(self, c):
-        if c.tag in self.seen:
-            return
-
-        if isinstance(c, RelExp):
-            return self._seen(c)
-        elif isinstance(c, VarExp):
-            return self._seen(c)
-        elif isinstance(c, MetaExp):
-            return self._seen(c)
-        elif isinstance(c, EvarExp):
+    def _token(self, c):
+        # Tokens of c itself
+        if isinstance(c, EvarExp):
             self.unique_evar.add(c.exk)
-            self.tokens(c.cs)
-            return self._seen(c)
         elif isinstance(c, SortExp):
             self.unique_sort.add(c.sort)
-            return self._seen(c)
-        elif isinstance(c, CastExp):
-            self.token(c.c)
-            self.token(c.ty)
-            return self._seen(c)
-        elif isinstance(c, ProdExp):
-            self.token(c.ty1)
-            self.token(c.ty2)
-            return self._seen(c)
-        elif isinstance(c, LambdaExp):
-            self.token(c.ty)
-            self.token(c.c)
-            return self._seen(c)
-        elif isinstance(c, LetInExp):
-            self.token(c.c1)
-            self.token(c.ty)
-            self.token(c.c2)
-            return self._seen(c)
-        elif isinstance(c, AppExp):
-            self.token(c.c)
-            self.tokens(c.cs)
-            return self._seen(c)
         elif isinstance(c, ConstExp):
             self.unique_const.add(c.const)
-            return self._seen(c)
         elif isinstance(c, IndExp):
             self.unique_ind.add(c.ind.mutind)
-            return self._seen(c)
         elif isinstance(c, ConstructExp):
             self.unique_ind.add(c.ind.mutind)
             self.unique_conid.add((c.ind.mutind, c.conid))
-            return self._seen(c)
-        elif isinstance(c, CaseExp):
-            self.token(c.ret)
-            self.token(c.match)
-            self.tokens(c.cases)
-            return self._seen(c)
         elif isinstance(c, FixExp):
             for name in c.names:
                 self.unique_fix.add(name)
-            self.tokens(c.tys)
-            self.tokens(c.cs)
-            return self._seen(c)
-        elif isinstance(c, CoFixExp):
-            # TODO(deh): do cofix?
-            self.tokens(c.tys)
-            self.tokens(c.cs)
-            return self._seen(c)
-        elif isinstance(c, ProjExp):
-            self.token(c.c)
-            return self._seen(c)
-        else:
-            raise NameError("Kind {} not supported".format(c))
+        # TODO(deh): do cofix?
+
+    def token(self, c):
+        # Explicit stack, c is marked seen after its children (None marks)
+        stk = [c]
+        while stk:
+            c = stk.pop()
+            if c is None:
+                self._seen(stk.pop())
+            elif c.tag not in self.seen:
+                cs = subterms(c)
+                self._token(c)
+                stk.append(c)
+                stk.append(None)
+                stk.extend(reversed(cs))
 
     def tokens(self, cs):
         for c in cs:
@@ -457,6 +522,11 @@ class VisualizeConstr(object):
         return self.visualize(self.decoded[key])
 
     def visualize(self, c):
+        # NOTE: imported here so that decoding does not depend on drawing libraries
+        import networkx as nx
+        import plotly
+        from plotly.graph_objs import Data, Figure, Layout, Line, Marker, Scatter, XAxis, YAxis
+
         self.graph = nx.DiGraph()
         self.gs = GenSym()
         self.mkgraph(c)
@@ -642,6 +712,13 @@ class AlphaConstr(object):
                 return t
 
     def alpha(self, env, c):
+        return trampoline(self._alpha(env, c))
+
+    def alphas(self, env, cs):
+        return [self.alpha(env, c) for c in cs]
+
+    def _alpha(self, env, c):
+        # NOTE: recursive calls go through trampoline (see lib/mytramp.py)
         if c.tag in self.alpha_ast:
             return c
 
@@ -652,32 +729,32 @@ class AlphaConstr(object):
         elif isinstance(c, MetaExp):
             return self._alpha_cons(c)
         elif isinstance(c, EvarExp):
-            cs_p = self.alphas(env, c.cs)
+            cs_p = yield from self._alphas(env, c.cs)
             return self._alpha_cons(EvarExp(c.exk, cs_p))
         elif isinstance(c, SortExp):
             return self._alpha_cons(c)
         elif isinstance(c, CastExp):
-            c_p = self.alpha(env, c.c)
-            ty_p = self.alpha(env, c.ty)
+            c_p = yield self._alpha(env, c.c)
+            ty_p = yield self._alpha(env, c.ty)
             return self._alpha_cons(CastExp(c_p, c.ck, ty_p))
         elif isinstance(c, ProdExp):
-            ty1_p = self.alpha(env, c.ty1)
-            ty2_p = self.alpha(env, c.ty2)
+            ty1_p = yield self._alpha(env, c.ty1)
+            ty2_p = yield self._alpha(env, c.ty2)
             return self._alpha_cons(ProdExp(self._alpha_var(env, c.name), ty1_p, ty2_p))
         elif isinstance(c, LambdaExp):
             name_p = self._fresh(c.name)
-            ty_p = self.alpha(env, c.ty)
-            c_p = self.alpha(env.insert(c.name, name_p), c.c)
+            ty_p = yield self._alpha(env, c.ty)
+            c_p = yield self._alpha(env.insert(c.name, name_p), c.c)
             return self._alpha_cons(LambdaExp(name_p, ty_p, c_p))
         elif isinstance(c, LetInExp):
-            c1_p = self.alpha(env, c.c1)
-            ty_p = self.alpha(env, c.ty)
+            c1_p = yield self._alpha(env, c.c1)
+            ty_p = yield self._alpha(env, c.ty)
             name_p = self._fresh(c.name)
-            c2_p = self.alpha(env.insert(c.name, name_p), c.c2)
+            c2_p = yield self._alpha(env.insert(c.name, name_p), c.c2)
             return self._alpha_cons(LetInExp(name_p, c1_p, ty_p, c2_p))
         elif isinstance(c, AppExp):
-            c_p = self.alpha(env, c.c)
-            cs_p = self.alphas(env, c.cs)
+            c_p = yield self._alpha(env, c.c)
+            cs_p = yield from self._alphas(env, c.cs)
             return self._alpha_cons(AppExp(c_p, cs_p))
         elif isinstance(c, ConstExp):
             return self._alpha_cons(c)
@@ -686,26 +763,29 @@ class AlphaConstr(object):
         elif isinstance(c, ConstructExp):
             return self._alpha_cons(c)
         elif isinstance(c, CaseExp):
-            ret_p = self.alpha(env, c.ret)
-            match_p = self.alpha(env, c.match)
-            cases_p = self.alphas(env, c.cases)
+            ret_p = yield self._alpha(env, c.ret)
+            match_p = yield self._alpha(env, c.match)
+            cases_p = yield from self._alphas(env, c.cases)
             return self._alpha_cons(CaseExp(c.ci, ret_p, match_p, cases_p))
         elif isinstance(c, FixExp):
-            tys_p = self.alphas(c.tag, c.tys)
-            cs_p = self.alphas(c.tag, c.cs)
+            tys_p = yield from self._alphas(c.tag, c.tys)
+            cs_p = yield from self._alphas(c.tag, c.cs)
             return self._alpha_cons(FixExp(c.iarr, c.idx, c.names, tys_p, cs_p))
         elif isinstance(c, CoFixExp):
-            tys_p = self.alphas(c.tag, c.tys)
-            cs_p = self.alphas(c.tag, c.cs)
+            tys_p = yield from self._alphas(c.tag, c.tys)
+            cs_p = yield from self._alphas(c.tag, c.cs)
             return self._alpha_cons(CoFixExp(c.idx, c.names, tys_p, cs_p))
         elif isinstance(c, ProjExp):
-            c_p = self.alpha(env, c.c)
+            c_p = yield self._alpha(env, c.c)
             return self._alpha_cons(ProjExp(c.proj, c_p))
         else:
             raise NameError("Kind {} not supported".format(c))
 
-    def alphas(self, env, cs):
-        return [self.alpha(env, c) for c in cs]
+    def _alphas(self, env, cs):
+        cs_p = []
+        for c in cs:
+            cs_p.append((yield self._alpha(env, c)))
+        return cs_p
 
 
 # -------------------------------------------------
@@ -723,64 +803,23 @@ class PreOrder(object):
         return self.acc
 
     def _traverse(self, c):
-        typ = type(c)
-        if typ is VarExp:
-            self.acc += [c]
-        elif typ is ConstExp:
-            self.acc += [c]
-        elif typ is AppExp:
-            self.acc += [c]
-            self._traverse(c.c)
-            self._traverses(c.cs)
-        elif typ is EvarExp:
-            pass
-        elif typ is SortExp:
-            self.acc += [c]
-        elif typ is CastExp:
-            self.acc += [c]
-            self._traverse(c.c)
-            self._traverse(c.ty)
-        elif typ is ProdExp:
-            self.acc += [c]
-            self._traverse(c.ty1)
-            self._traverse(c.ty2)
-        elif typ is LambdaExp:
-            self.acc += [c]
-            self._traverse(c.ty)
-            self._traverse(c.c)
-        elif typ is LetInExp:
-            self.acc += [c]
-            self._traverse(c.c1)
-            self._traverse(c.ty)
-            self._traverse(c.c2)
-        elif typ is AppExp:
-            self.acc += [c]
-            self._traverse(c.c)
-            self._traverses(c.cs)
-        elif typ is ConstExp:
-            self.acc += [c]
-        elif typ is IndExp:
-            self.acc += [c]
-        elif typ is ConstructExp:
-            self.acc += [c]
-        elif typ is CaseExp:
-            self.acc += [c]
-            self._traverse(c.ret)
-            self._traverse(c.match)
-            self._traverses(c.cases)
-        elif typ is FixExp:
-            self.acc += [c]
-            self._traverse(c.tys)
-            self._traverse(c.cs)
-        elif typ is CoFixExp:
-            self.acc += [c]
-            self._traverse(c.tys)
-            self._traverse(c.cs)
-        elif typ is ProjExp:
-            self.acc += [c]
-            self._traverse(c.c)
-        else:
-            raise NameError("Shouldn't happen {}".format(c))
+        # Explicit stack, children are pushed in reverse to pop them in order
+        stk = [c]
+        while stk:
+            c = stk.pop()
+            typ = type(c)
+            if typ is EvarExp:
+                pass
+            elif typ is FixExp or typ is CoFixExp:
+                # NOTE: tys and cs are pushed as lists (not supported below)
+                self.acc += [c]
+                stk.append(c.cs)
+                stk.append(c.tys)
+            elif typ in _SUBTERMS and typ is not RelExp and typ is not MetaExp:
+                self.acc += [c]
+                stk.extend(reversed(subterms(c)))
+            else:
+                raise NameError("Shouldn't happen {}".format(c))
 
     def _traverses(self, cs):
         for c in cs:
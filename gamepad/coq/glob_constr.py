@@ -14,7 +14,9 @@
 # ==============================================================================
 
 from coq.constr import Name, Inductive
+from lib.mydigest import StructDigest
 from lib.myhist import MyHist
+from lib.myutil import SlotState
 
 
 """
@@ -25,8 +27,10 @@ This AST is used for tactic arguments.
 """
 
 
-class GExp(object):
+class GExp(StructDigest):
     """Base glob_constr expression"""
+    __slots__ = ("tag",)
+
     def __init__(self):
         self.tag = None
 
@@ -37,11 +41,13 @@ class GExp(object):
 # -------------------------------------------------
 # Global Reference
 
-class GlobalReference(object):
-    pass
+class GlobalReference(SlotState):
+    __slots__ = ()
 
 
 class VarRef(GlobalReference):
+    __slots__ = ("x",)
+
     def __init__(self, x):
         assert isinstance(x, str)
         self.x = x
@@ -51,6 +57,8 @@ class VarRef(GlobalReference):
 
 
 class ConstRef(GlobalReference):
+    __slots__ = ("const",)
+
     def __init__(self, const):
         assert isinstance(const, Name)
         self.const = const
@@ -60,6 +68,8 @@ class ConstRef(GlobalReference):
 
 
 class IndRef(GlobalReference):
+    __slots__ = ("ind",)
+
     def __init__(self, ind):
         assert isinstance(ind, Inductive)
         self.ind = ind
@@ -69,6 +79,8 @@ class IndRef(GlobalReference):
 
 
 class ConstructRef(GlobalReference):
+    __slots__ = ("ind", "conid")
+
     def __init__(self, ind, conid):
         assert isinstance(ind, Inductive)
         assert isinstance(conid, int)
@@ -82,7 +94,9 @@ class ConstructRef(GlobalReference):
 # -------------------------------------------------
 # CasesPattern
 
-class CasesPattern(object):
+class CasesPattern(SlotState):
+    __slots__ = ()
+
     def get_names(self):
         raise NotImplementedError
 
@@ -91,6 +105,9 @@ class CasesPattern(object):
 
 
 class PatVar(CasesPattern):
+    __slots__ = ("name",)
+    _binders = ("name",)
+
     def __init__(self, name):
         assert isinstance(name, Name)
         self.name = name
@@ -106,6 +123,9 @@ class PatVar(CasesPattern):
 
 
 class PatCstr(CasesPattern):
+    __slots__ = ("ind", "j", "cps", "name")
+    _binders = ("name",)
+
     def __init__(self, ind, j, cps, name):
         assert isinstance(ind, Inductive)
         assert isinstance(j, int)
@@ -136,7 +156,10 @@ class PatCstr(CasesPattern):
 # -------------------------------------------------
 # Other auxilliary data-structures
 
-class PredicatePattern(object):
+class PredicatePattern(SlotState):
+    __slots__ = ("name", "m_ind_and_names")
+    _binders = ("name",)
+
     def __init__(self, name, m_ind_and_names):
         self.name = name
         self.m_ind_and_names = m_ind_and_names
@@ -148,7 +171,9 @@ class PredicatePattern(object):
         return "{{{}}}".format(self.name)
 
 
-class TomatchTuple(object):
+class TomatchTuple(SlotState):
+    __slots__ = ("g", "pp")
+
     def __init__(self, g, pp):
         assert isinstance(g, GExp)
         assert isinstance(pp, PredicatePattern)
@@ -162,7 +187,10 @@ class TomatchTuple(object):
         return "{{{}}}".format(self.g.apted_tree(), self.pp.apted_tree())
 
 
-class CasesClause(object):
+class CasesClause(SlotState):
+    __slots__ = ("ids", "cps", "g")
+    _binders = ("ids",)
+
     def __init__(self, ids, cps, g):
         for cp in cps:
             assert isinstance(cp, CasesPattern)
@@ -182,7 +210,9 @@ class CasesClause(object):
         return "{{CC{}{}{}}}".format(s_ids, s_cps, self.g.apted_tree())
 
 
-class CastType(object):
+class CastType(SlotState):
+    __slots__ = ("kind", "m_gc")
+
     def __init__(self, kind, m_gc):
         assert m_gc is None or isinstance(m_gc, GExp)
         self.kind = kind
@@ -198,7 +228,10 @@ class CastType(object):
             return "{{CT{}{{{}}}}}".format(self.kind, self.m_gc.apted_tree())
 
 
-class GlobDecl(object):
+class GlobDecl(SlotState):
+    __slots__ = ("name", "bk", "m_gc", "gc")
+    _binders = ("name",)
+
     def __init__(self, name, bk, m_gc, gc):
         assert isinstance(name, Name)
         # binding kind?
@@ -218,6 +251,8 @@ class GRef(GExp):
       (** An identifier that represents a reference to an object defined
           either in the (global) environment or in the (local) context. *)
     """
+    __slots__ = ("gref", "levs")
+
     def __init__(self, gref, levs):
         assert isinstance(gref, GlobalReference)
         super().__init__()
@@ -236,6 +271,8 @@ class GVar(GExp):
       (** An identifier that cannot be regarded as "GRef".
           Bound variables are typically represented this way. *)
     """
+    __slots__ = ("x",)
+
     def __init__(self, x):
         assert isinstance(x, str)   # NOTE(deh): identifer object later?
         super().__init__()
@@ -251,6 +288,8 @@ class GVar(GExp):
 class GEvar(GExp):
     """| GEvar of Loc.t * existential_name * (Id.t * glob_constr) list
     """
+    __slots__ = ("ev", "id_and_globs")
+
     def __init__(self, ev, id_and_globs):
         assert isinstance(ev, str)   # NOTE(deh): existential_name object later?
         # TODO(deh): ignoring id_and_globs for now
@@ -268,6 +307,8 @@ class GEvar(GExp):
 class GPatVar(GExp):
     """| GPatVar of Loc.t * (bool * patvar) (** Used for patterns only *)
     """
+    __slots__ = ("b", "pv")
+
     def __init__(self, b, pv):
         assert isinstance(b, bool)
         assert isinstance(pv, str)    # NOTE(deh): patvar object later?
@@ -285,6 +326,8 @@ class GPatVar(GExp):
 class GApp(GExp):
     """| GApp of Loc.t * glob_constr * glob_constr list
     """
+    __slots__ = ("g", "gs", "iargs")
+
     def __init__(self, g, gs, iargs):
         assert isinstance(g, GExp)
         for g_p in gs:
@@ -304,6 +347,9 @@ class GApp(GExp):
 class GLambda(GExp):
     """| GLambda of Loc.t * Name.t * binding_kind *  glob_constr * glob_constr
     """
+    __slots__ = ("name", "bk", "g_ty", "g_bod")
+    _binders = ("name",)
+
     def __init__(self, name, bk, g_ty, g_bod):
         assert isinstance(name, Name)
         assert isinstance(bk, str)     # NOTE(deh): binding_kind object later?
@@ -325,6 +371,9 @@ class GLambda(GExp):
 class GProd(GExp):
     """| GProd of Loc.t * Name.t * binding_kind * glob_constr * glob_constr
     """
+    __slots__ = ("name", "bk", "g_ty", "g_bod")
+    _binders = ("name",)
+
     def __init__(self, name, bk, g_ty, g_bod):
         assert isinstance(name, Name)
         assert isinstance(bk, str)      # NOTE(deh): binding_kind object later?
@@ -346,6 +395,9 @@ class GProd(GExp):
 class GLetIn(GExp):
     """| GLetIn of Loc.t * Name.t * glob_constr * glob_constr
     """
+    __slots__ = ("name", "g1", "g2")
+    _binders = ("name",)
+
     def __init__(self, name, g1, g2):
         assert isinstance(name, Name)
         assert isinstance(g1, GExp)
@@ -366,6 +418,8 @@ class GCases(GExp):
     """| GCases of Loc.t * case_style * glob_constr option * tomatch_tuples * cases_clauses
       (** [GCases(l,style,r,tur,cc)] = "match 'tur' return 'r' with 'cc'" (in [MatchStyle]) *)
     """
+    __slots__ = ("csty", "m_g", "tmts", "ccs")
+
     def __init__(self, csty, m_g, tmts, ccs):
         assert isinstance(csty, str)    # NOTE(deh): cast style object later?
         assert m_g is None or isinstance(m_g, GExp)
@@ -394,6 +448,9 @@ class GLetTuple(GExp):
     """| GLetTuple of Loc.t * Name.t list * (Name.t * glob_constr option) *
       glob_constr * glob_constr
     """
+    __slots__ = ("names", "m_name_and_ty", "g1_fst", "g1_snd", "g2")
+    _binders = ("names",)
+
     def __init__(self, names, m_name_and_ty, g1, g2):
         for name in names:
             assert isinstance(name, Name)
@@ -423,6 +480,8 @@ class GLetTuple(GExp):
 class GIf(GExp):
     """| GIf of Loc.t * glob_constr * (Name.t * glob_constr option) * glob_constr * glob_constr
     """
+    __slots__ = ("g1", "m_name_and_ty", "g2", "g3")
+
     def __init__(self, g1, m_name_and_ty, g2, g3):
         assert isinstance(g1, GExp)
         assert isinstance(m_name_and_ty[0], Name)
@@ -446,6 +505,9 @@ class GRec(GExp):
     """| GRec of Loc.t * fix_kind * Id.t array * glob_decl list array *
       glob_constr array * glob_constr array
     """
+    __slots__ = ("fix_kind", "ids", "gdeclss", "gc_tys", "gc_bods")
+    _binders = ("ids",)
+
     def __init__(self, fix_kind, ids, gdeclss, gc_tys, gc_bods):
         # TODO(deh): ignoring fix_kind for now
         for ident in ids:
@@ -480,6 +542,8 @@ class GRec(GExp):
 class GSort(GExp):
     """| GSort of Loc.t * glob_sort
     """
+    __slots__ = ("gsort",)
+
     def __init__(self, gsort):
         super().__init__()
         self.gsort = gsort
@@ -494,6 +558,8 @@ class GSort(GExp):
 class GHole(GExp):
     """| GHole of (Loc.t * Evar_kinds.t * intro_pattern_naming_expr * Genarg.glob_generic_argument option)
     """
+    __slots__ = ("ek", "ipne", "m_ga")
+
     def __init__(self, ek, ipne, m_ga):
         super().__init__()
         self.ek = ek
@@ -510,6 +576,8 @@ class GHole(GExp):
 class GCast(GExp):
     """| GCast of Loc.t * glob_constr * glob_constr cast_type
     """
+    __slots__ = ("g", "g_cty")
+
     def __init__(self, g, g_cty):
         assert isinstance(g, GExp)
         assert isinstance(g_cty, CastType)
@@ -16,15 +16,24 @@
 from coq.glob_constr import *
 from coq.constr import Name, Inductive
 from lib.mysexpr import *
+from lib.myutil import LazyDict
 
 
 """
 [Note]
 
 Parse/Decode glob_constr (mid-level) AST.
+
+Table entries can be kept as raw strings. They are parsed into
+s-expressions only when first decoded, so mid-level data that is never
+looked up costs only the string.
 """
 
 
+# Dict[tuple, GlobalReference], global references are shared process-wide
+_GLOBAL_REFS = {}
+
+
 # -------------------------------------------------
 # Parsing glob_constr
 
@@ -46,6 +55,15 @@ class GlobConstrParser(object):
 
     def parse_global_reference(self, gr):
         tag, body = sexpr_unpack(gr)
+        key = (tag, sexpr_strify(body[0])) + tuple(body[1:])
+        try:
+            return _GLOBAL_REFS[key]
+        except KeyError:
+            gref = self._parse_global_reference(tag, body)
+            _GLOBAL_REFS[key] = gref
+            return gref
+
+    def _parse_global_reference(self, tag, body):
         if tag == "VR":
             return VarRef(sexpr_strify(body[0]))
         elif tag == "CR":
@@ -214,24 +232,73 @@ class GlobConstrParser(object):
 # Decoding ASTs
 
 class GlobConstrDecoder(object):
-    def __init__(self, mid_share):
+    def __init__(self, mid_share, f_lazy=False):
         # Internal state
-        self.mid_share = mid_share           # Dict[int, str]
+        self.mid_share = mid_share           # Dict[int, str or sexpr]
         self.parser = GlobConstrParser()
+        self._sexprs = {}                    # Dict[int, sexpr], parsed but not yet decoded
+        self.f_lazy = f_lazy                 # Decode on demand?
 
         # Shared representation
-        self.decoded = {}                    # Dict[int, GExp]
-        for key, entry in self.mid_share.items():
-            self.decode_glob_constr(key)
+        if f_lazy:
+            self.decoded = LazyDict(self._decode_key)   # Dict[int, GExp]
+        else:
+            self.decoded = {}                           # Dict[int, GExp]
+            for key, entry in self.mid_share.items():
+                self.decode_glob_constr(key)
 
     def decode_exp_by_key(self, key):
         return self.decoded[key]
 
+    def materialize(self):
+        """
+        Decode every entry in the table (the eager behaviour).
+        """
+        # NOTE: check the table itself since older pickles lack f_lazy
+        if isinstance(self.decoded, LazyDict):
+            for key in self.mid_share:
+                self.decode_glob_constr(key)
+            self.f_lazy = False
+            self.decoded = dict(self.decoded)
+        return self.decoded
+
+    def extend(self, mid_share):
+        """
+        Add entries appended to the table (e.g., by an incremental dump).
+        Only the new entries are decoded (on demand in lazy mode).
+        """
+        self.mid_share.update(mid_share)
+        if not isinstance(self.decoded, LazyDict):
+            for key in mid_share:
+                self.decode_glob_constr(key)
+
+    def _decode_key(self, key):
+        if key not in self.mid_share:
+            raise KeyError(key)
+        return self.decode_glob_constr(key)
+
+    def _sexpr(self, key):
+        entry = self.mid_share[key]
+        if type(entry) is not str:
+            return entry
+        # NOTE: older pickles lack _sexprs
+        sexprs = getattr(self, "_sexprs", None)
+        if sexprs is None:
+            sexprs = self._sexprs = {}
+        try:
+            return sexprs[key]
+        except KeyError:
+            sexpr = sexpr_loads(entry, true="true", false="false")
+            sexprs[key] = sexpr
+            return sexpr
+
     def _mkcon(self, key, gc):
         if key in self.decoded:
             return self.decoded[key]
         else:
             gc.tag = key
+            # Children are decoded first, so this only hashes the fields of gc
+            gc.digest
             self.decoded[key] = gc
             return gc
 
@@ -239,7 +306,73 @@ class GlobConstrDecoder(object):
         if key in self.decoded:
             return self.decoded[key]
 
-        tag, body = sexpr_unpack(self.mid_share[key])
+        # Decode in dependency order, so that _decode_node only looks up
+        # children that are already decoded (no recursion along term depth)
+        for key_p in self._post_order(key):
+            self._decode_node(key_p)
+            if type(self.mid_share[key_p]) is str:
+                del self._sexprs[key_p]
+        return self.decoded[key]
+
+    def _deps_of(self, key):
+        """Keys of the children of an entry (in the order they are decoded)"""
+        tag, body = sexpr_unpack(self._sexpr(key))
+        deps = []
+        dep = deps.append
+        if tag == "A":
+            deps.append(body[0])
+            deps += body[1]
+        elif tag == "L" or tag == "P":
+            deps += [body[2], body[3]]
+        elif tag == "LI":
+            deps += [body[1], body[2]]
+        elif tag == "C":
+            self.parser.parse_maybe(dep, body[1])
+            self.parser.parse_tomatch_tuples(dep, body[2])
+            self.parser.parse_case_clauses(dep, body[3])
+        elif tag == "LT":
+            self.parser.parse_maybe(dep, body[1][1])
+            deps += [body[2], body[3]]
+        elif tag == "I":
+            deps.append(body[0])
+            self.parser.parse_maybe(dep, body[1][1])
+            deps += [body[2], body[3]]
+        elif tag == "R":
+            self.parser.parse_glob_declss(dep, body[2])
+            deps += body[3]
+            deps += body[4]
+        elif tag == "T":
+            deps.append(body[0])
+            self.parser.parse_cast_type(dep, body[1])
+        return deps
+
+    def _post_order(self, root):
+        """
+        Iterative depth-first search with cycle detection.
+        Returns the undecoded entries reachable from root, children first.
+        """
+        done = set()
+        on_stk = {root}
+        order = []
+        stk = [(root, iter(self._deps_of(root)))]
+        while stk:
+            key, it = stk[-1]
+            for key_p in it:
+                if key_p in on_stk:
+                    raise NameError("Cycles detected in shared representation", key_p)
+                if key_p not in done and key_p not in self.decoded:
+                    on_stk.add(key_p)
+                    stk.append((key_p, iter(self._deps_of(key_p))))
+                    break
+            else:
+                stk.pop()
+                on_stk.discard(key)
+                done.add(key)
+                order.append(key)
+        return order
+
+    def _decode_node(self, key):
+        tag, body = sexpr_unpack(self._sexpr(key))
         if tag == "!":
             gref = self.parser.parse_global_reference(body[0])
             return self._mkcon(key, GRef(gref, []))
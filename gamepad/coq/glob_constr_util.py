@@ -13,7 +13,10 @@
 # limitations under the License.
 # ==============================================================================
 
+import numpy as np
+
 from coq.glob_constr import *
+from lib.mybulk import BulkDag, BulkTable
 
 
 # -------------------------------------------------
@@ -176,6 +179,155 @@ class HistGlobConstr(object):
         return COQGC_HIST.merges([self.hist(c) for c in cs])
 
 
+# -------------------------------------------------
+# Computing sizes and histograms of a whole table
+
+# Kind of glob_constr -> index in COQGC
+_GC_IDX = {kind: i for i, kind in enumerate(COQGC)}
+
+
+def _size_children(gc):
+    """Children counted by SizeGlobConstr and HistGlobConstr"""
+    ty = type(gc)
+    if ty is GApp:
+        return [gc.g] + gc.gs
+    elif ty is GLambda or ty is GProd:
+        return [gc.g_ty, gc.g_bod]
+    elif ty is GLetIn:
+        return [gc.g1, gc.g2]
+    elif ty is GCases:
+        return [cc.g for cc in gc.ccs]
+    elif ty is GLetTuple:
+        return [gc.g1_fst, gc.g1_snd, gc.g2]
+    elif ty is GIf:
+        return [gc.g1, gc.g2, gc.g3]
+    elif ty is GRec:
+        return gc.gc_tys + gc.gc_bods
+    elif ty is GCast:
+        return [gc.g]
+    elif ty in (GRef, GVar, GEvar, GPatVar, GSort, GHole):
+        return []
+    else:
+        raise NameError("Kind {} not supported".format(gc))
+
+
+def _add_tokens(gc, tokens):
+    """Tokens of one node, as collected by TokenGlobConstr"""
+    unique_sort, unique_const, unique_ind, unique_conid, unique_evar, unique_fix = tokens
+    ty = type(gc)
+    if ty is GRef:
+        gref = gc.gref
+        ty2 = type(gref)
+        if ty2 is VarRef:
+            unique_const.add(gref.x)
+        elif ty2 is ConstRef:
+            unique_const.add(gref.const)
+        elif ty2 is IndRef:
+            unique_ind.add(gref.ind.mutind)
+        elif ty2 is ConstructRef:
+            unique_ind.add(gref.ind.mutind)
+            unique_conid.add((gref.ind.mutind, gref.conid))
+        else:
+            raise NameError("Not supported", gref)
+    elif ty is GEvar:
+        unique_evar.add(gc.ev)
+    elif ty is GRec:
+        for ident in gc.ids:
+            unique_fix.add(ident)
+    elif ty is GSort:
+        unique_sort.add(gc.gsort)
+
+
+class BulkGlobConstr(BulkTable):
+    """Computes sizes, histograms and tokens of a whole decoded table in
+    one traversal.
+
+    sizes/noimp_sizes match SizeGlobConstr with f_cntiarg=True/False, hists
+    and count_args match HistGlobConstr, and tokens matches
+    TokenGlobConstr.tokenize.
+    """
+    def __init__(self, decoded):
+        super().__init__(decoded)
+        self.noimp_sizes = self.dag.tree_sizes(self.noimp_weights)
+
+    def build_dag(self, decoded):
+        kinds = []
+        child_ptr = [0]
+        childs = []
+        cnt_weights = []      # SizeGlobConstr only counts args zipped with iargs
+        noimp_weights = []    # ... which are not implicit if f_cntiarg=False
+        num_iargs = []
+        num_args = []
+        node_rows = {}        # Dict[id(GExp), (GExp, int)]
+        tokens = (set(), set(), set(), set(), set(), set())
+
+        for gc in decoded.values():
+            # Iterative post-order traversal
+            stk = [(gc, False)]
+            while stk:
+                gc_p, f_done = stk.pop()
+                if id(gc_p) in node_rows:
+                    continue
+                children = _size_children(gc_p)
+                if not f_done:
+                    stk.append((gc_p, True))
+                    for gc_c in children:
+                        if id(gc_c) not in node_rows:
+                            stk.append((gc_c, False))
+                    continue
+
+                node_rows[id(gc_p)] = (gc_p, len(kinds))
+                kinds.append(_GC_IDX[type(gc_p).__name__])
+                _add_tokens(gc_p, tokens)
+                childs += [node_rows[id(gc_c)][1] for gc_c in children]
+                child_ptr.append(len(childs))
+                if type(gc_p) is GApp:
+                    iargs = gc_p.iargs
+                    cnt_weights += [1] + [1 if j < len(iargs) else 0 for j in range(len(gc_p.gs))]
+                    noimp_weights += [1] + [1 if j < len(iargs) and iargs[j] is None else 0
+                                            for j in range(len(gc_p.gs))]
+                    num_iargs.append(sum(1 for iarg in iargs if iarg is not None))
+                    num_args.append(len(iargs))
+                else:
+                    cnt_weights += [1] * len(children)
+                    noimp_weights += [1] * len(children)
+                    num_iargs.append(0)
+                    num_args.append(0)
+
+        self.cnt_weights = np.array(cnt_weights, dtype=np.int64)
+        self.noimp_weights = np.array(noimp_weights, dtype=np.int64)
+        self.num_iargs = np.array(num_iargs, dtype=np.int64)
+        self.num_args = np.array(num_args, dtype=np.int64)
+        self._tokens = tokens
+        dag = BulkDag(kinds, child_ptr, childs, len(COQGC))
+        rows = {key: node_rows[id(gc)][1] for key, gc in decoded.items()}
+        return dag, rows
+
+    def _tree_sizes(self):
+        return self.dag.tree_sizes(self.cnt_weights)
+
+    def noimp_size(self, key):
+        return int(self.noimp_sizes[self.rows[key]])
+
+    def sum_noimp_sizes(self, keys):
+        return int(self.noimp_sizes[self.rows_of(keys)].sum())
+
+    def count_args(self, keys):
+        """
+        Number of implicit and of all arguments of the applications below
+        keys (each distinct application once, like HistGlobConstr).
+        """
+        mask = self.dag.reachable(self.rows_of(keys))
+        return int(self.num_iargs[mask].sum()), int(self.num_args[mask].sum())
+
+    def tokens(self):
+        """
+        Unique sorts, constants, inductives, constructors, evars and fixpoint
+        names of the table (like TokenGlobConstr.tokenize).
+        """
+        return self._tokens
+
+
 # -------------------------------------------------
 # Computing tokens in Coq glob_constr
 
@@ -14,6 +14,8 @@
 # ==============================================================================
 
 from lib.mysexpr import *
+from lib.mytramp import trampoline
+from lib.myutil import LRUCache
 
 
 """
@@ -21,15 +23,54 @@ from lib.mysexpr import *
 
 Get the free variables in a tactic.
 
+glob_constr and tactic expressions are traversed without recursion along
+their depth (see lib/mytramp.py).
+
+The same tactic text repeats across the before/after declarations of a
+call and across lemmas, so fvs_tac_str and fvs_glob_constr_cached memoize
+results (frozen) in bounded LRU caches. Caches are per process.
+
 WARNING(deh): experimental
 """
 
 
+# Bounded caches for FvsTactic results (sizes can be tuned with resize)
+FVS_TAC_CACHE = LRUCache(8192)          # raw tactic string -> (sexpr, lids, gids)
+FVS_GLOB_CONSTR_CACHE = LRUCache(8192)  # glob_constr sexpr -> (lids, gids)
+
+
+def _fvs_tac_str(ast_tac):
+    sexp_tac = sexpr_loads(ast_tac, true="true", false="false")
+    fvs = FvsTactic()
+    lids = fvs.fvs_tac(sexp_tac)
+    return sexp_tac, frozenset(lids), frozenset(fvs.globs)
+
+
+def fvs_tac_str(ast_tac):
+    """
+    Parse a tactic s-expression and get its local and global identifiers.
+    Returns (sexpr, frozenset of lids, frozenset of gids), shared between calls.
+    """
+    return FVS_TAC_CACHE.lookup(ast_tac, _fvs_tac_str)
+
+
+def _fvs_glob_constr(sexp_gc):
+    fvs = FvsTactic()
+    lids = fvs.fvs_glob_constr(sexp_gc)
+    return frozenset(lids), frozenset(fvs.globs)
+
+
+def fvs_glob_constr_cached(sexp_gc):
+    """Local and global identifiers (frozensets) of a glob_constr sexpr"""
+    return FVS_GLOB_CONSTR_CACHE.lookup(sexp_gc, _fvs_glob_constr)
+
+
 class FvsTactic(object):
     def __init__(self):
         self.globs = set()
 
-    def _log(self, msg):
+    def _log(self, msg, *args):
+        # NOTE: msg is only formatted when logging (raw can be a deep term)
         pass
 
     # -------------------------------------------------
@@ -50,6 +91,24 @@ class FvsTactic(object):
             acc = acc.union(fvs(x))
         return acc
 
+    # NOTE: _fvs_maybe and _fvs_ls are the versions for generators (fvs
+    # returns a generator), used by the traversals that run on trampoline
+
+    def _fvs_maybe(self, fvs, sexpr):
+        tag, body = sexpr_unpack(sexpr)
+        if tag == "N":
+            return set()
+        elif tag == "S":
+            return (yield fvs(body[0]))
+        else:
+            raise NameError("Tag {} not supported".format(tag))
+
+    def _fvs_ls(self, fvs, ls):
+        acc = set()
+        for x in ls:
+            acc = acc.union((yield fvs(x)))
+        return acc
+
     # -------------------------------------------------
     # glob_constr
 
@@ -70,7 +129,7 @@ class FvsTactic(object):
 
     def fvs_intro_pattern_expr(self, fvs, ipe):
         tag, body = sexpr_unpack(ipe)
-        self._log("@fvs_intro_pattern_expr | tag={}; raw={}".format(tag, ipe))
+        self._log("@fvs_intro_pattern_expr | tag={}; raw={}", tag, ipe)
         if tag == "F":
             return set()
         elif tag == "N":
@@ -82,7 +141,7 @@ class FvsTactic(object):
 
     def fvs_intro_pattern_naming_expr(self, ipne):
         tag, body = sexpr_unpack(ipne)
-        self._log("@fvs_intro_pattern_naming_expr | tag={}; raw={}".format(tag, ipne))
+        self._log("@fvs_intro_pattern_naming_expr | tag={}; raw={}", tag, ipne)
         if tag == "I":
             return self.fvs_id(body[0])
         elif tag == "F":
@@ -132,80 +191,90 @@ class FvsTactic(object):
             raise NameError("Tag {} not supported".format(tag))
 
     def fvs_cast_type(self, ct):
+        return trampoline(self._fvs_cast_type(ct))
+
+    def _fvs_cast_type(self, ct):
         tag, body = sexpr_unpack(ct)
         if tag == "C":
-            return self.fvs_glob_constr(body[0])
+            return (yield self._fvs_glob_constr(body[0]))
         elif tag == "VM":
-            return self.fvs_glob_constr(body[0])
+            return (yield self._fvs_glob_constr(body[0]))
         elif tag == "O":
             return set()
         elif tag == "N":
-            return self.fvs_glob_constr(body[0])
+            return (yield self._fvs_glob_constr(body[0]))
         else:
             raise NameError("Tag {} not supported".format(tag))
 
     def fvs_glob_constr(self, gc):
+        return trampoline(self._fvs_glob_constr(gc))
+
+    def _fvs_glob_constr(self, gc):
+        # NOTE: recursive calls go through trampoline (see lib/mytramp.py)
         tag, body = sexpr_unpack(gc)
-        self._log("@fvs_glob_constr | tag={}; raw={}".format(tag, gc))
+        self._log("@fvs_glob_constr | tag={}; raw={}", tag, gc)
         if tag == "!":
             return self.fvs_global_reference(body[0])
         elif tag == "V":
             return self.fvs_id(body[0])
         elif tag == "E":
             fvs0 = self.fvs_id(body[0])
-            fvs1 = self.fvs_glob_constrs(body[1])
+            fvs1 = yield from self._fvs_glob_constrs(body[1])
             return fvs0.union(fvs1)
         elif tag == "PV":
             return self.fvs_id(body[1])
         elif tag == "A":
-            fvs0 = self.fvs_glob_constr(body[0])
-            fvs1 = self.fvs_glob_constrs(body[1])
+            fvs0 = yield self._fvs_glob_constr(body[0])
+            fvs1 = yield from self._fvs_glob_constrs(body[1])
             return fvs0.union(fvs1)
         elif tag == "L":
-            fvs1 = self.fvs_glob_constr(body[2])
-            fvs2 = self.fvs_glob_constr(body[3])
+            fvs1 = yield self._fvs_glob_constr(body[2])
+            fvs2 = yield self._fvs_glob_constr(body[3])
             return fvs1.union(fvs2).difference(self.fvs_name(body[0]))
         elif tag == "P":
-            fvs1 = self.fvs_glob_constr(body[2])
-            fvs2 = self.fvs_glob_constr(body[3])
+            fvs1 = yield self._fvs_glob_constr(body[2])
+            fvs2 = yield self._fvs_glob_constr(body[3])
             return fvs1.union(fvs2).difference(self.fvs_name(body[0]))
         elif tag == "LI":
-            fvs1 = self.fvs_glob_constr(body[1])
-            fvs2 = self.fvs_glob_constr(body[2])
+            fvs1 = yield self._fvs_glob_constr(body[1])
+            fvs2 = yield self._fvs_glob_constr(body[2])
             return fvs1.union(fvs2).difference(self.fvs_name(body[0]))
         elif tag == "C":
-            fvs0 = self.fvs_maybe(self.fvs_glob_constr, body[1])
-            fvs1 = self.fvs_tomatch_tuples(body[2])
-            fvs2 = self.fvs_case_clauses(body[3])
+            fvs0 = yield from self._fvs_maybe(self._fvs_glob_constr, body[1])
+            fvs1 = yield from self._fvs_tomatch_tuples(body[2])
+            fvs2 = yield from self._fvs_case_clauses(body[3])
             return fvs0.union(fvs2).difference(fvs1)
         elif tag == "LT":
             bnd0 = self.fvs_ls(lambda x: sexpr_strify(x), body[0])
-            fvs2 = self.fvs_glob_constr(body[2])
-            fvs3 = self.fvs_glob_constr(body[3])
+            fvs2 = yield self._fvs_glob_constr(body[2])
+            fvs3 = yield self._fvs_glob_constr(body[3])
             return fvs2.union(fvs3.difference(bnd0))
         elif tag == "I":
-            fvs0 = self.fvs_glob_constr(body[0])
-            fvs1 = self.fvs_glob_constr(body[1])
-            fvs2 = self.fvs_glob_constr(body[2])
+            fvs0 = yield self._fvs_glob_constr(body[0])
+            fvs1 = yield self._fvs_glob_constr(body[1])
+            fvs2 = yield self._fvs_glob_constr(body[2])
             return fvs0.union(fvs1).union(fvs2)
         elif tag == "R":
             bnd = self.fvs_ls(self.fvs_id, body[1])
-            fvs3 = self.fvs_glob_constrs(body[3])
-            fvs4 = self.fvs_glob_constrs(body[4])
+            fvs3 = yield from self._fvs_glob_constrs(body[3])
+            fvs4 = yield from self._fvs_glob_constrs(body[4])
             return fvs3.union(fvs4).difference(bnd)
         elif tag == "S":
             return set()
         elif tag == "H":
             return self.fvs_intro_pattern_naming_expr(body[1])
         elif tag == "T":
-            fvs0 = self.fvs_glob_constr(body[0])
-            fvs1 = self.fvs_cast_type(body[1])
+            fvs0 = yield self._fvs_glob_constr(body[0])
+            fvs1 = yield from self._fvs_cast_type(body[1])
             return fvs0.union(fvs1)
         else:
             raise NameError("Tag {} not supported".format(tag))
 
     def fvs_glob_constrs(self, gcs):
-        return self.fvs_ls(self.fvs_glob_constr, gcs)
+        return trampoline(self._fvs_glob_constrs(gcs))
+
+    def _fvs_glob_constrs(self, gcs):
+        return (yield from self._fvs_ls(self._fvs_glob_constr, gcs))
 
     def fvs_gtrm(self, gtrm):
         return self.fvs_glob_constr(gtrm)
@@ -227,22 +296,34 @@ class FvsTactic(object):
         return fvs0.union(fvs1)
 
     def fvs_tomatch_tuple(self, tmt):
-        fvs0 = self.fvs_glob_constr(tmt[0])
+        return trampoline(self._fvs_tomatch_tuple(tmt))
+
+    def _fvs_tomatch_tuple(self, tmt):
+        fvs0 = yield self._fvs_glob_constr(tmt[0])
         fvs1 = self.fvs_predicate_pattern(tmt[1])
         return fvs0.union(fvs1)
 
     def fvs_tomatch_tuples(self, tmts):
-        return self.fvs_ls(self.fvs_tomatch_tuple, tmts)
+        return trampoline(self._fvs_tomatch_tuples(tmts))
+
+    def _fvs_tomatch_tuples(self, tmts):
+        return (yield from self._fvs_ls(self._fvs_tomatch_tuple, tmts))
 
     def fvs_case_clause(self, cc):
+        return trampoline(self._fvs_case_clause(cc))
+
+    def _fvs_case_clause(self, cc):
         body = cc
         fvs0 = self.fvs_ls(self.fvs_id, body[0])
         fvs1 = self.fvs_ls(self.fvs_cases_pattern, body[1])
-        fvs2 = self.fvs_glob_constr(body[2])
+        fvs2 = yield self._fvs_glob_constr(body[2])
         return fvs0.union(fvs1).union(fvs2)
 
     def fvs_case_clauses(self, ccs):
-        return self.fvs_ls(self.fvs_case_clause, ccs)
+        return trampoline(self._fvs_case_clauses(ccs))
+
+    def _fvs_case_clauses(self, ccs):
+        return (yield from self._fvs_ls(self._fvs_case_clause, ccs))
 
     # -------------------------------------------------
     # Tactics
@@ -368,7 +449,7 @@ class FvsTactic(object):
 
     def fvs_generic_arg(self, garg):
         tag, body = sexpr_unpack(garg)
-        self._log("@fvs_generic_arg | tag={}; raw={}".format(tag, garg))
+        self._log("@fvs_generic_arg | tag={}; raw={}", tag, garg)
         if tag == "L":
             return self.fvs_ls(self.fvs_generic_arg, body[0])
         elif tag == "O":
@@ -396,7 +477,7 @@ class FvsTactic(object):
 
     def fvs_may_eval(self, me):
         tag, body = sexpr_unpack(me)
-        self._log("@fvs_may_eval | tag={}; raw={}".format(tag, me))
+        self._log("@fvs_may_eval | tag={}; raw={}", tag, me)
         if tag == "E":
             return self.fvs_gtrm(body[1])
         elif tag == "C":
@@ -410,7 +491,7 @@ class FvsTactic(object):
 
     def fvs_tactic_arg(self, targ):
         tag, body = sexpr_unpack(targ)
-        self._log("@fvs_tactic_arg | tag={}; raw={}".format(tag, targ))
+        self._log("@fvs_tactic_arg | tag={}; raw={}", tag, targ)
         if tag == "G":
             return self.fvs_generic_arg(body[0])
         elif tag == "ME":
@@ -463,7 +544,7 @@ class FvsTactic(object):
 
     def fvs_atomic_tac(self, atac):
         tag, body = sexpr_unpack(atac)
-        self._log("@fvs_atomic_tac | tag={}; raw={}".format(tag, atac))
+        self._log("@fvs_atomic_tac | tag={}; raw={}", tag, atac)
         if tag == "IntroPattern":
             return self.fvs_ls(lambda x: self.fvs_intro_pattern_expr(self.fvs_gtrm, x), body[1])
         elif tag == "Apply":
@@ -518,72 +599,76 @@ class FvsTactic(object):
             raise NameError("Tag {} not supported".format(tag))
 
     def fvs_tac(self, tac):
+        return trampoline(self._fvs_tac(tac))
+
+    def _fvs_tac(self, tac):
+        # NOTE: recursive calls go through trampoline (see lib/mytramp.py)
         if tac is None:
             return set()
         tag, body = sexpr_unpack(tac)
-        self._log("@fvs_tac | tag={}; raw={}".format(tag, tac))
+        self._log("@fvs_tac | tag={}; raw={}", tag, tac)
         if tag == "Atom":
             return self.fvs_atomic_tac(body[0])
         elif tag == "Then":
-            fvs0 = self.fvs_tac(body[0])
-            fvs1 = self.fvs_tac(body[1])
+            fvs0 = yield self._fvs_tac(body[0])
+            fvs1 = yield self._fvs_tac(body[1])
             return fvs0.union(fvs1)
         elif tag == "Dispatch":
-            return self.fvs_tacs(body[0])
+            return (yield from self._fvs_tacs(body[0]))
         elif tag == "ExtendTac":
-            fvs0 = self.fvs_tacs(body[0])
-            fvs1 = self.fvs_tac(body[1])
-            fvs2 = self.fvs_tacs(body[0])
+            fvs0 = yield from self._fvs_tacs(body[0])
+            fvs1 = yield self._fvs_tac(body[1])
+            fvs2 = yield from self._fvs_tacs(body[0])
             return fvs0.union(fvs1).union(fvs2)
         elif tag == "Thens":
-            fvs0 = self.fvs_tac(body[0])
-            fvs1 = self.fvs_tacs(body[1])
+            fvs0 = yield self._fvs_tac(body[0])
+            fvs1 = yield from self._fvs_tacs(body[1])
             return fvs0.union(fvs1)
         elif tag == "Thens3parts":
-            fvs0 = self.fvs_tac(body[0])
-            fvs1 = self.fvs_tacs(body[1])
-            fvs2 = self.fvs_tac(body[2])
-            fvs3 = self.fvs_tac(body[3])
+            fvs0 = yield self._fvs_tac(body[0])
+            fvs1 = yield from self._fvs_tacs(body[1])
+            fvs2 = yield self._fvs_tac(body[2])
+            fvs3 = yield self._fvs_tac(body[3])
             return fvs0.union(fvs1).union(fvs2).union(fvs3)
         elif tag == "First":
-            return self.fvs_tacs(body[0])
+            return (yield from self._fvs_tacs(body[0]))
         elif tag == "Complete":
-            return self.fvs_tac(body[0])
+            return (yield self._fvs_tac(body[0]))
         elif tag == "Solve":
-            return self.fvs_tacs(body[0])
+            return (yield from self._fvs_tacs(body[0]))
         elif tag == "Try":
-            return self.fvs_tac(body[0])
+            return (yield self._fvs_tac(body[0]))
         elif tag == "Or":
-            fvs0 = self.fvs_tac(body[0])
-            fvs1 = self.fvs_tac(body[1])
+            fvs0 = yield self._fvs_tac(body[0])
+            fvs1 = yield self._fvs_tac(body[1])
             return self.fvs_tac(fvs0).union(fvs1)
         elif tag == "Once":
-            return self.fvs_tac(body[0])
+            return (yield self._fvs_tac(body[0]))
         elif tag == "ExactlyOnce":
-            return self.fvs_tac(body[0])
+            return (yield self._fvs_tac(body[0]))
         elif tag == "IfThenCatch":
-            fvs0 = self.fvs_tac(body[0])
-            fvs1 = self.fvs_tac(body[1])
-            fvs2 = self.fvs_tac(body[2])
+            fvs0 = yield self._fvs_tac(body[0])
+            fvs1 = yield self._fvs_tac(body[1])
+            fvs2 = yield self._fvs_tac(body[2])
             return fvs0.union(fvs1).union(fvs2)
         elif tag == "Orelse":
-            fvs0 = self.fvs_tac(body[0])
-            fvs1 = self.fvs_tac(body[1])
+            fvs0 = yield self._fvs_tac(body[0])
+            fvs1 = yield self._fvs_tac(body[1])
             return fvs0.union(fvs1)
         elif tag == "Do":
-            return self.fvs_tac(body[1])
+            return (yield self._fvs_tac(body[1]))
         elif tag == "Timeout":
-            return self.fvs_tac(body[1])
+            return (yield self._fvs_tac(body[1]))
         elif tag == "Time":
-            return self.fvs_tac(body[1])
+            return (yield self._fvs_tac(body[1]))
         elif tag == "Repeat":
-            return self.fvs_tac(body[0])
+            return (yield self._fvs_tac(body[0]))
         elif tag == "Progress":
-            return self.fvs_tac(body[0])
+            return (yield self._fvs_tac(body[0]))
         elif tag == "ShowHyps":
-            return self.fvs_tac(body[0])
+            return (yield self._fvs_tac(body[0]))
         elif tag == "Abstract":
-            fvs0 = self.fvs_tac(body[0])
+            fvs0 = yield self._fvs_tac(body[0])
             fvs1 = self.fvs_maybe(self.fvs_id, body[1])
             return fvs0.union(fvs1)
         elif tag == "Id":
@@ -591,26 +676,26 @@ class FvsTactic(object):
         elif tag == "Fail":
             return set()
         elif tag == "Info":
-            return self.fvs_tac(body[0])
+            return (yield self._fvs_tac(body[0]))
         elif tag == "Let":
             bnd = self.fvs_ls(lambda x: self.fvs_id(x[0]), body[1])
             fvs1 = self.fvs_ls(lambda x: self.fvs_tactic_arg(x[1]), body[1])
-            fvs2 = self.fvs_tac(body[2])
+            fvs2 = yield self._fvs_tac(body[2])
             return fvs1.union(fvs2.difference(bnd))
         elif tag == "Match":
-            fvs1 = self.fvs_tac(body[1])
+            fvs1 = yield self._fvs_tac(body[1])
             fvs2 = self.fvs_match_rules(lambda x: self.fvs_gtrm(x[1]), self.fvs_tac, body[2])
             return fvs1.union(fvs2)
         elif tag == "MatchGoal":
             return self.fvs_match_rules(lambda x: self.fvs_gtrm(x[1]), self.fvs_tac, body[2])
         elif tag == "Fun":
             bnd0 = self.fvs_ls(lambda x: self.fvs_maybe(self.fvs_id, x), body[0])
-            fvs1 = self.fvs_tac(body[1])
+            fvs1 = yield self._fvs_tac(body[1])
             return fvs1.difference(bnd0)
         elif tag == "Arg":
             return self.fvs_tactic_arg(body[0])
         elif tag == "Select":
-            fvs2 = self.fvs_tac(body[1])
+            fvs2 = yield self._fvs_tac(body[1])
             return fvs2
         elif tag == "ML":
             return self.fvs_tactic_args(body[1])
@@ -620,7 +705,10 @@ class FvsTactic(object):
             raise NameError("Tag {} not supported".format(tag))
 
     def fvs_tacs(self, tacs):
-        return self.fvs_ls(self.fvs_tac, tacs)
+        return trampoline(self._fvs_tacs(tacs))
+
+    def _fvs_tacs(self, tacs):
+        return (yield from self._fvs_ls(self._fvs_tac, tacs))
 
     # -------------------------------------------------
     # Ssreflect tactics
@@ -630,7 +718,7 @@ class FvsTactic(object):
 
     def fvs_pattern(self, pat):
         tag, body = sexpr_unpack(pat)
-        self._log("@fvs_pattern | tag={}; raw={}".format(tag, pat))
+        self._log("@fvs_pattern | tag={}; raw={}", tag, pat)
         if tag == "T":
             return self.fvs_term(body[0])
         elif tag == "IT":
@@ -0,0 +1,265 @@
+# Copyright 2018 The GamePad Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import numpy as np
+
+
+"""
+[Note]
+
+Whole-table (bulk) analyses of an AST table, stored as a DAG in CSR form
+(node i has children childs[child_ptr[i]:child_ptr[i+1]]).
+
+Nodes are grouped by height (leaves have height 0). A node only depends on
+nodes of smaller height, so
+per-node quantities are computed one level at a time, each level with a few
+array operations:
+1. tree sizes     size[i] = 1 + sum of the sizes of its children
+                  (optionally weighted per edge)
+2. histograms     hist[i] = delta(kind[i]) + sum of the hists of its children
+3. shared sizes   number of distinct nodes below i (bitsets, O(n^2 / 64))
+For a set of roots (e.g., the context and conclusion of a tactic state),
+union_size counts the distinct nodes below any of them, by marking visited
+nodes (level by level, or with a plain stack when the union is known to be
+small). Marks are stamped with a counter, so the marks are reused across
+calls without clearing them (O(union) per call).
+Tree sizes and histograms count shared subterms once per occurrence, like
+the recursive analyses in coq/constr_util.py. With a lot of sharing, they
+can exceed 64 bits, in which case the sweep switches to Python ints.
+"""
+
+
+# Sums of a level are computed with int64 while they stay below this
+_SAFE = 2 ** 62
+
+# Unions of terms with a smaller tree size are counted with a plain stack
+_SMALL = 1024
+
+
+def _gather(ptr, rows):
+    """
+    Positions ptr[r] .. ptr[r+1]-1 for every r in rows (concatenated),
+    and where the range of each row starts.
+    """
+    lo = ptr[rows]
+    cnt = ptr[rows + 1] - lo
+    starts = np.cumsum(cnt) - cnt
+    pos = np.arange(cnt.sum(), dtype=np.int64) - np.repeat(starts - lo, cnt)
+    return pos, starts
+
+
+def _widen(acc, vals, max_deg):
+    """Switch to Python ints if summing max_deg of vals may overflow"""
+    if acc.dtype != object and vals.max() > _SAFE // max_deg:
+        return acc.astype(object), vals.astype(object)
+    return acc, vals
+
+
+class BulkDag(object):
+    def __init__(self, kinds, child_ptr, childs, num_kinds):
+        self.kinds = np.asarray(kinds, dtype=np.int64)           # kind of node
+        self.child_ptr = np.asarray(child_ptr, dtype=np.int64)   # CSR offsets
+        self.childs = np.asarray(childs, dtype=np.int64)         # children
+        self.num_kinds = num_kinds
+        self._levels()
+
+        # Visited marks for union_size (node i is visited if mark[i] == epoch)
+        self._mark = None
+        self._epoch = 0
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def _levels(self):
+        """
+        Group nodes by height. Heights are found in one pass, which relies on
+        nodes being numbered children-first (as the table builders do).
+        """
+        n = len(self.kinds)
+        num_children = np.diff(self.child_ptr)
+        parents = np.repeat(np.arange(n, dtype=np.int64), num_children)
+        if np.any(self.childs >= parents):
+            raise NameError("Nodes must be numbered children-first")
+
+        child_ptr = self.child_ptr.tolist()
+        childs = self.childs.tolist()
+        heights = [0] * n
+        for i in range(n):
+            lo, hi = child_ptr[i], child_ptr[i + 1]
+            if lo < hi:
+                heights[i] = 1 + max([heights[j] for j in childs[lo:hi]])
+        self.heights = np.array(heights, dtype=np.int64)
+
+        # Internal nodes by height, with the positions of their edges
+        order = np.argsort(self.heights, kind='mergesort')   # stable
+        order = order[self.heights[order] > 0]
+        pos, starts = _gather(self.child_ptr, order)
+        bounds = np.flatnonzero(np.diff(self.heights[order])) + 1
+        lo_nodes = [0] + bounds.tolist()
+        hi_nodes = bounds.tolist() + [len(order)]
+        self.levels = []     # List[(nodes, edge positions, starts, max #children)]
+        for lo, hi in zip(lo_nodes, hi_nodes):
+            if lo == hi:
+                continue
+            lo_pos = starts[lo]
+            hi_pos = starts[hi] if hi < len(order) else len(pos)
+            nodes = order[lo:hi]
+            self.levels.append((nodes, pos[lo_pos:hi_pos], starts[lo:hi] - lo_pos,
+                                int(num_children[nodes].max())))
+
+    # -------------------------------------------------
+    # Per-node analyses
+
+    def tree_sizes(self, weights=None):
+        """Size of the tree under each node (weights: per edge, e.g., 0 to skip)"""
+        sizes = np.ones(len(self.kinds), dtype=np.int64)
+        for nodes, pos, starts, max_deg in self.levels:
+            vals = sizes[self.childs[pos]]
+            if weights is not None:
+                vals = vals * weights[pos]
+            sizes, vals = _widen(sizes, vals, max_deg)
+            sizes[nodes] += np.add.reduceat(vals, starts)
+        return sizes
+
+    def hists(self):
+        """Histogram of kinds under each node (a row per node)"""
+        n = len(self.kinds)
+        hists = np.zeros((n, self.num_kinds), dtype=np.int64)
+        hists[np.arange(n), self.kinds] = 1
+        for nodes, pos, starts, max_deg in self.levels:
+            hists, vals = _widen(hists, hists[self.childs[pos]], max_deg)
+            hists[nodes] += np.add.reduceat(vals, starts, axis=0)
+        return hists
+
+    def shared_sizes(self):
+        """Number of distinct nodes under each node (itself included)"""
+        n = len(self.kinds)
+        reach = np.zeros((n, (n + 63) // 64), dtype=np.uint64)
+        idxs = np.arange(n)
+        reach[idxs, idxs // 64] = np.left_shift(np.uint64(1), (idxs % 64).astype(np.uint64))
+        for nodes, pos, starts, _ in self.levels:
+            reach[nodes] |= np.bitwise_or.reduceat(reach[self.childs[pos]], starts, axis=0)
+        return np.unpackbits(reach.view(np.uint8), axis=1).sum(axis=1, dtype=np.int64)
+
+    def union_size(self, rows, f_small=False):
+        """
+        Number of distinct nodes under (and including) rows.
+        Set f_small if there are few (e.g., their tree sizes add up to less
+        than a thousand), which avoids the overhead of array operations.
+        """
+        if self._mark is None:
+            self._mark = np.zeros(len(self.kinds), dtype=np.int64)
+            self._mark_ls = [0] * len(self.kinds)
+            self._child_ptr_ls = self.child_ptr.tolist()
+            self._childs_ls = self.childs.tolist()
+        self._epoch += 1
+        epoch = self._epoch
+        if f_small:
+            return self._union_size_small(rows, epoch)
+
+        mark = self._mark
+        num_nodes = 0
+        frontier = np.unique(np.asarray(rows, dtype=np.int64))
+        while len(frontier) > 0:
+            mark[frontier] = epoch
+            num_nodes += len(frontier)
+            pos, _ = _gather(self.child_ptr, frontier)
+            frontier = np.unique(self.childs[pos])
+            frontier = frontier[mark[frontier] != epoch]
+        return num_nodes
+
+    def _union_size_small(self, rows, epoch):
+        mark = self._mark_ls
+        child_ptr = self._child_ptr_ls
+        childs = self._childs_ls
+        num_nodes = 0
+        stk = [int(row) for row in rows]
+        while stk:
+            i = stk.pop()
+            if mark[i] != epoch:
+                mark[i] = epoch
+                num_nodes += 1
+                stk += childs[child_ptr[i]:child_ptr[i + 1]]
+        return num_nodes
+
+    def reachable(self, rows):
+        """Mask of the nodes under (and including) rows"""
+        mask = np.zeros(len(self.kinds), dtype=bool)
+        frontier = np.unique(np.asarray(rows, dtype=np.int64))
+        while len(frontier) > 0:
+            mask[frontier] = True
+            pos, _ = _gather(self.child_ptr, frontier)
+            frontier = np.unique(self.childs[pos])
+            frontier = frontier[~mask[frontier]]
+        return mask
+
+
+class BulkTable(object):
+    """
+    Bulk analyses of a decoded table (Dict[key, node]), looked up by key.
+    Subclasses build the DAG (build_dag) and may weight edges (_tree_sizes).
+    """
+    def __init__(self, decoded):
+        self.dag, self.rows = self.build_dag(decoded)   # BulkDag, Dict[key, int]
+        self.sizes = self._tree_sizes()                 # np.int64[n]
+        self.hists = self.dag.hists()                   # np.int64[n, num_kinds]
+        self._shared_sizes = None
+
+    def build_dag(self, decoded):
+        # Abstract hook: returns the BulkDag of decoded and the row of each key
+        raise NotImplementedError
+
+    def _tree_sizes(self):
+        return self.dag.tree_sizes()
+
+    @property
+    def shared_sizes(self):
+        if self._shared_sizes is None:
+            self._shared_sizes = self.dag.shared_sizes()
+        return self._shared_sizes
+
+    def row(self, key):
+        return self.rows[key]
+
+    def rows_of(self, keys):
+        return np.array([self.rows[key] for key in keys], dtype=np.int64)
+
+    def size(self, key):
+        return int(self.sizes[self.rows[key]])
+
+    def shared_size(self, key):
+        if self._shared_sizes is not None:
+            return int(self._shared_sizes[self.rows[key]])
+        row = self.rows[key]
+        return self.dag.union_size([row], f_small=self.sizes[row] < _SMALL)
+
+    def hist(self, key):
+        return self.hists[self.rows[key]].tolist()
+
+    def sum_sizes(self, keys):
+        return int(self.sizes[self.rows_of(keys)].sum())
+
+    def root_sizes(self, keys):
+        """
+        Sizes of the terms keys (e.g., a tactic state) as trees and as a DAG:
+        the sum of their tree sizes (a key listed twice counts twice), and
+        the number of distinct nodes below any of them.
+        """
+        rows = self.rows_of(keys)
+        size = int(self.sizes[rows].sum())
+        return size, self.dag.union_size(rows, f_small=size < _SMALL)
+
+    def sum_hists(self, keys):
+        return self.hists[self.rows_of(keys)].sum(axis=0).tolist()
@@ -0,0 +1,205 @@
+# Copyright 2018 The GamePad Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from hashlib import blake2b
+
+from lib.myutil import SlotState
+
+
+"""
+[Note]
+
+Merkle-style structural digests for AST nodes.
+
+The digest of a node is a hash of its class name and its fields, where
+a child node contributes its own digest. Digests are computed bottom-up
+(decoders compute them as nodes are created), so computing the digest of
+a node only looks at its own fields. Hashing and equality of nodes are
+then O(1), also on DAGs with a lot of sharing.
+
+There are two variants:
+1. digest   exact (includes binder names)
+2. adigest  ignores binder names (the fields listed in _binders)
+For kernel terms (de Bruijn indices), equal adigest means alpha-equivalent.
+
+The node tag (its key in the decoded table) is not part of the digest.
+Digests are cached in slots starting with _, so they are not pickled and
+are recomputed on demand after loading.
+"""
+
+
+DIGEST_SIZE = 16
+
+
+class StructDigest(SlotState):
+    __slots__ = ("_digest", "_adigest")
+
+    # Fields that hold binder names (ignored by adigest)
+    _binders = ()
+
+    # -------------------------------------------------
+    # Digests
+
+    @property
+    def digest(self):
+        try:
+            return self._digest
+        except AttributeError:
+            _compute_digests(self, False)
+            return self._digest
+
+    @property
+    def adigest(self):
+        try:
+            return self._adigest
+        except AttributeError:
+            _compute_digests(self, True)
+            return self._adigest
+
+    def alpha_eq(self, other):
+        """Equality up to binder names"""
+        return self is other or (isinstance(other, StructDigest) and
+                                 self.adigest == other.adigest)
+
+    def __eq__(self, other):
+        return self is other or (isinstance(other, StructDigest) and
+                                 self.digest == other.digest)
+
+    def __hash__(self):
+        # NOTE: bytes cache their hash
+        return hash(self.digest)
+
+
+# -------------------------------------------------
+# Computing digests
+
+# Dict[type, tuple of (field, is_binder)]
+_FIELDS = {}
+
+
+def _fields(cls):
+    try:
+        return _FIELDS[cls]
+    except KeyError:
+        binders = set(getattr(cls, "_binders", ()))
+        fields = tuple((name, name in binders) for name in cls.slot_names()
+                       if name != "tag")
+        _FIELDS[cls] = fields
+        return fields
+
+
+# Dict[type, kind of value]
+_NODE, _STR, _SEQ, _HELPER, _ATOM = range(5)
+_KINDS = {}
+
+
+def _kind(ty):
+    try:
+        return _KINDS[ty]
+    except KeyError:
+        if issubclass(ty, StructDigest):
+            kind = _NODE
+        elif issubclass(ty, str):
+            kind = _STR
+        elif issubclass(ty, (list, tuple)):
+            kind = _SEQ
+        elif issubclass(ty, SlotState):
+            kind = _HELPER
+        else:
+            kind = _ATOM
+        _KINDS[ty] = kind
+        return kind
+
+
+def _children(v, acc):
+    """Accumulate the nodes directly mentioned by value v"""
+    kind = _kind(type(v))
+    if kind == _NODE:
+        acc.append(v)
+    elif kind == _SEQ:
+        for x in v:
+            _children(x, acc)
+    elif kind == _HELPER:
+        for name, _ in _fields(type(v)):
+            _children(getattr(v, name, None), acc)
+
+
+def _encode(v, attr, f_alpha, acc):
+    # NOTE: raises AttributeError if a child node does not have a digest yet
+    kind = _kind(type(v))
+    if kind == _NODE:
+        acc.append(b"#")
+        acc.append(getattr(v, attr))
+    elif kind == _STR:
+        b = v.encode('utf-8')
+        acc.append(b"s%d:" % len(b))
+        acc.append(b)
+    elif kind == _SEQ:
+        acc.append(b"l%d:" % len(v))
+        for x in v:
+            _encode(x, attr, f_alpha, acc)
+    elif kind == _HELPER:
+        # Helper objects (Name, Inductive, patterns, ...)
+        _encode_fields(v, attr, f_alpha, acc)
+    else:
+        # int, bool, None, Enum, ...
+        b = repr(v).encode('utf-8')
+        acc.append(b"r%d:" % len(b))
+        acc.append(b)
+
+
+def _encode_fields(v, attr, f_alpha, acc):
+    cls = type(v)
+    acc.append(b"(")
+    acc.append(cls.__name__.encode('utf-8'))
+    fields = _fields(cls)
+    if hasattr(cls, "_digest_values"):
+        # Helper supplies canonical values for its fields
+        values = v._digest_values()
+    else:
+        values = [getattr(v, name, None) for name, _ in fields]
+    for (name, f_binder), x in zip(fields, values):
+        if f_alpha and f_binder:
+            acc.append(b"_")
+        else:
+            _encode(x, attr, f_alpha, acc)
+    acc.append(b")")
+
+
+def _compute_digests(root, f_alpha):
+    """
+    Compute the digest of root and of every node below it that does not
+    have one yet (children first, without recursion).
+    """
+    attr = "_adigest" if f_alpha else "_digest"
+    stk = [root]
+    while stk:
+        node = stk[-1]
+        try:
+            acc = []
+            _encode_fields(node, attr, f_alpha, acc)
+        except AttributeError:
+            # Some children are not digested yet
+            children = []
+            for name, _ in _fields(type(node)):
+                _children(getattr(node, name, None), children)
+            missing = [child for child in children if not hasattr(child, attr)]
+            if not missing:
+                raise
+            stk += missing
+            continue
+        stk.pop()
+        if not hasattr(node, attr):
+            setattr(node, attr, blake2b(b"".join(acc), digest_size=DIGEST_SIZE).digest())
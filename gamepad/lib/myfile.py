@@ -13,6 +13,9 @@
 # limitations under the License.
 # ==============================================================================
 
+import mmap
+import os
+
 
 class MyFile(object):
     """
@@ -66,3 +69,156 @@ class MyFile(object):
         lines = sum(buf.count(b'\n') for buf in f_gen)
         f.close()
         return lines
+
+
+class MMapFile(object):
+    """
+    Memory-mapped line cursor with the same interface as MyFile.
+
+    Lines are located with byte offsets into an mmap of the file, so peeking
+    decodes a line at most once and consuming a peeked line is free. Progress
+    is measured in bytes, which avoids a separate pass to count lines.
+
+    The cursor can be restricted to the byte range [start, end) of the file,
+    e.g., a single section of a build.log. Offsets are always absolute.
+    """
+    def __init__(self, filename, start=0, end=None):
+        self.filename = filename
+        self.f_head = open(filename, 'rb')
+        file_size = os.fstat(self.f_head.fileno()).st_size
+        if file_size == 0:
+            # Cannot mmap an empty file
+            self.buf = b""
+        else:
+            self.buf = mmap.mmap(self.f_head.fileno(), 0, access=mmap.ACCESS_READ)
+        self.start = min(start, file_size)   # byte offset of window start
+        self.end = end                       # None if the window grows with the file
+        if end is None:
+            self.size = file_size            # byte offset of window end
+        else:
+            self.size = max(self.start, min(end, file_size))
+        self.pos = self.start    # byte offset of current line
+        self.line = 0            # line number of current line (in window)
+
+        # Cache of the last peeked line
+        self._peek_pos = -1
+        self._peek_end = 0
+        self._peek = ""
+
+    def __del__(self):
+        # NOTE: __init__ may have failed to open the file
+        if hasattr(self, "buf"):
+            self.close()
+
+    def close(self):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+            self.buf = b""
+        if not self.f_head.closed:
+            self.f_head.close()
+
+    def refresh(self):
+        """
+        Pick up bytes appended to the file since it was mapped (only when the
+        window is not bounded). Returns True if the file grew.
+        """
+        if self.end is not None:
+            return False
+        file_size = os.fstat(self.f_head.fileno()).st_size
+        if file_size < self.size:
+            raise NameError("{} was truncated while reading".format(self.filename))
+        elif file_size == self.size:
+            return False
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+        self.buf = mmap.mmap(self.f_head.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = file_size
+
+        # The last peeked line may have been partial
+        self._peek_pos = -1
+        return True
+
+    def progress(self):
+        if self.size == self.start:
+            return 100.0
+        return (100.0 * (self.pos - self.start)) / (self.size - self.start)
+
+    def _fetch(self):
+        if self._peek_pos != self.pos:
+            end = self.buf.find(b'\n', self.pos, self.size)
+            if end == -1:
+                end = self.size
+            else:
+                end += 1
+            self._peek = self.buf[self.pos:end].decode('utf-8')
+            self._peek_end = end
+            self._peek_pos = self.pos
+        return self._peek
+
+    def raw_consume_line(self):
+        line = self._fetch()
+        if self._peek_end > self.pos:
+            self.line += 1
+        self.pos = self._peek_end
+        return line
+
+    def consume_line(self):
+        return self.raw_consume_line().rstrip()
+
+    def raw_peek_line(self):
+        return self._fetch()
+
+    def peek_line(self):
+        return self._fetch().rstrip()
+
+    def advance_line(self):
+        self.raw_consume_line()
+        return self.peek_line()
+
+    def peek_startswith(self, prefix):
+        """
+        Check if the current line starts with prefix without decoding it.
+        """
+        b_prefix = prefix.encode('utf-8')
+        end = min(self.pos + len(b_prefix), self.size)
+        return self.buf[self.pos:end] == b_prefix
+
+    def seek(self, pos, line):
+        """
+        Move the cursor to byte offset pos, which is the start of line number line.
+        """
+        self.pos = pos
+        self.line = line
+
+    def skip_to(self, prefix):
+        """
+        Advance to the next line (including the current one) that starts with
+        prefix. Returns False and moves to the end of file if there is none.
+        """
+        if self.peek_startswith(prefix):
+            return True
+        b_prefix = b'\n' + prefix.encode('utf-8')
+        idx = self.buf.find(b_prefix, self.pos, self.size)
+        if idx == -1:
+            self.line += self._count_lines(self.pos, self.size)
+            self.pos = self.size
+            return False
+        self.line += self._count_lines(self.pos, idx + 1)
+        self.pos = idx + 1
+        return True
+
+    def has_line(self, prefix):
+        """
+        Check if a complete line (ending in a newline) after the current one
+        starts with prefix, without moving the cursor.
+        """
+        idx = self.buf.find(b'\n' + prefix.encode('utf-8'), self.pos, self.size)
+        return idx != -1 and self.buf.find(b'\n', idx + 1, self.size) != -1
+
+    def _count_lines(self, start, end):
+        cnt = 0
+        idx = self.buf.find(b'\n', start, end)
+        while idx != -1:
+            cnt += 1
+            idx = self.buf.find(b'\n', idx + 1, end)
+        return cnt
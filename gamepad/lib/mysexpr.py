@@ -13,6 +13,8 @@
 # limitations under the License.
 # ==============================================================================
 
+import re
+
 import lib.sexpdata as sexpdata
 
 
@@ -20,12 +22,136 @@ import lib.sexpdata as sexpdata
 [Note]
 
 Functionality for s-expression parsing.
+
+sexpr_loads is a reader for the s-expressions that tcoq dumps
+(mid-level terms and full tactics). Compared to sexpdata.loads:
+1. A literal ' is part of an identifier (e.g., x'), so no escaping is needed.
+2. Lists (...) and [...] are read as tuples.
+3. Atoms are read as ints, bools (true/false), () (nil) or interned Symbols,
+   which are str with a _val attribute (like sexpdata.Symbol). Equal atoms
+   are the same object.
+4. Strings "..." are read as str. There are no comments and no quoting.
+
+sexpr_strify and sexpr_unpack accept both readers' output, so that tactic
+trees pickled with sexpdata.Symbol (and the !@# escape for ') still work.
 """
 
 
+# -------------------------------------------------
+# Reader
+
+class Symbol(str):
+    """Interned symbol of an s-expression"""
+    __slots__ = ()
+
+    @property
+    def _val(self):
+        return self
+
+    def __repr__(self):
+        return "Symbol({})".format(str.__repr__(self))
+
+    def __reduce__(self):
+        return (sexpr_symbol, (str(self),))
+
+
+_SYMBOLS = {}       # Dict[str, Symbol], symbol table shared by all reads
+
+
+def sexpr_symbol(name):
+    try:
+        return _SYMBOLS[name]
+    except KeyError:
+        sym = Symbol(name)
+        _SYMBOLS[name] = sym
+        return sym
+
+
+_TOKEN = re.compile(r'[()\[\]]|"(?:[^"\\]|\\.)*"|[^\s()\[\]"]+')
+_INT = re.compile(r'[-+]?\d+$')
+_ESCAPE = re.compile(r'\\(.)')
+_ESCAPES = {"b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class SexprReader(object):
+    def __init__(self, nil="nil", true="t", false=None):
+        # Atoms that are not symbols
+        self.nil = nil
+        self.true = true
+        self.false = false
+
+        # Dict[str, atom], cache of converted atoms
+        self.atoms = {}
+
+    def atom(self, tok):
+        if tok == self.nil:
+            return ()
+        elif tok == self.true:
+            return True
+        elif tok == self.false:
+            return False
+        elif _INT.match(tok):
+            return int(tok)
+        else:
+            return sexpr_symbol(tok)
+
+    def loads(self, string):
+        atoms = self.atoms
+        stk = []
+        top = []
+        for tok in _TOKEN.findall(string):
+            if tok == "(" or tok == "[":
+                stk.append(top)
+                top = []
+            elif tok == ")" or tok == "]":
+                if not stk:
+                    raise NameError("Too many closing brackets in {}".format(string))
+                sexpr = tuple(top)
+                top = stk.pop()
+                top.append(sexpr)
+            elif tok[0] == '"':
+                s = tok[1:-1]
+                if "\\" in s:
+                    s = _ESCAPE.sub(lambda m: _ESCAPES.get(m.group(1), m.group(1)), s)
+                top.append(s)
+            else:
+                try:
+                    top.append(atoms[tok])
+                except KeyError:
+                    x = self.atom(tok)
+                    atoms[tok] = x
+                    top.append(x)
+        if stk:
+            raise NameError("Not enough closing brackets in {}".format(string))
+        if len(top) != 1:
+            raise NameError("Expected one s-expression in {}".format(string))
+        return top[0]
+
+
+_READERS = {}       # Dict[(nil, true, false), SexprReader]
+
+
+def sexpr_loads(string, nil="nil", true="t", false=None):
+    """
+    Drop-in replacement for sexpdata.loads on tcoq s-expressions.
+    """
+    key = (nil, true, false)
+    try:
+        reader = _READERS[key]
+    except KeyError:
+        reader = SexprReader(nil, true, false)
+        _READERS[key] = reader
+    return reader.loads(string)
+
+
+# -------------------------------------------------
+# Accessors
+
 def sexpr_strify(sexpr):
     ty = type(sexpr)
-    if ty is sexpdata.Symbol:
+    if ty is Symbol:
+        return str(sexpr)
+    elif ty is sexpdata.Symbol:
         return sexpr._val.replace("!@#", "'")
     elif ty is bool:
         return str(sexpr)
@@ -34,6 +160,8 @@ def sexpr_strify(sexpr):
 
 
 def sexpr_unpack(sexpr):
+    if type(sexpr) is Symbol:
+        return sexpr, None
     try:
         tag = sexpr[0]
         body = sexpr[1:]
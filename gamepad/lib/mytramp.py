@@ -0,0 +1,63 @@
+# Copyright 2018 The GamePad Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""
+[Note]
+
+Run recursive functions without using the Python stack.
+
+A recursive function is written as a generator that yields the generator
+of each recursive call and receives its result:
+
+    def _size(self, c):
+        sz = 1
+        for c_p in children(c):
+            sz += yield self._size(c_p)
+        return sz
+
+    def size(self, c):
+        return trampoline(self._size(c))
+
+trampoline keeps the pending calls on an explicit stack, so the depth of
+the recursion is not limited by sys.getrecursionlimit(). Exceptions raised
+by a call propagate to the caller (as with ordinary recursion).
+"""
+
+
+def trampoline(gen):
+    stk = [gen]
+    val = None
+    exn = None
+    while stk:
+        try:
+            if exn is None:
+                call = stk[-1].send(val)
+            else:
+                # Clear exn first: if the call handles it and returns, throw
+                # raises StopIteration and exn must not be thrown again
+                e, exn = exn, None
+                call = stk[-1].throw(e)
+        except StopIteration as e:
+            stk.pop()
+            val = e.value
+        except Exception as e:
+            stk.pop()
+            if not stk:
+                raise
+            exn = e
+        else:
+            stk.append(call)
+            val = None
+    return val
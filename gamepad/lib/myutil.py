@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ==============================================================================
+from collections import OrderedDict
+
 
 """
 [Note]
@@ -30,6 +32,107 @@ class ImplmentMe(Exception):
         self.msg = msg
 
 
+class LazyDict(dict):
+    """
+    Dictionary that computes missing entries on demand with fill(key).
+    fill is expected to store the value it returns.
+    """
+    def __init__(self, fill):
+        super().__init__()
+        self.fill = fill
+
+    def __missing__(self, key):
+        return self.fill(key)
+
+
+class LRUCache(object):
+    """
+    Bounded cache that evicts the least recently used entry.
+    Counts hits and misses so that maxsize can be tuned.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key, compute):
+        """Cached value of key, computed with compute(key) on a miss"""
+        entries = self.entries
+        try:
+            value = entries[key]
+        except KeyError:
+            self.misses += 1
+            value = compute(key)
+            entries[key] = value
+            if len(entries) > self.maxsize:
+                entries.popitem(last=False)
+            return value
+        self.hits += 1
+        entries.move_to_end(key)
+        return value
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        while len(self.entries) > maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        return "hits={} misses={} hit_rate={:.2f} size={}/{}".format(
+               self.hits, self.misses, self.hit_rate(), len(self.entries), self.maxsize)
+
+
+class SlotState(object):
+    """
+    Pickling for classes with __slots__ (and therefore no __dict__).
+    The state is the tuple of slot values. Pickles made before a class had
+    __slots__ store its __dict__ instead, and are loaded as well.
+    Slots starting with _ hold cached (derived) values and are not pickled.
+    """
+    __slots__ = ()
+
+    # Dict[type, tuple of slot names], including inherited slots
+    _slot_names = {}
+
+    @classmethod
+    def slot_names(cls):
+        try:
+            return SlotState._slot_names[cls]
+        except KeyError:
+            names = []
+            for cls_p in reversed(cls.__mro__):
+                for name in cls_p.__dict__.get("__slots__", ()):
+                    if not name.startswith("_") and name not in names:
+                        names.append(name)
+            names = tuple(names)
+            SlotState._slot_names[cls] = names
+            return names
+
+    def __getstate__(self):
+        return tuple(getattr(self, name, None) for name in self.slot_names())
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # Pickled before __slots__
+            for name, value in state.items():
+                setattr(self, name, value)
+        else:
+            for name, value in zip(self.slot_names(), state):
+                setattr(self, name, value)
+
+
 def pp_tab(tab, s):
     return tab * " " + s
 
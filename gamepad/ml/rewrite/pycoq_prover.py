@@ -29,6 +29,7 @@ class PyCoqProver(object):
         self.f_log = f_log
 
         # Proof state
+        self.ts_parser = None
         self.decoder = None
         self.last_res = None
         self.ctx = None
@@ -71,10 +72,10 @@ class PyCoqProver(object):
         # Update result
         self.last_res = res
 
-        # TODO(deh): can optimize to not read whole file
-        # Parse and update AST decoder
-        ts_parser = TacStParser(self.tcoq_dump_path)
-        lemma = ts_parser.parse_partial_lemma()
+        # Parse what tcoq appended since the last step and extend AST decoder
+        if self.ts_parser is None:
+            self.ts_parser = TacStParser(self.tcoq_dump_path)
+        lemma = self.ts_parser.tail_partial_lemma()
         self.decoder = lemma.decoder
 
         if self._is_success(res):
@@ -18,8 +18,6 @@ import numpy as np
 import pickle
 
 from coq.tactics import TACTICS_EQUIV
-from coq.constr_util import SizeConstr
-from coq.glob_constr_util import SizeGlobConstr
 from lib.myedit import *
 from recon.embed_tokens import EmbedTokens
 
@@ -52,8 +50,6 @@ class TacStPt(object):
 
         # Features
         if f_feature:
-            import sys
-            sys.setrecursionlimit(1500)
             self._kern_size()
             self._mid_size()
             self._mid_noimp_size()
@@ -87,11 +83,9 @@ class TacStPt(object):
 
     def _kern_size(self):
         _, ctx, (concl_kdx, _), _ = self.tacst
-        sc = SizeConstr(self.tactr.decoder.decoded)
-        concl_size = sc.decode_size(concl_kdx)
-        ctx_size = 0
-        for _, kdx, _ in ctx:
-            ctx_size += sc.decode_size(kdx)
+        bulk = self.tactr.bulk_kern()
+        concl_size = bulk.size(concl_kdx)
+        ctx_size = bulk.sum_sizes([kdx for _, kdx, _ in ctx])
 
         self.kern_concl_size = concl_size
         self.kern_ctx_size = ctx_size
@@ -99,11 +93,9 @@ class TacStPt(object):
 
     def _mid_size(self):
         _, ctx, (_, concl_mdx), _ = self.tacst
-        sgc = SizeGlobConstr(self.tactr.mid_decoder.decoded, f_cntiarg=True)
-        concl_size = sgc.decode_size(concl_mdx)
-        ctx_size = 0
-        for _, _, mdx in ctx:
-            ctx_size += sgc.decode_size(mdx)
+        bulk = self.tactr.bulk_mid()
+        concl_size = bulk.size(concl_mdx)
+        ctx_size = bulk.sum_sizes([mdx for _, _, mdx in ctx])
 
         self.mid_concl_size = concl_size
         self.mid_ctx_size = ctx_size
@@ -111,11 +103,9 @@ class TacStPt(object):
 
     def _mid_noimp_size(self):
         _, ctx, (_, concl_mdx), _ = self.tacst
-        sgc = SizeGlobConstr(self.tactr.mid_decoder.decoded, f_cntiarg=False)
-        concl_size = sgc.decode_size(concl_mdx)
-        ctx_size = 0
-        for _, _, mdx in ctx:
-            ctx_size += sgc.decode_size(mdx)
+        bulk = self.tactr.bulk_mid()
+        concl_size = bulk.noimp_size(concl_mdx)
+        ctx_size = bulk.sum_noimp_sizes([mdx for _, _, mdx in ctx])
 
         self.mid_noimp_concl_size = concl_size
         self.mid_noimp_ctx_size = ctx_size
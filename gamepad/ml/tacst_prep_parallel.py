@@ -19,8 +19,6 @@ import pickle
 import os
 
 from coq.tactics import TACTICS_EQUIV
-from coq.constr_util import SizeConstr
-from coq.glob_constr_util import SizeGlobConstr
 from lib.myedit import *
 from recon.embed_tokens import EmbedTokens
 
@@ -132,11 +130,9 @@ class TacStPt(object):
 
     def _kern_size(self):
         _, ctx, (concl_kdx, _), _ = self.tacst
-        sc = SizeConstr(self.tactr.decoder.decoded)
-        concl_size = sc.decode_size(concl_kdx)
-        ctx_size = 0
-        for _, kdx, _ in ctx:
-            ctx_size += sc.decode_size(kdx)
+        bulk = self.tactr.bulk_kern()
+        concl_size = bulk.size(concl_kdx)
+        ctx_size = bulk.sum_sizes([kdx for _, kdx, _ in ctx])
 
         self.kern_concl_size = concl_size
         self.kern_ctx_size = ctx_size
@@ -144,11 +140,9 @@ class TacStPt(object):
 
     def _mid_size(self):
         _, ctx, (_, concl_mdx), _ = self.tacst
-        sgc = SizeGlobConstr(self.tactr.mid_decoder.decoded, f_cntiarg=True)
-        concl_size = sgc.decode_size(concl_mdx)
-        ctx_size = 0
-        for _, _, mdx in ctx:
-            ctx_size += sgc.decode_size(mdx)
+        bulk = self.tactr.bulk_mid()
+        concl_size = bulk.size(concl_mdx)
+        ctx_size = bulk.sum_sizes([mdx for _, _, mdx in ctx])
 
         self.mid_concl_size = concl_size
         self.mid_ctx_size = ctx_size
@@ -156,11 +150,9 @@ class TacStPt(object):
 
     def _mid_noimp_size(self):
         _, ctx, (_, concl_mdx), _ = self.tacst
-        sgc = SizeGlobConstr(self.tactr.mid_decoder.decoded, f_cntiarg=False)
-        concl_size = sgc.decode_size(concl_mdx)
-        ctx_size = 0
-        for _, _, mdx in ctx:
-            ctx_size += sgc.decode_size(mdx)
+        bulk = self.tactr.bulk_mid()
+        concl_size = bulk.noimp_size(concl_mdx)
+        ctx_size = bulk.sum_noimp_sizes([mdx for _, _, mdx in ctx])
 
         self.mid_noimp_concl_size = concl_size
         self.mid_noimp_ctx_size = ctx_size
@@ -0,0 +1,81 @@
+# Copyright 2018 The GamePad Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import json
+import os
+
+
+"""
+[Note]
+
+Read dumps in place from a build.log chunked with chunk.py --manifest.
+
+A dump is addressed either by a plain file name (*.dump) or by
+<build.log>#<file.v>, which refers to the section of build.log that
+follows the line "COQC <file.v>". The byte range of each section is
+recorded in <build.log>.manifest.
+"""
+
+
+TOK_SECTION = "#"
+
+
+def manifest_filename(log):
+    return "{}.manifest".format(log)
+
+
+def split_dump_address(address):
+    """
+    Returns (filename, v_file), where v_file is None for a plain dump file.
+    """
+    if os.path.exists(address) or TOK_SECTION not in address:
+        return address, None
+    idx = address.rfind(TOK_SECTION)
+    return address[:idx], address[idx + 1:]
+
+
+def load_manifest(log):
+    """
+    Returns the manifest of log as Dict[str, (int, int)]. If a file was
+    compiled more than once, the last section wins (as when copying).
+    """
+    filename = manifest_filename(log)
+    if not os.path.exists(filename):
+        raise NameError("No manifest for {}, run chunk.py --manifest".format(log))
+    with open(filename, 'r') as f:
+        js = json.load(f)
+    sections = {}
+    for v_file, start, end in js["sections"]:
+        sections[v_file] = (start, end)
+    return sections
+
+
+def resolve_dump(address):
+    """
+    Returns (filename, byte_start, byte_end) of a dump address.
+    A byte_end of None means the end of the file.
+    """
+    filename, v_file = split_dump_address(address)
+    if v_file is None:
+        return filename, 0, None
+
+    sections = load_manifest(filename)
+    if v_file not in sections:
+        raise NameError("Section {} not found in manifest of {}".format(v_file, filename))
+    start, end = sections[v_file]
+    if os.stat(filename).st_size < end:
+        raise NameError("Manifest of {} is stale (section {} ends at {})".format(
+                        filename, v_file, end))
+    return filename, start, end
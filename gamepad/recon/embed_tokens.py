@@ -57,6 +57,9 @@ class EmbedTokens(object):
             tokens = tactr.tokenize_mid()
         else:
             tokens = tactr.tokenize_kern()
+        self.add_tokens(tokens)
+
+    def add_tokens(self, tokens):
         self.unique_sort = self.unique_sort.union(tokens[0])
         self.unique_const = self.unique_const.union(tokens[1])
         self.unique_ind = self.unique_ind.union(tokens[2])
@@ -0,0 +1,225 @@
+# Copyright 2018 The GamePad Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import argparse
+import json
+import os
+
+from lib.myfile import MMapFile
+from recon.chunk_manifest import resolve_dump
+from recon.tokens import *
+
+
+"""
+[Note]
+
+Persistent index of the lemmas in a *.dump file.
+
+The index is stored as JSON in a sidecar file <file.dump>.idx and records,
+for each lemma, its byte range, line range, number of tactic state
+declarations, and the sizes of its tables. The index is rebuilt when the
+size or modification time of the dump changes.
+
+A section of a build.log (<build.log>#<file.v>, see chunk_manifest) can be
+indexed as well; its sidecar is <build.log>#<file.v>.idx and the recorded
+offsets are offsets into build.log.
+
+List the lemmas in a dump (from the gamepad directory):
+    python -m recon.lemma_index <file.dump>
+"""
+
+
+IDX_VERSION = 1
+
+
+# -------------------------------------------------
+# Data structures
+
+class LemmaEntry(object):
+    def __init__(self, name, byte_start, byte_end, line_start, line_end,
+                 num_decls=0, num_inc=0, num_constrs=0, num_prtyps=0,
+                 num_prbods=0, num_prgls=0):
+        self.name = name                # Name of the lemma
+        self.byte_start = byte_start    # Offset of bg(pf) line
+        self.byte_end = byte_end        # Offset just past en(pf) line
+        self.line_start = line_start    # Line number of bg(pf)
+        self.line_end = line_end        # Line number just past en(pf)
+        self.num_decls = num_decls      # Number of tactic state declarations
+        self.num_inc = num_inc          # Number of incremental blocks
+        self.num_constrs = num_constrs  # Size of constr_share table
+        self.num_prtyps = num_prtyps    # Size of ctx_prtyps table
+        self.num_prbods = num_prbods    # Size of ctx_prbods table
+        self.num_prgls = num_prgls      # Size of ctx_prgls table
+
+    def to_json(self):
+        return [self.name, self.byte_start, self.byte_end,
+                self.line_start, self.line_end, self.num_decls,
+                self.num_inc, self.num_constrs, self.num_prtyps,
+                self.num_prbods, self.num_prgls]
+
+    @staticmethod
+    def from_json(js):
+        return LemmaEntry(*js)
+
+    def __str__(self):
+        info = (self.name, self.byte_start, self.byte_end, self.line_start,
+                self.line_end, self.num_decls, self.num_constrs)
+        return "{}(bytes={}-{}, lines={}-{}, decls={}, constrs={})".format(*info)
+
+
+# -------------------------------------------------
+# Index
+
+class LemmaIndex(object):
+    def __init__(self, filename, f_rebuild=False, f_save=True):
+        self.filename = filename
+        self.idx_filename = "{}.idx".format(filename)
+        self.f_save = f_save
+
+        # Byte range of the dump (whole file or section of a build.log)
+        self.path, self.start, self.end = resolve_dump(filename)
+
+        self.entries = []        # [LemmaEntry], in file order
+        self.by_name = {}        # Dict[str, [LemmaEntry]], in file order
+
+        if f_rebuild or not self._load():
+            self.build()
+
+    def _stamp(self):
+        st = os.stat(self.path)
+        return st.st_size, st.st_mtime_ns
+
+    def _load(self):
+        if not os.path.exists(self.idx_filename):
+            return False
+        try:
+            with open(self.idx_filename, 'r') as f:
+                js = json.load(f)
+        except (OSError, ValueError):
+            return False
+        size, mtime = self._stamp()
+        if js.get("version") != IDX_VERSION or \
+           js.get("size") != size or js.get("mtime") != mtime or \
+           js.get("start") != self.start or js.get("end") != self.end:
+            return False
+        self._set_entries([LemmaEntry.from_json(x) for x in js["lemmas"]])
+        return True
+
+    def _save(self):
+        size, mtime = self._stamp()
+        js = {"version": IDX_VERSION,
+              "size": size,
+              "mtime": mtime,
+              "start": self.start,
+              "end": self.end,
+              "lemmas": [entry.to_json() for entry in self.entries]}
+        try:
+            with open(self.idx_filename, 'w') as f:
+                json.dump(js, f)
+        except OSError:
+            # Read-only location, keep index in memory only
+            pass
+
+    def _set_entries(self, entries):
+        self.entries = entries
+        self.by_name = {}
+        for entry in entries:
+            self.by_name.setdefault(entry.name, []).append(entry)
+
+    def build(self):
+        """
+        Scan the dump once and record where each lemma lives.
+        """
+        h_head = MMapFile(self.path, self.start, self.end)
+        entries = []
+        stk = []                  # Open lemmas as [LemmaEntry]
+        table = None              # Epilogue table being counted
+        f_inc = False             # Inside a bg(inc) block?
+
+        while h_head.pos < h_head.size:
+            pos, line_no = h_head.pos, h_head.line
+            line = h_head.raw_consume_line()
+            if table is not None and stk:
+                if line.startswith(TOK_PRTYPS):
+                    table = "num_prtyps"
+                elif line.startswith(TOK_PRBODS):
+                    table = "num_prbods"
+                elif line.startswith(TOK_PRGLS):
+                    table = "num_prgls"
+                elif line.startswith(TOK_END_PF):
+                    table = None
+                else:
+                    entry = stk[-1]
+                    setattr(entry, table, getattr(entry, table) + 1)
+                    continue
+
+            if f_inc:
+                if line.startswith(TOK_END_INC):
+                    f_inc = False
+            elif line.startswith(TOK_BEG_PF):
+                lem_name = line.split(TOK_SEP)[2].strip()
+                stk.append(LemmaEntry(lem_name, pos, pos, line_no, line_no))
+            elif line.startswith(TOK_END_PF):
+                if stk:
+                    entry = stk.pop()
+                    entry.byte_end = h_head.pos
+                    entry.line_end = h_head.line
+                    entries.append(entry)
+            elif not stk:
+                continue
+            elif line.startswith(TOK_BEG_TAC_ST):
+                stk[-1].num_decls += 1
+            elif line.startswith(TOK_BEG_INC):
+                stk[-1].num_inc += 1
+                f_inc = True
+            elif line.startswith(TOK_CONSTRS):
+                table = "num_constrs"
+        h_head.close()
+
+        # Nested lemmas close before their parents, keep file order
+        entries.sort(key=lambda entry: entry.byte_start)
+        self._set_entries(entries)
+        if self.f_save:
+            self._save()
+        return self.entries
+
+    def lookup(self, lemma, pos=0):
+        """
+        First occurrence of lemma starting at or after byte offset pos.
+        """
+        for entry in self.by_name.get(lemma, []):
+            if entry.byte_start >= pos:
+                return entry
+        raise NameError("Lemma {} not found".format(lemma))
+
+    def lemmas(self):
+        return [entry.name for entry in self.entries]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+if __name__ == "__main__":
+    # Set up command line
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("file", help="Enter the dump file to index.")
+    argparser.add_argument("-r", "--rebuild", action="store_true",
+                           help="Force rebuilding the index.")
+    args = argparser.parse_args()
+
+    index = LemmaIndex(args.file, f_rebuild=args.rebuild)
+    for entry in index.entries:
+        print(entry)
+    print("TOTAL: {}".format(len(index)))
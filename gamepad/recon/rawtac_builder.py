@@ -13,12 +13,11 @@
 # limitations under the License.
 # ==============================================================================
 
-import lib.sexpdata as sexpdata
-
-from coq.tactics_util import FvsTactic
+from coq.tactics_util import fvs_glob_constr_cached
 from coq.tactics import TacKind
 from lib.gensym import GenSym
 from lib.myiter import MyIter
+from lib.mysexpr import sexpr_loads
 from lib.myutil import pp_tab
 from recon.tokens import *
 from recon.tacst_parser import TacStDecl, LemTacSt
@@ -69,9 +68,9 @@ class RawTac(object):
             self.ftac.gids = set()
             self.ftac.tac_args = self.constrs
             for sexp_gc in self.constrs:
-                fvs = FvsTactic()
-                self.ftac.lids = self.ftac.lids.union(fvs.fvs_glob_constr(sexp_gc))
-                self.ftac.gids = self.ftac.gids.union(fvs.globs)
+                lids, gids = fvs_glob_constr_cached(sexp_gc)
+                self.ftac.lids = self.ftac.lids.union(lids)
+                self.ftac.gids = self.ftac.gids.union(gids)
 
     def pp(self, tab=0):
         epi = pp_tab(tab, "{}({}, {}) {{\n".format(self.name, self.ftac, self.uid))
@@ -129,9 +128,8 @@ class RawTacParser(object):
         constrs = []
         while it.has_next() and it.peek().hdr.kind.startswith("Constr("):
             decl = next(it)
-            # Constr(stuff), the literal ' throws us off
-            str_gc = decl.hdr.kind[7:-1].replace('\'', '!@#')
-            sexp_gc = sexpdata.loads(str_gc)
+            # Constr(stuff)
+            sexp_gc = sexpr_loads(decl.hdr.kind[7:-1])
             constrs += [sexp_gc]
         return constrs
 
@@ -13,8 +13,14 @@
 # limitations under the License.
 # ==============================================================================
 
+from multiprocessing import Pool
+
+from coq.constr_intern import ExpInterner
+from coq.constr_util import ChkMode
+from lib.gensym import GenSym
 from recon.tactr_builder import TacTreeBuilder
 from recon.embed_tokens import EmbedTokens
+from recon.lemma_index import LemmaIndex
 from recon.tacst_parser import TacStParser
 from recon.rawtac_builder import RawTacParser
 
@@ -23,6 +29,19 @@ from recon.rawtac_builder import RawTacParser
 [Note]
 
 Reconstruct tactic trees from tcoq dump files.
+
+Lemmas are independent after the parser resets, so a file can be split at
+lemma boundaries (using the lemma index) and reconstructed in parallel.
+Each worker uses fresh symbol generators; the parent then shifts the
+node/edge/dead/terminal identifiers of each shard so that the result is
+identical to a serial run.
+
+With f_intern, kernel expressions are hash-consed across all reconstructed
+lemmas (see coq/constr_intern.py). Shards are interned by the parent in
+lemma order, so the corpus-wide ids also match a serial run.
+
+chk_mode sets how much of the decoded kernel expressions is validated
+(see ChkConstr). num_chk and chk_time add up the checks of all lemmas.
 """
 
 
@@ -42,25 +61,103 @@ class Recon(object):
     3. Build the tactic tree.
         build_tactr   : [RawTac] -> TacTree
     """
-    def __init__(self, f_token=True):
+    def __init__(self, f_token=True, f_intern=False, chk_mode=ChkMode.FULL):
         self.f_token = f_token
         self.embed_tokens = EmbedTokens()
         self.tactrs = []
 
-    def recon_file(self, file, f_verbose=False):
+        # Validation of decoded kernel expressions
+        self.chk_mode = chk_mode
+        self.num_chk = 0          # Number of entries checked
+        self.chk_time = 0.0       # Time spent checking (seconds)
+
+        # Hash-consing of kernel expressions shared by all tactic trees
+        self.interner = ExpInterner() if f_intern else None
+
+        # Symbol generation shared by all reconstructed tactic trees
+        self.gs_nodeid = GenSym()
+        self.gs_edgeid = GenSym()
+        self.gs_deadid = GenSym()
+        self.gs_termid = GenSym()
+
+    def _gensyms(self):
+        return (self.gs_nodeid, self.gs_edgeid, self.gs_deadid, self.gs_termid)
+
+    def recon_file(self, file, f_verbose=False, num_workers=1):
         if f_verbose:
             print("==================================================")
             print("Reconstructing file {}".format(file))
-        
-        ts_parser = TacStParser(file, f_log=False)
+
+        if num_workers > 1:
+            tactrs = self._recon_file_parallel(file, num_workers)
+        else:
+            tactrs = self._recon_range(file)
+
+        self.tactrs += tactrs
+        return tactrs
+
+    def _recon_range(self, file, start=None, end=None, line=0):
+        """
+        Reconstruct the lemmas in the byte range [start, end) of file.
+        An end of None reconstructs until the file is exhausted.
+        """
+        ts_parser = TacStParser(file, f_log=False, chk_mode=self.chk_mode)
+        if start is not None:
+            ts_parser.h_head.seek(start, line)
         tactrs = []
         while not ts_parser.exhausted:
+            if end is not None and ts_parser.h_head.pos >= end:
+                break
             # Coq output file to [TacStDecl] tokens
             lemma = ts_parser.parse_lemma()
             tactr = self._recon_lemma(lemma)
+            self._add_chk(tactr)
             tactrs += [tactr]
+        return tactrs
 
-        self.tactrs += tactrs
+    def _shards(self, file, num_workers):
+        """
+        Split file into contiguous byte ranges at lemma boundaries.
+        A shard starts where the previous one ends so that the text between
+        lemmas is parsed exactly as in a serial run.
+        """
+        index = LemmaIndex(file)
+        entries = index.entries
+        num_shards = min(len(entries), 4 * num_workers)
+        if num_shards == 0:
+            return [(None, None, 0)]
+        size = entries[-1].byte_end - index.start
+        shards = []
+        start, line = index.start, 0
+        for entry in entries:
+            if (entry.byte_end - index.start) * num_shards >= size * (len(shards) + 1):
+                shards += [(start, entry.byte_end, line)]
+                start, line = entry.byte_end, entry.line_end
+        # Last shard runs to the end of the file
+        shards[-1] = (shards[-1][0], None, shards[-1][2])
+        return shards
+
+    def _recon_file_parallel(self, file, num_workers):
+        shards = self._shards(file, num_workers)
+        jobs = [(file, start, end, line, self.f_token, self.embed_tokens.f_mid, self.chk_mode)
+                for start, end, line in shards]
+        tactrs = []
+        with Pool(num_workers) as pool:
+            for shard_tactrs, shard_tokens, cnts in pool.imap(_recon_shard, jobs):
+                # Splice shard into the global symbol generation
+                offs = [gs.cnt for gs in self._gensyms()]
+                for tactr in shard_tactrs:
+                    tactr.renumber(*offs)
+                    self._add_chk(tactr)
+                    if self.interner is not None:
+                        self.interner.intern_decoder(tactr.decoder)
+                for gs, cnt in zip(self._gensyms(), cnts):
+                    gs.cnt += cnt
+
+                # Merge tokens in lemma order
+                for tokens in shard_tokens:
+                    self.embed_tokens.add_tokens(tokens)
+                tactrs += shard_tactrs
         return tactrs
 
     def recon_lemma(self, file, lemma, f_verbose=False):
@@ -68,7 +165,7 @@ class Recon(object):
             print("==================================================")
             print("Reconstructing lemma {} in file {}".format(lemma, file))
 
-        ts_parser = TacStParser(file, f_log=False)
+        ts_parser = TacStParser(file, f_log=False, chk_mode=self.chk_mode)
         ts_parser.seek_lemma(lemma)
         # Coq output file to [TacStDecl] tokens
         lemma = ts_parser.parse_lemma()
@@ -79,6 +176,7 @@ class Recon(object):
             print("<<<<<<<<<<<<<<<<<<<<<")
 
         tactr = self._recon_lemma(lemma)
+        self._add_chk(tactr)
         self.tactrs += [tactr]
         return tactr
 
@@ -89,7 +187,11 @@ class Recon(object):
 
         # [RawTac] to tactic tree
         tr_builder = TacTreeBuilder(lemma.name, tacs, lemma.get_tacst_info(), {}, {},
-                                    lemma.decoder, lemma.mid_decoder, False)
+                                    lemma.decoder, lemma.mid_decoder, False,
+                                    gs_nodeid=self.gs_nodeid,
+                                    gs_edgeid=self.gs_edgeid,
+                                    gs_deadid=self.gs_deadid,
+                                    gs_termid=self.gs_termid)
         tr_builder.build_tacs()
         tactr = tr_builder.get_tactree()
 
@@ -97,4 +199,32 @@ class Recon(object):
         if self.f_token:
             self.embed_tokens.tokenize_tactr(tactr)
 
+        # Share kernel expressions with previous lemmas
+        if self.interner is not None:
+            self.interner.intern_decoder(tactr.decoder)
+
         return tactr
+
+    def _add_chk(self, tactr):
+        self.num_chk += tactr.decoder.num_chk
+        self.chk_time += tactr.decoder.chk_time
+
+
+def _recon_shard(job):
+    """
+    Worker for parallel reconstruction of a byte range of a dump file.
+    Returns the tactic trees, their tokens (in lemma order), and the number
+    of symbols generated.
+    """
+    file, start, end, line, f_token, f_mid, chk_mode = job
+    recon = Recon(f_token=False, chk_mode=chk_mode)
+    tactrs = recon._recon_range(file, start, end, line)
+    tokens = []
+    if f_token:
+        for tactr in tactrs:
+            if f_mid:
+                tokens += [tactr.tokenize_mid()]
+            else:
+                tokens += [tactr.tokenize_kern()]
+    cnts = [gs.cnt for gs in recon._gensyms()]
+    return tactrs, tokens, cnts
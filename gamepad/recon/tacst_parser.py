@@ -13,14 +13,15 @@
 # limitations under the License.
 # ==============================================================================
 
-import lib.sexpdata as sexpdata
-
-from lib.myfile import MyFile
+from lib.myfile import MMapFile
 from lib.myutil import pp_tab
 from coq.constr_decode import *
+from coq.constr_util import ChkMode
+from recon.chunk_manifest import resolve_dump
+from recon.lemma_index import LemmaIndex
 from recon.tokens import *
 from coq.glob_constr_parser import GlobConstrDecoder
-from coq.tactics_util import FvsTactic
+from coq.tactics_util import fvs_tac_str
 
 
 """
@@ -59,8 +60,8 @@ class DeclMode(Enum):
 class FullTac(object):
     def __init__(self, pp_tac, sexp_tac=None, lids=set(), gids=set(), tac_args=None):
         assert isinstance(pp_tac, str)
-        assert isinstance(lids, set)
-        assert isinstance(gids, set)
+        assert isinstance(lids, (set, frozenset))
+        assert isinstance(gids, (set, frozenset))
 
         self.pp_tac = pp_tac      # Pretty-print tactic
         self.sexp_tac = sexp_tac  # Tactic as sexpression
@@ -72,7 +73,7 @@ class FullTac(object):
             self.tac_args = []        # Args
 
     def __str__(self):
-        return "({} | lids={}, gids={})".format(self.pp_tac, self.lids, self.gids)
+        return "({} | lids={}, gids={})".format(self.pp_tac, set(self.lids), set(self.gids))
 
 
 class TacStHdr(object):
@@ -163,8 +164,11 @@ class TacStDecl(object):
 class LemTacSt(object):
     """
     Contains the lemma and the sequence of tactic states associated with it.
+    Expressions are decoded lazily (on first lookup) unless f_lazy is False.
+    Kernel expressions are checked according to chk_mode (see ChkConstr).
     """
-    def __init__(self, name, decls, ctx_prtyps, ctx_prbods, ctx_prgls, constr_share, mid_share):
+    def __init__(self, name, decls, ctx_prtyps, ctx_prbods, ctx_prgls, constr_share, mid_share,
+                 f_lazy=True, chk_mode=ChkMode.FULL):
         assert isinstance(name, str)
         for decl in decls:
             assert isinstance(decl, TacStDecl)
@@ -173,12 +177,19 @@ class LemTacSt(object):
         self.decls = decls             # List of TacStDecl "tokens"
 
         # Decode low-level Coq expression
-        self.decoder = DecodeConstr(constr_share)
-        self.mid_decoder = GlobConstrDecoder(mid_share)
+        self.decoder = DecodeConstr(constr_share, f_lazy=f_lazy, chk_mode=chk_mode)
+        self.mid_decoder = GlobConstrDecoder(mid_share, f_lazy=f_lazy)
         self.ctx_prtyps = ctx_prtyps   # Dict[int, pp_str]
         self.ctx_prbods = ctx_prbods   # Dict[int, pp_str]
         self.ctx_prgls = ctx_prgls     # Dict[int, pp_str]
 
+    def materialize(self):
+        """
+        Decode all kernel and mid-level expressions.
+        """
+        self.decoder.materialize()
+        self.mid_decoder.materialize()
+
     def get_tacst_info(self):
         tacst_info = {}
         for decl in self.decls:
@@ -216,12 +227,19 @@ class LemTacSt(object):
 # -------------------------------------------------
 # Lexing/Parsing
 
+# Tokens that start multi-line blocks, with the token of their last line
+_TAIL_BLOCKS = [(TOK_BEG_TAC_ST, TOK_END_TAC_ST),
+                (TOK_BEG_INC, TOK_END_INC),
+                (TOK_CONSTRS, TOK_END_PF)]
+
+
 class TacStParser(object):
-    def __init__(self, filename, f_log=False):
+    def __init__(self, filename, f_log=False, chk_mode=ChkMode.FULL):
         # Internal state
         self.filename = filename
-        self.h_head = MyFile(filename)
+        self.h_head = MMapFile(*resolve_dump(filename))
         self.f_log = f_log
+        self.chk_mode = chk_mode    # Validation of decoded kernel expressions
         self.exhausted = False
 
         # Lemma-specific state
@@ -229,7 +247,7 @@ class TacStParser(object):
 
         # Lemma-specific decoding low-level Coq expressions
         self.constr_share = {}   # Dict[int, string], exp idx to unparsed string
-        self.mid_share = {}      # Dict[int, sexpr], exp idx to sexpr
+        self.mid_share = {}      # Dict[int, string], exp idx to unparsed sexpr
         self.ctx_prtyps = {}     # Dict[int, str], typ ident to pretty
         self.ctx_prbods = {}     # Dict[int, str], exp ident to pretty
         self.ctx_prgls = {}      # Dict[int, str], gidx to pretty
@@ -237,6 +255,11 @@ class TacStParser(object):
         # Accumulated lemmas
         self.lems = []
 
+        # Incremental parsing of a dump that is still being written
+        self.tail_lemma = None   # LemTacSt, extended in place
+        self.tail_stk = []       # Names of open lemmas
+        self.tail_last = None    # Name of the last lemma started
+
     def _mylog(self, msg, f_log=False):
         if f_log or self.f_log:
             print(msg)
@@ -304,13 +327,8 @@ class TacStParser(object):
             pp_tac = toks[1].strip()
             ast_ftac = toks[2].strip()
             if ast_ftac:
-                # Literal ' in identifier messes up sexpression parsing. Sigh*
-                ast_ftac = ast_ftac.replace('\'', '!@#')
                 try:
-                    sexp_ftac = sexpdata.loads(ast_ftac, true="true", false="false")
-                    fvs = FvsTactic()
-                    tac_lids = fvs.fvs_tac(sexp_ftac)
-                    tac_gids = fvs.globs
+                    sexp_ftac, tac_lids, tac_gids = fvs_tac_str(ast_ftac)
                     ftac = FullTac(pp_tac, sexp_ftac, tac_lids, tac_gids)
                 except:
                     print(ast_ftac)
@@ -400,10 +418,13 @@ class TacStParser(object):
                     h_head.peek_line()))
 
         # Parse expression identifier to low-level constr expression
+        constr_share = {}
         h_head.consume_line()
         while not h_head.peek_line().startswith(TOK_PRTYPS):
             k, v = self._parse_table_entry()
-            self.constr_share[int(k)] = v
+            constr_share[int(k)] = v
+        self.constr_share.update(constr_share)
+        return constr_share
 
     def parse_ctx_prtyps(self):
         # Internal
@@ -445,29 +466,23 @@ class TacStParser(object):
         h_head = self.h_head
         self._mylog("@parse_epilogue:before<{}>".format(h_head.peek_line()))
 
-        self.parse_constr_share()
+        constr_share = self.parse_constr_share()
         self.parse_ctx_prtyps()
         self.parse_ctx_prbods()
         self.parse_ctx_prgls()
+        return constr_share
 
     def seek_lemma(self, lemma):
         # Internal
         h_head = self.h_head
         self._mylog("seek_lemma<{}>".format(h_head.peek_line()))
 
-        line = h_head.raw_peek_line()
-        while line != "":
-            line = line.rstrip()
-            if line.startswith(TOK_BEG_PF):
-                toks = line.split(TOK_SEP)
-                lemma_p = toks[2].strip()
-                self._mylog("progress: {:4.2f}% @ {}".format(
-                            h_head.progress(), lemma_p), True)
-                if lemma_p == lemma:
-                    return
-            h_head.raw_consume_line()
-            line = h_head.raw_peek_line()
-        raise NameError("Lemma {} not found".format(lemma))
+        # Jump to the next occurrence of the lemma (from the current
+        # position) using the (cached) lemma index
+        entry = LemmaIndex(self.filename).lookup(lemma, h_head.pos)
+        h_head.seek(entry.byte_start, entry.line_start)
+        self._mylog("progress: {:4.2f}% @ {}".format(
+                    h_head.progress(), lemma), True)
 
     def ignore_constr_inc(self):
         # Internal
@@ -476,10 +491,9 @@ class TacStParser(object):
 
         h_head.consume_line()
         while not h_head.peek_line().startswith("Constrs"):
+            # Parsed by GlobConstrDecoder when first decoded
             k, s_gc = self._parse_table_entry()
-            s_gc = s_gc.replace('\'', '!@#')
-            sexp_gc = sexpdata.loads(s_gc, true="true", false="false")
-            self.mid_share[int(k)] = sexp_gc
+            self.mid_share[int(k)] = s_gc
 
         # Ignore incremental constr table for whole dump files
         h_head.consume_line()
@@ -504,6 +518,9 @@ class TacStParser(object):
         while line != "":
             line = line.rstrip()
             if line.startswith(TOK_BEG_PF):
+                if not self.tail_stk and self.tail_last is not None:
+                    # Next lemma, handled by the next call
+                    break
                 lem_name = self.parse_begin_pf()
                 lemname_stk.append(lem_name)
             elif line.startswith(TOK_END_PF):
@@ -512,7 +529,8 @@ class TacStParser(object):
                 lem_name = lemname_stk.pop()
                 lemma = LemTacSt(lem_name, self.decls, self.ctx_prtyps,
                                  self.ctx_prbods, self.ctx_prgls,
-                                 self.constr_share, self.mid_share)
+                                 self.constr_share, self.mid_share,
+                                 chk_mode=self.chk_mode)
                 self.lems.append(lemma)
                 if h_head.raw_peek_line() == "":
                     self.exhausted = True
@@ -575,19 +593,23 @@ class TacStParser(object):
         h_head = self.h_head
         self._mylog("ignore_constr_inc<{}>".format(h_head.peek_line()))
 
+        mid_share = {}
         h_head.consume_line()
         while not h_head.peek_line().startswith("Constrs"):
             k, s_gc = self._parse_table_entry()
-            s_gc = s_gc.replace('\'', '!@#')
-            sexp_gc = sexpdata.loads(s_gc, true="true", false="false")
-            self.mid_share[int(k)] = sexp_gc
+            mid_share[int(k)] = s_gc
 
+        constr_share = {}
         h_head.consume_line()
         while not h_head.peek_line().startswith(TOK_END_INC):
             k, v = self._parse_table_entry()
-            self.constr_share[int(k)] = v
+            constr_share[int(k)] = v
         h_head.consume_line()
 
+        self.mid_share.update(mid_share)
+        self.constr_share.update(constr_share)
+        return mid_share, constr_share
+
     def parse_partial_lemma(self):
         """
         Parse partial tactic states for an entire lemma.
@@ -605,6 +627,9 @@ class TacStParser(object):
         while line != "":
             line = line.rstrip()
             if line.startswith(TOK_BEG_PF):
+                if not self.tail_stk and self.tail_last is not None:
+                    # Next lemma, handled by the next call
+                    break
                 lem_name = self.parse_begin_pf()
                 lemname_stk.append(lem_name)
             elif line.startswith(TOK_END_PF):
@@ -613,7 +638,8 @@ class TacStParser(object):
                 lem_name = lemname_stk.pop()
                 lemma = LemTacSt(lem_name, self.decls, self.ctx_prtyps,
                                  self.ctx_prbods, self.ctx_prgls,
-                                 self.constr_share, self.mid_share)
+                                 self.constr_share, self.mid_share,
+                                 chk_mode=self.chk_mode)
                 self.lems.append(lemma)
                 if h_head.raw_peek_line() == "":
                     self.exhausted = True
@@ -652,4 +678,89 @@ class TacStParser(object):
         lem_name = lemname_stk.pop()
         return LemTacSt(lem_name, self.decls, self.ctx_prtyps,
                         self.ctx_prbods, self.ctx_prgls,
-                        self.constr_share, self.mid_share)
+                        self.constr_share, self.mid_share,
+                        chk_mode=self.chk_mode)
+
+    def tail_partial_lemma(self):
+        """
+        Parse the tactic states appended to the dump since the last call,
+        for a dump that is still being written (e.g., by PyCoqProver).
+        The lemma is created on the first call and extended in place on
+        later calls (decls, tables, and decoders), so the cost of a call
+        depends on what was appended rather than on the whole proof.
+        When a new (top-level) lemma starts, the call stops before its
+        header and returns the previous lemma; the next call starts a
+        fresh lemma.
+        """
+        # Internal
+        h_head = self.h_head
+        h_head.refresh()
+        self._mylog("tail_partial_lemma<{}>".format(h_head.peek_line()))
+
+        # Start a fresh lemma at the header of the next top-level lemma
+        line = h_head.raw_peek_line()
+        if line.endswith("\n") and line.startswith(TOK_BEG_PF) and \
+           not self.tail_stk and self.tail_last is not None:
+            self._reset()
+            self.tail_lemma = None
+            self.tail_last = None
+
+        # Parse complete lines and blocks only (the end of the file may still
+        # be written). A block is entered only once its terminator line is in
+        # the file, so the cursor always stops at the start of a line or block.
+        mid_share = {}
+        constr_share = {}
+        line = h_head.raw_peek_line()
+        while line.endswith("\n"):
+            line = line.rstrip()
+            if any(line.startswith(beg) and not h_head.has_line(end) for beg, end in _TAIL_BLOCKS):
+                break
+            if line.startswith(TOK_BEG_PF):
+                if not self.tail_stk and self.tail_last is not None:
+                    # Next lemma, handled by the next call
+                    break
+                lem_name = self.parse_begin_pf()
+                self.tail_stk.append(lem_name)
+                self.tail_last = lem_name
+            elif line.startswith(TOK_END_PF):
+                self.parse_qed()
+                self.tail_stk.pop()
+            elif line.startswith(TOK_BEG_SUB_PF):
+                self.parse_skip("begsubpf")
+            elif line.startswith(TOK_END_SUB_PF):
+                self.parse_skip("endsubpf")
+            elif line.startswith(TOK_BULLET):
+                self.parse_skip("bullet")
+            elif line.startswith(TOK_PFSTEP):
+                self.parse_skip("pfstep")
+            elif line.startswith(TOK_BEG_TAC_ST):
+                callid, mode, tac, kind, loc = self.parse_begtacst()
+                decl = self.parse_decl(callid, mode, tac, kind, loc)
+                self.decls += [decl]
+            elif line.startswith(TOK_END_TAC_ST):
+                self.parse_endtacst()
+            elif line.startswith(TOK_BEG_INC):
+                mid_share_p, constr_share_p = self.parse_constr_inc()
+                mid_share.update(mid_share_p)
+                constr_share.update(constr_share_p)
+            elif line.startswith(TOK_CONSTRS):
+                constr_share.update(self.parse_epilogue())
+            else:
+                raise NameError("Parsing error at line {}: {}".format(
+                                h_head.line, h_head.peek_line()))
+            line = h_head.raw_peek_line()
+
+        if self.tail_lemma is None:
+            if self.tail_last is None:
+                raise NameError("No lemma started in {}".format(self.filename))
+            # The lemma may have ended already
+            lem_name = self.tail_stk[-1] if self.tail_stk else self.tail_last
+            # Shares decls and tables with the parser, so later calls extend it
+            self.tail_lemma = LemTacSt(lem_name, self.decls, self.ctx_prtyps,
+                                       self.ctx_prbods, self.ctx_prgls,
+                                       self.constr_share, self.mid_share,
+                                       chk_mode=self.chk_mode)
+        else:
+            self.tail_lemma.decoder.extend(constr_share)
+            self.tail_lemma.mid_decoder.extend(mid_share)
+        return self.tail_lemma
@@ -15,7 +15,6 @@
 
 from enum import IntEnum
 import json
-import networkx as nx
 import numpy as np
 import plotly
 from plotly.graph_objs import *
@@ -24,13 +23,14 @@ from coq.constr import Name
 from coq.constr_decode import DecodeConstr
 from coq.constr_interp import InterpCBName, SizeCoqVal
 from coq.tactics import TacKind, TACTIC_HIST
-from coq.constr_util import SizeConstr, HistConstr, TokenConstr, VisualizeConstr, COQEXP_HIST
-from coq.glob_constr import COQGC_HIST
+from coq.constr_util import SizeConstr, BulkConstr, TokenConstr, VisualizeConstr
 from coq.glob_constr_parser import GlobConstrDecoder
-from coq.glob_constr_util import TokenGlobConstr, HistGlobConstr
+from coq.glob_constr_util import BulkGlobConstr
 from lib.myenv import MyEnv
+from lib.myunionfind import UnionFind
 from lib.myutil import dict_ls_app
 from recon.tacst_parser import FullTac
+from recon.tactr_graph import TacGraph
 
 
 """
@@ -141,21 +141,28 @@ class TacTree(object):
     is represented as
     14 [tac1, tac2]
     """
-    def __init__(self, name, edges, graph, tacst_info, gid_tactic, decoder, mid_decoder):
+    def __init__(self, name, edges, graph, tacst_info, gid_tactic, decoder, mid_decoder, uf=None):
         assert isinstance(decoder, DecodeConstr)
         assert isinstance(mid_decoder, GlobConstrDecoder)
 
         # Internal state
         self.name = name                # Lemma name
         self.edges = edges              # [TacEdge]
-        self.graph = graph              # nx.MultDiGraph[TacStId, TacStId]
+        self.graph = graph              # TacGraph (TacTrNode as nodes, TacEdge.eid as edge)
         self.tacst_info = tacst_info    # Dict[gid, (ctx, goal, ctx_e, goal_e)]
         self.gid_tactic = gid_tactic    # Dict[int, TacEdge]
         self.decoder = decoder          # Decode asts
         self.mid_decoder = mid_decoder  # Decode mid-level ast
+        self.uf = uf                    # UnionFind over node uids (built from edges if None)
 
         self.notok = []
 
+        # Bulk analyses of the decoded tables (computed on first use)
+        self._bulk_kern = None
+        self._bulk_mid = None
+        self._bfs = None
+        self._edge_idx = None
+
         # Root and create flattened view
         self._root()
         assert self.root, "Reconstructed tactic tree has no root."
@@ -167,31 +174,79 @@ class TacTree(object):
     def _root(self):
         self.root = None
         for node in self.graph.nodes():
-            self_edges = 0
-            for edge in self.graph.in_edges(node):
-                if edge[0] == edge[1]:
-                    self_edges += 1
-            if self.graph.in_degree(node) == self_edges:
+            if self.graph.is_source(node):
                 self.root = node
                 break
 
+    def _root_bfs(self):
+        """(dists, parents) of a breadth-first search from the root"""
+        if getattr(self, '_bfs', None) is None:
+            self._bfs = self.graph.bfs(self.root)
+        return self._bfs
+
     def _flatten_view(self):
         self.flatview = []
         seen = set()
+        dists, _ = self._root_bfs()
+        node_idx = self.graph.node_idx
         for edge in self.edges:
-            try:
-                depth = len(nx.algorithms.shortest_path(self.graph, self.root, edge.tgt))
-                if edge.tid not in seen:
-                    if edge.tgt.gid in self.tacst_info:
-                        pp_ctx, pp_concl, ctx, concl_idx = self.tacst_info[edge.tgt.gid]
-                        self.flatview += [(depth, edge.tgt, pp_ctx, pp_concl, ctx, concl_idx, edge)]
-                    elif edge.conn_to_dead() or edge.conn_to_term():
-                        pp_ctx, pp_concl, ctx, concl_idx = self.tacst_info[edge.src.gid]
-                        self.flatview += [(depth, edge.tgt, pp_ctx, pp_concl, ctx, concl_idx, edge)]
-            except nx.exception.NetworkXNoPath:
-                pass
+            dist = dists[node_idx[edge.tgt]]
+            if dist >= 0 and edge.tid not in seen:
+                # Number of nodes on the path from the root
+                depth = dist + 1
+                if edge.tgt.gid in self.tacst_info:
+                    pp_ctx, pp_concl, ctx, concl_idx = self.tacst_info[edge.tgt.gid]
+                    self.flatview += [(depth, edge.tgt, pp_ctx, pp_concl, ctx, concl_idx, edge)]
+                elif edge.conn_to_dead() or edge.conn_to_term():
+                    pp_ctx, pp_concl, ctx, concl_idx = self.tacst_info[edge.src.gid]
+                    self.flatview += [(depth, edge.tgt, pp_ctx, pp_concl, ctx, concl_idx, edge)]
             seen.add(edge.tid)
 
+    def renumber(self, node_off, edge_off, dead_off, term_off):
+        """
+        Shift the node uids, edge ids, and dead/terminal goal identifiers
+        by the given offsets. Used to splice in a tactic tree that was
+        reconstructed with fresh symbol generators (e.g., in a worker process).
+        """
+        seen = set()
+        for edge in self.edges:
+            edge.eid += edge_off
+            for node in (edge.src, edge.tgt):
+                if id(node) in seen:
+                    continue
+                seen.add(id(node))
+                node.uid += node_off
+                if node.kind == TacStKind.DEAD:
+                    node.gid += dead_off
+                elif node.kind == TacStKind.TERM:
+                    node.gid += term_off
+
+        # Node hashes may have changed, so rebuild graph in insertion order
+        self.graph = TacGraph.from_edges(self.edges)
+        self._bfs = None
+        self._edge_idx = None
+        self.uf = self._mk_uf()
+
+        # The root and flattened view were computed from the unshifted gids
+        # (a fresh terminal/dead gid can coincide with a goal in tacst_info)
+        self._root()
+        self._flatten_view()
+
+    def __getstate__(self):
+        # Bulk analyses are derived from the decoders, so they are not pickled
+        state = self.__dict__.copy()
+        state['_bulk_kern'] = None
+        state['_bulk_mid'] = None
+        state['_bfs'] = None
+        state['_edge_idx'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if not isinstance(self.graph, TacGraph):
+            # Pickled with a networkx graph, which was built from the edges
+            self.graph = TacGraph.from_edges(self.edges)
+
     # -------------------------------------------
     # Tactic tree API
 
@@ -221,21 +276,50 @@ class TacTree(object):
                 acc[edge.tid] = [edge]
         return acc
 
-    def in_edge(self, gid):
-        gids = list(self.graph.predecessors(gid))
-        acc = []
-        for edge in self.edges:
-            if edge.src in gids and edge.tgt == gid:
-                acc += [edge]
-        return acc
-
-    def out_edges(self, gid):
-        gids = list(self.graph.successors(gid))
-        acc = []
-        for edge in self.edges:
-            if edge.tgt in gids and edge.src == gid:
-                acc += [edge]
-        return acc
+    def _edge_index(self):
+        """
+        Edges out of and into each node (indexed like self.graph), in the
+        order of self.edges. Built once.
+        """
+        if getattr(self, '_edge_idx', None) is None:
+            node_idx = self.graph.node_idx
+            src_edges = [[] for _ in range(len(self.graph))]
+            tgt_edges = [[] for _ in range(len(self.graph))]
+            for edge in self.edges:
+                src_edges[node_idx[edge.src]].append(edge)
+                tgt_edges[node_idx[edge.tgt]].append(edge)
+            self._edge_idx = src_edges, tgt_edges
+        return self._edge_idx
+
+    def in_edge(self, gid, f_self=True):
+        """
+        Edges into the node gid. Self-edges (several tactics applied to the
+        same goal) are included unless f_self is False.
+        """
+        idx = self.graph.node_idx.get(gid)
+        if idx is None:
+            return []
+        edges = self._edge_index()[1][idx]
+        if f_self:
+            return list(edges)
+        return [edge for edge in edges if edge.src != edge.tgt]
+
+    def out_edges(self, gid, f_self=True):
+        """
+        Edges out of the node gid. Self-edges are included unless f_self
+        is False.
+        """
+        idx = self.graph.node_idx.get(gid)
+        if idx is None:
+            return []
+        edges = self._edge_index()[0][idx]
+        if f_self:
+            return list(edges)
+        return [edge for edge in edges if edge.src != edge.tgt]
+
+    def self_edges(self, gid):
+        """Self-edges of the node gid, e.g., 14 [tac1, tac2], in order"""
+        return [edge for edge in self.out_edges(gid) if edge.tgt == edge.src]
 
     def _traverse_info(self, ordered_gids):
         acc = []
@@ -249,43 +333,43 @@ class TacTree(object):
         return acc
 
     def bfs_traverse(self):
-        bfs = list(nx.bfs_edges(self.graph, self.root))
+        bfs = self.graph.bfs_edges(self.root)
         return self._traverse_info(bfs)
 
     def dfs_traverse(self):
-        dfs = list(nx.dfs_edges(self.graph, source=self.root))
+        dfs = self.graph.dfs_edges(self.root)
         return self._traverse_info(dfs)
 
-    def view_err_paths(self):
+    def _root_paths(self, goals):
+        dists, parents = self._root_bfs()
         acc = []
-        for egid in self.dead_goals():
-            try:
-                acc += [nx.algorithms.shortest_path(self.graph, self.root, egid)]
-            except nx.exception.NetworkXNoPath:
-                self.notok += [str(egid)]
+        for gid in goals:
+            path = self.graph.path(parents, dists, gid)
+            if path is None:
+                self.notok += [str(gid)]
+            else:
+                acc += [path]
         return acc
 
+    def view_err_paths(self):
+        return self._root_paths(self.dead_goals())
+
     def view_term_paths(self):
-        acc = []
-        for tgid in self.term_goals():
-            try:
-                acc += [nx.algorithms.shortest_path(self.graph, self.root, tgid)]
-            except nx.exception.NetworkXNoPath:
-                self.notok += [str(tgid)]
-        return acc
+        return self._root_paths(self.term_goals())
 
     def view_have_info(self):
         acc = []
+        term_goals = self.term_goals()
         for edge in self.edges:
             if edge.name.startswith("<ssreflect_plugin::ssrhave@0>") and \
                edge.isbod:
                 path = []
-                for tgid in self.term_goals():
-                    try:
-                        path = nx.algorithms.shortest_path(self.graph, edge.src, tgid)
+                dists, parents = self.graph.bfs(edge.src)
+                for tgid in term_goals:
+                    path_p = self.graph.path(parents, dists, tgid)
+                    if path_p is not None:
+                        path = path_p
                         break
-                    except nx.exception.NetworkXNoPath:
-                        pass
                 acc += [(str(edge.ftac), len(edge.ftac.pp_tac), [str(node) for node in path])]
         return acc
 
@@ -360,51 +444,49 @@ class TacTree(object):
             TACTIC_HIST.inc_insert(hist[depth], tac.name, 1)
         return hist
 
+    def bulk_kern(self):
+        """Sizes and histograms of the kernel-level table (BulkConstr)"""
+        if getattr(self, '_bulk_kern', None) is None:
+            self._bulk_kern = BulkConstr(self.decoder.materialize())
+        return self._bulk_kern
+
+    def bulk_mid(self):
+        """Sizes and histograms of the mid-level table (BulkGlobConstr)"""
+        if getattr(self, '_bulk_mid', None) is None:
+            self._bulk_mid = BulkGlobConstr(self.mid_decoder.materialize())
+        return self._bulk_mid
+
     def hist_coqexp(self):
-        hce = HistConstr(self.decoder.decoded)
-        acc = []
         seen = set()
         for _, _, _, _, ctx, (concl_kdx, _), _ in self.flatview:
             for ldecl in ctx:
-                typ_idx = ldecl[1]
-                if typ_idx not in seen:
-                    acc += [hce.decode_hist(typ_idx)]
-                    seen.add(typ_idx)
-            if concl_kdx not in seen:
-                acc += [hce.decode_hist(concl_kdx)]
-                seen.add(concl_kdx)
-
-        return COQEXP_HIST.merges(acc)
+                seen.add(ldecl[1])
+            seen.add(concl_kdx)
+        return self.bulk_kern().sum_hists(seen)
 
     def hist_gc(self):
-        hgc = HistGlobConstr(self.mid_decoder.decoded)
-        acc = []
         seen = set()
         for _, _, _, _, ctx, (_, concl_mdx), _ in self.flatview:
             for ldecl in ctx:
-                typ_idx = ldecl[2]
-                if typ_idx not in seen:
-                    acc += [hgc.decode_hist(typ_idx)]
-                    seen.add(typ_idx)
-            if concl_mdx not in seen:
-                acc += [hgc.decode_hist(concl_mdx)]
-                seen.add(concl_mdx)
-
-        return COQGC_HIST.merges(acc), hgc.num_iargs, hgc.num_args
+                seen.add(ldecl[2])
+            seen.add(concl_mdx)
+        bulk = self.bulk_mid()
+        num_iargs, num_args = bulk.count_args(seen)
+        return bulk.sum_hists(seen), num_iargs, num_args
 
     def tokenize_kern(self):
-        tce = TokenConstr(self.decoder.decoded)
+        tce = TokenConstr(self.decoder.materialize())
         return tce.tokenize()
 
     def tokenize_mid(self):
-        tce = TokenGlobConstr(self.mid_decoder.decoded)
-        return tce.tokenize()
+        return self.bulk_mid().tokens()
 
-    def view_comp(self, sce_full, sce_sh):
+    def view_comp(self, sce_full):
         vals = {}
         static_full_comp = {}
         static_sh_comp = {}
         cbname_comp = {}
+        bulk = self.bulk_kern()
         scv = SizeCoqVal(self.decoder.decoded)
         for _, _, _, _, ctx, _, _ in self.flatview:
             env = MyEnv({}, [])
@@ -417,11 +499,23 @@ class TacTree(object):
                     v = cbname.interp(env, c)
                     vals[ident] = v
                     static_full_comp[ident] = sce_full.decode_size(typ_idx)
-                    static_sh_comp[ident] = sce_sh.decode_size(typ_idx)
+                    static_sh_comp[ident] = bulk.shared_size(typ_idx)
                     cbname_comp[ident] = scv.size(v)
                 env = env.extend(Name(ident), v)
         return static_full_comp, static_sh_comp, cbname_comp
 
+    def view_state_comp(self):
+        """
+        Returns List[(tree size, DAG size)] of the kernel terms of each
+        tactic state (context and conclusion)
+        """
+        bulk = self.bulk_kern()
+        comp = []
+        for _, _, _, _, ctx, (concl_kdx, _), _ in self.flatview:
+            keys = [typ_idx for _, typ_idx, _ in ctx] + [concl_kdx]
+            comp += [bulk.root_sizes(keys)]
+        return comp
+
     def stats(self):
         term_path_lens = [len(path) for path in self.view_term_paths()]
         err_path_lens = [len(path) for path in self.view_err_paths()]
@@ -432,12 +526,11 @@ class TacTree(object):
         avg_depth_goal_size = [(k, np.mean(tysz)) for k, tysz in
                                self.view_depth_goal_size().items()]
         sce_full = SizeConstr(self.decoder.decoded, f_shared=False)
-        sce_sh = SizeConstr(self.decoder.decoded, f_shared=True)
         avg_depth_astctx_size = [(k, np.mean(v)) for k, v in
                                  self.view_depth_astctx_size(sce_full).items()]
         avg_depth_astgoal_size = [(k, np.mean(tysz)) for k, tysz in
                                   self.view_depth_astgoal_size(sce_full).items()]
-        static_full_comp, static_sh_comp, cbname_comp = self.view_comp(sce_full, sce_sh)
+        static_full_comp, static_sh_comp, cbname_comp = self.view_comp(sce_full)
         info = {'hist': self.view_tactic_hist(f_compress=True),
                 'num_tacs': len(self.tactics()),
                 'num_goals': len(self.goals()),
@@ -456,6 +549,7 @@ class TacTree(object):
                 'static_full_comp': [v for _, v in static_full_comp.items()],
                 'static_sh_comp': [v for _, v in static_sh_comp.items()],
                 'cbname_comp': [v for _, v in cbname_comp.items()],
+                'state_comp': self.view_state_comp(),
                 'notok': self.notok}
         return info
 
@@ -482,10 +576,32 @@ class TacTree(object):
         print("Error path lengths:", self.view_err_paths())
         print("<<<<<<<<<<<<<<<<<<<<")
 
-    def check_success(self, f_verbose=False):
-        ug = nx.Graph(self.graph)
-        ccs = list(nx.algorithms.components.connected.connected_components(ug))
-        n = len(ccs)
+    def _mk_uf(self):
+        uf = UnionFind()
+        for edge in self.edges:
+            uf.union(edge.src.uid, edge.tgt.uid)
+        return uf
+
+    def num_components(self):
+        """Number of (weakly) connected components of the tree"""
+        if getattr(self, 'uf', None) is None:
+            # Older pickles
+            self.uf = self._mk_uf()
+        return self.uf.num_sets
+
+    def _num_components_nx(self):
+        import networkx as nx
+        ug = nx.Graph(self.graph.to_networkx())
+        return nx.algorithms.components.connected.number_connected_components(ug)
+
+    def check_success(self, f_verbose=False, f_debug=False):
+        n = self.num_components()
+        if f_debug:
+            # Cross-check the union-find against the graph
+            n_nx = self._num_components_nx()
+            if n != n_nx:
+                raise NameError("Union-find has {} components but the graph has {} in {}".format(
+                                n, n_nx, self.name))
         if f_verbose:
             print("notok: {}, total: {}".format(len(self.notok), len(self.tactics())))
             print("# connected components: {}".format(n))
@@ -495,7 +611,8 @@ class TacTree(object):
         """
         Draws the tactic tree in a Jupyter notebook. (This is required for plotly to work.)
         """
-        g = self.graph
+        import networkx as nx
+        g = self.graph.to_networkx()
         pos = nx.drawing.layout.kamada_kawai_layout(g)
 
         # Edges
@@ -13,12 +13,12 @@
 # limitations under the License.
 # ==============================================================================
 
-import networkx as nx
-
 from coq.constr_decode import DecodeConstr
 from coq.tactics import parse_full_tac, is_tclintros_intern, is_tclintros_all
 from recon.rawtac_builder import *
 from recon.tactr import TacStKind, TacTrNode, TacEdge, TacTree
+from recon.tactr_graph import TacGraph
+from lib.myunionfind import UnionFind
 
 
 """
@@ -56,7 +56,8 @@ class TacTreeBuilder(object):
         self.rawtacs = rawtacs              # Raw tactics to process (List[RawTac])
         self.it_rawtacs = MyIter(rawtacs)   # Iterator of raw tactics to process (Iter[RawTac])
         self.edges = []                     # Tactic edge accumulator (List[TacEdge])
-        self.graph = nx.MultiDiGraph()      # TacTrNode as nodes, TacTrEdge.eid as edge
+        self.graph = TacGraph()             # TacTrNode as nodes, TacTrEdge.eid as edge
+        self.uf = UnionFind()               # Connectivity of node uids
         self.ftac_inscope = ftac_inscope    # Full-tactic in scope
         self.gid_node = gid_node            # Map goal id to tactic node (Dict[int, TacTrNode])
         self.gid_tactic = gid_tactic        # Map source goal id to tactic edge (Dict[int, TacTrEdge])
@@ -84,6 +85,7 @@ class TacTreeBuilder(object):
         self.edges += edges
         for edge in edges:
             self.graph.add_edge(edge.src, edge.tgt, key=edge.eid)
+            self.uf.union(edge.src.uid, edge.tgt.uid)
 
     def _mk_dead_node(self):
         return TacTrNode(self._fresh_nodeid(), self.gs_deadid.gensym(), TacStKind.DEAD)
@@ -211,11 +213,7 @@ class TacTreeBuilder(object):
             edges = []
             seen = set()
             for edge in body_edges:
-                self_edges = 0
-                for edge_p in body_graph.in_edges(edge.src):
-                    if edge_p[0] == edge_p[1]:
-                        self_edges += 1
-                if body_graph.in_degree(edge.src) == self_edges and edge.src not in seen:
+                if body_graph.is_source(edge.src) and edge.src not in seen:
                     root_nodes += [edge.src]
                     seen.add(edge.src)
                     if tac.bf_decl.hdr.gid != edge.src.gid:
@@ -228,11 +226,7 @@ class TacTreeBuilder(object):
                 for node in body_graph.nodes():
                     if node.kind != TacStKind.LIVE:
                         continue
-                    self_edges = 0
-                    for edge_p in body_graph.in_edges(node):
-                        if edge_p[0] == edge_p[1]:
-                            self_edges += 1
-                    if body_graph.out_degree(node) == self_edges:
+                    if body_graph.is_sink(node):
                         if node.gid == tac.af_decls[0].hdr.gid:
                             bf_node = self.gid_node[node.gid]
                             af_node = self._mk_dead_node()
@@ -295,7 +289,7 @@ class TacTreeBuilder(object):
         Get tactic tree after building it.
         """
         tactr = TacTree(self.name, self.edges, self.graph, self.tacst_info, self.gid_tactic,
-                        self.decoder, self.mid_decoder)
+                        self.decoder, self.mid_decoder, uf=self.uf)
 
         # Yay, dynamic-typing is great ... (Goes up in flames.)
         for _, gid, _, _, ctx, (concl_kdx, concl_mdx), tacs in tactr.bfs_traverse():
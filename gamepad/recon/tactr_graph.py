@@ -0,0 +1,266 @@
+# Copyright 2018 The GamePad Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+
+"""
+[Note]
+
+Integer-indexed directed multigraph for tactic trees.
+
+Nodes are TacTrNodes, numbered in insertion order. Two TacTrNodes that
+compare equal (same gid and kind) are the same node, and the first one
+added is kept. Edges are numbered in insertion order and keyed by
+TacEdge.eid.
+
+Degrees are maintained as edges are added, so that the builder can ask
+whether a node has a parent while the graph is growing. The CSR-style
+arrays (successors, predecessors, and the edges out of/into each node)
+are built on the first query after the graph changes.
+
+Neighbors are listed in the order their first edge was added, so
+bfs_edges/dfs_edges visit nodes in the same order as networkx's
+bfs_edges/dfs_edges on the equivalent nx.MultiDiGraph.
+"""
+
+
+class TacGraph(object):
+    def __init__(self):
+        self.node_idx = {}      # Dict[TacTrNode, int]
+        self.node_ls = []       # List[TacTrNode], indexed by node
+        self.srcs = []          # List[int], source node of each edge
+        self.tgts = []          # List[int], target node of each edge
+        self.eids = []          # List[int], key (TacEdge.eid) of each edge
+        self.in_deg = []        # List[int], indexed by node (counts multi-edges)
+        self.out_deg = []       # List[int], indexed by node
+        self.self_deg = []      # List[int], number of self-edges of each node
+        self._csr = None        # Compressed adjacency (built on demand)
+
+    @staticmethod
+    def from_edges(edges):
+        """Graph of a list of TacEdges (in order)"""
+        graph = TacGraph()
+        for edge in edges:
+            graph.add_edge(edge.src, edge.tgt, key=edge.eid)
+        return graph
+
+    # -------------------------------------------
+    # Building
+
+    def add_node(self, node):
+        try:
+            return self.node_idx[node]
+        except KeyError:
+            idx = len(self.node_ls)
+            self.node_idx[node] = idx
+            self.node_ls.append(node)
+            self.in_deg.append(0)
+            self.out_deg.append(0)
+            self.self_deg.append(0)
+            self._csr = None
+            return idx
+
+    def add_edge(self, src, tgt, key=None):
+        u = self.add_node(src)
+        v = self.add_node(tgt)
+        self.srcs.append(u)
+        self.tgts.append(v)
+        self.eids.append(key)
+        self.out_deg[u] += 1
+        self.in_deg[v] += 1
+        if u == v:
+            self.self_deg[u] += 1
+        self._csr = None
+
+    def _build_csr(self):
+        n = len(self.node_ls)
+        out_edges = [[] for _ in range(n)]
+        in_edges = [[] for _ in range(n)]
+        succs = [[] for _ in range(n)]
+        preds = [[] for _ in range(n)]
+        seen = set()
+        for pos, (u, v) in enumerate(zip(self.srcs, self.tgts)):
+            out_edges[u].append(pos)
+            in_edges[v].append(pos)
+            if (u, v) not in seen:
+                seen.add((u, v))
+                succs[u].append(v)
+                preds[v].append(u)
+        self._csr = (_compress(succs), _compress(preds),
+                     _compress(out_edges), _compress(in_edges))
+        return self._csr
+
+    def csr(self):
+        """
+        Returns ((succ_ptr, succ), (pred_ptr, pred), (out_ptr, out_edge),
+        (in_ptr, in_edge)), where the neighbors/edges of node i are
+        xs[ptr[i]:ptr[i + 1]]. Edges are positions in insertion order.
+        """
+        if self._csr is None:
+            return self._build_csr()
+        return self._csr
+
+    # -------------------------------------------
+    # Queries
+
+    def __len__(self):
+        return len(self.node_ls)
+
+    def __contains__(self, node):
+        return node in self.node_idx
+
+    def nodes(self):
+        return list(self.node_ls)
+
+    def number_of_edges(self):
+        return len(self.srcs)
+
+    def index(self, node):
+        return self.node_idx[node]
+
+    def in_degree(self, node):
+        return self.in_deg[self.node_idx[node]]
+
+    def out_degree(self, node):
+        return self.out_deg[self.node_idx[node]]
+
+    def is_source(self, node):
+        """No in-edges other than self-edges?"""
+        idx = self.node_idx[node]
+        return self.in_deg[idx] == self.self_deg[idx]
+
+    def is_sink(self, node):
+        """No out-edges other than self-edges?"""
+        idx = self.node_idx[node]
+        return self.out_deg[idx] == self.self_deg[idx]
+
+    def successors(self, node):
+        (ptr, succ), _, _, _ = self.csr()
+        idx = self.node_idx[node]
+        return [self.node_ls[v] for v in succ[ptr[idx]:ptr[idx + 1]]]
+
+    def predecessors(self, node):
+        _, (ptr, pred), _, _ = self.csr()
+        idx = self.node_idx[node]
+        return [self.node_ls[u] for u in pred[ptr[idx]:ptr[idx + 1]]]
+
+    def edges(self):
+        """(src, tgt, key) of every edge, in insertion order"""
+        node_ls = self.node_ls
+        return [(node_ls[u], node_ls[v], key) for u, v, key in zip(self.srcs, self.tgts, self.eids)]
+
+    # -------------------------------------------
+    # Traversals
+
+    def bfs_edges(self, root):
+        (ptr, succ), _, _, _ = self.csr()
+        node_ls = self.node_ls
+        r = self.node_idx[root]
+        seen = [False] * len(node_ls)
+        seen[r] = True
+        acc = []
+        frontier = [r]
+        while frontier:
+            frontier_p = []
+            for u in frontier:
+                for v in succ[ptr[u]:ptr[u + 1]]:
+                    if not seen[v]:
+                        seen[v] = True
+                        frontier_p.append(v)
+                        acc.append((node_ls[u], node_ls[v]))
+            frontier = frontier_p
+        return acc
+
+    def dfs_edges(self, root):
+        (ptr, succ), _, _, _ = self.csr()
+        node_ls = self.node_ls
+        r = self.node_idx[root]
+        seen = [False] * len(node_ls)
+        seen[r] = True
+        acc = []
+        stk = [(r, iter(succ[ptr[r]:ptr[r + 1]]))]
+        while stk:
+            u, children = stk[-1]
+            for v in children:
+                if not seen[v]:
+                    seen[v] = True
+                    acc.append((node_ls[u], node_ls[v]))
+                    stk.append((v, iter(succ[ptr[v]:ptr[v + 1]])))
+                    break
+            else:
+                stk.pop()
+        return acc
+
+    def bfs(self, src):
+        """
+        Breadth-first search from src. Returns (dists, parents) indexed
+        by node, with -1 for nodes that cannot be reached.
+        """
+        (ptr, succ), _, _, _ = self.csr()
+        s = self.node_idx[src]
+        dists = [-1] * len(self.node_ls)
+        parents = [-1] * len(self.node_ls)
+        dists[s] = 0
+        frontier = [s]
+        while frontier:
+            frontier_p = []
+            for u in frontier:
+                d = dists[u] + 1
+                for v in succ[ptr[u]:ptr[u + 1]]:
+                    if dists[v] < 0:
+                        dists[v] = d
+                        parents[v] = u
+                        frontier_p.append(v)
+            frontier = frontier_p
+        return dists, parents
+
+    def path(self, parents, dists, tgt):
+        """Shortest path to tgt (a list of nodes) from a bfs, or None"""
+        v = self.node_idx[tgt]
+        if dists[v] < 0:
+            return None
+        path = []
+        while v >= 0:
+            path.append(self.node_ls[v])
+            v = parents[v]
+        path.reverse()
+        return path
+
+    def shortest_path(self, src, tgt):
+        """Shortest path from src to tgt (a list of nodes), or None"""
+        dists, parents = self.bfs(src)
+        return self.path(parents, dists, tgt)
+
+    # -------------------------------------------
+    # Conversion
+
+    def to_networkx(self):
+        """Equivalent nx.MultiDiGraph (e.g., for drawing)"""
+        import networkx as nx
+        g = nx.MultiDiGraph()
+        for node in self.node_ls:
+            g.add_node(node)
+        for src, tgt, key in self.edges():
+            g.add_edge(src, tgt, key=key)
+        return g
+
+
+def _compress(adj):
+    """Compress a list of lists into (ptr, xs)"""
+    ptr = [0]
+    xs = []
+    for ys in adj:
+        xs += ys
+        ptr.append(len(xs))
+    return ptr, xs
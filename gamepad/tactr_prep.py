@@ -17,6 +17,8 @@ import argparse
 import os.path as op
 import pickle
 
+from coq.constr_util import ChkMode
+from coq.tactics_util import FVS_TAC_CACHE, FVS_GLOB_CONSTR_CACHE
 from recon.tacst_parser import TacStParser
 from recon.recon import Recon
 
@@ -28,13 +30,22 @@ from recon.recon import Recon
     python gamepad/tactr_prep.py files <file-list.txt>
 2. Visualize a lemma in a specific file
     python gamepad/tactr_prep.py file <file.dump> -l <lemma>
+3. Reconstruct each file with multiple processes (sharded by lemma)
+    python gamepad/tactr_prep.py files <file-list.txt> -j <num-processes>
+4. Read files in place from a build.log chunked with chunk.py --manifest
+    python gamepad/tactr_prep.py files <file-list.txt> -b <build.log>
+5. Share kernel expressions across all lemmas and files (smaller pickle)
+    python gamepad/tactr_prep.py files <file-list.txt> -i
+6. Validate a sample of the decoded kernel expressions (or none, or all)
+    python gamepad/tactr_prep.py files <file-list.txt> -c sampled
 """
 
 
 class Visualize(object):
-    def __init__(self, f_display=False, f_jupyter=False, f_verbose=False, tactr_log=None, tactr_pkl=None):
+    def __init__(self, f_display=False, f_jupyter=False, f_verbose=False, tactr_log=None, tactr_pkl=None,
+                 num_workers=1, f_intern=False, chk_mode=ChkMode.FULL, f_debug=False):
         # Internal book-keeping
-        self.recon = Recon()         # tactic tree reconstructor
+        self.recon = Recon(f_intern=f_intern, chk_mode=chk_mode)   # tactic tree reconstructor
         self.tactrs = []             # reconstructed tactic trees
         self.failed = []             # failed reconstructions
 
@@ -42,6 +53,7 @@ class Visualize(object):
         self.f_display = f_display   # draw graph?
         self.f_jupyter = f_jupyter   # using jupyter?
         self.f_verbose = f_verbose   # verbose?
+        self.f_debug = f_debug       # cross-check connectivity against the graph?
 
         # Tactic tree statistics
         self.tactr_log = tactr_log
@@ -54,6 +66,11 @@ class Visualize(object):
         # Tactic tree pickling
         self.tactr_pkl = tactr_pkl
 
+        # Number of processes used to reconstruct a file
+        self.num_workers = num_workers
+
+        # NOTE: traversals of terms do not recurse, but pickle does (along
+        # term depth) when saving/loading tactic trees
         import sys
         sys.setrecursionlimit(1500)
 
@@ -75,7 +92,17 @@ class Visualize(object):
                                     len(self.recon.embed_tokens.unique_fix)))
             self.h_tactr_log.write("NUM_IARGS: {}\n".format(self.num_iargs))
             self.h_tactr_log.write("NUM_ARGS: {}\n".format(self.num_args))
+            if self.recon.interner is not None:
+                self.h_tactr_log.write("UNIQUE-TERMS: {} / {}\n".format(
+                                        len(self.recon.interner), self.recon.interner.num_seen))
+            self.h_tactr_log.write("VALIDATION: {} ENTRIES: {} TIME: {:.2f}s\n".format(
+                                    self.recon.chk_mode, self.recon.num_chk, self.recon.chk_time))
             self.h_tactr_log.close()
+        if self.f_verbose:
+            print("Validation ({}): checked {} entries in {:.2f}s".format(
+                  self.recon.chk_mode, self.recon.num_chk, self.recon.chk_time))
+            print("FvsTactic cache (tactics): {}".format(FVS_TAC_CACHE))
+            print("FvsTactic cache (constrs): {}".format(FVS_GLOB_CONSTR_CACHE))
 
     def save_tactrs(self):
         if self.tactr_pkl:
@@ -96,11 +123,11 @@ class Visualize(object):
         ts_parser.parse_file()
 
     def visualize_file(self, file):
-        tactrs = self.recon.recon_file(file, not self.f_jupyter)
+        tactrs = self.recon.recon_file(file, not self.f_jupyter, self.num_workers)
         self.tactrs += tactrs
         
         for tactr in tactrs:
-            succ, ncc = tactr.check_success()
+            succ, ncc = tactr.check_success(f_debug=self.f_debug)
             if not succ:
                 print("FAILED", tactr.name, ncc)
                 self.failed += [(file, tactr.name, ncc, len(tactr.notok))]
@@ -137,19 +164,40 @@ if __name__ == "__main__":
                            help="Visualize a specific lemma by name.")
     argparser.add_argument("-p", "--path", default="data/odd-order",
                            type=str, help="Path to files")
+    argparser.add_argument("-b", "--build_log", default=None, type=str,
+                           help="Read files as sections of a build.log (see chunk.py --manifest).")
     argparser.add_argument("-log", "--log", default="tactr.log", type=str,
                            help="File to log tactic tree statistics to.")
     argparser.add_argument("-pkl", "--pickle", default="tactr.pickle", type=str,
                            help="File to save tactic tree pickle to.")
+    argparser.add_argument("-j", "--jobs", default=1, type=int,
+                           help="Number of processes used to reconstruct a file.")
+    argparser.add_argument("-i", "--intern", action="store_true",
+                           help="Share kernel expressions across lemmas and files.")
+    argparser.add_argument("-c", "--check", default=ChkMode.FULL, type=ChkMode,
+                           choices=list(ChkMode),
+                           help="Validation of decoded kernel expressions (off, sampled or full).")
     argparser.add_argument("-v", "--verbose", action="store_true",
                            help="Verbose")
+    argparser.add_argument("--debug", action="store_true",
+                           help="Cross-check tactic tree connectivity against networkx.")
     args = argparser.parse_args()
 
     # Visualize
     vis = Visualize(f_display=args.display, f_verbose=args.verbose,
-                    tactr_log=args.log, tactr_pkl=args.pickle)
+                    tactr_log=args.log, tactr_pkl=args.pickle, num_workers=args.jobs,
+                    f_intern=args.intern, chk_mode=args.check, f_debug=args.debug)
+    def mk_path(file):
+        if args.build_log:
+            # <file.v>.dump lives at <build.log>#<file.v>
+            if file.endswith(".dump"):
+                file = file[:-len(".dump")]
+            return "{}#{}".format(args.build_log, file)
+        else:
+            return op.join(args.path, file)
+
     if args.mode == "file":
-        file = op.join(args.path, args.file)
+        file = mk_path(args.file)
         if args.lemma:
             vis.visualize_lemma(file, args.lemma)
         else:
@@ -160,7 +208,7 @@ if __name__ == "__main__":
         with open(args.file, 'r') as h_files:
             files = []
             for file in h_files:
-                files += [op.join(args.path, file.strip())]
+                files += [mk_path(file.strip())]
 
             for file in files:
                 vis.visualize_file(file)
@@ -3,7 +3,7 @@ import json
 import os.path as op
 
 
-from lib.myfile import MyFile
+from lib.myfile import MMapFile
 
 
 def create_lemma(f_out, hdr, body):
@@ -29,7 +29,7 @@ def create_lemma(f_out, hdr, body):
 def parse_file(inpath, filename, outpath):
     in_filename = op.join(inpath, filename)
     print("PARSING: {}".format(in_filename))
-    f = MyFile(in_filename)
+    f = MMapFile(in_filename)
 
     out_filename = op.join(outpath, filename)
     out = open("{}.parse".format(out_filename), 'w')